@@ -4,7 +4,39 @@ The analytics module: Gathers, evaluates and displays the analytical data.
 Module is called when the user chooses "Show Habits (All or Sort by Periodicity)" or "Analytics".
 """
 
-from db import connect_database
+import itertools
+
+import profiling
+import records
+import shards
+import timestamps
+from db import get_connection
+
+# Default number of log entries per page of iter_habit_log()
+LOG_PAGE_SIZE = 20
+
+# Bounds of SQLite integers, used as open ends of time ranges
+_MIN_TIME, _MAX_TIME = -2 ** 63, 2 ** 63 - 1
+
+
+def iter_habits(db, periodicity=None):
+    """
+    Reads the habits stored in habit_tracker lazily, one HabitRecord at a time.
+
+    Rows are fetched from the cursor as the generator is advanced, so listing many habits does
+    not hold them all in memory at once.
+
+    :param db: To maintain connection with the database
+    :param periodicity: Only read habits of this periodicity (default None reads every habit)
+    :return: Yields HabitRecords
+    """
+    cur = db.cursor()
+    cur.row_factory = records.habit_rows
+    if periodicity is None:
+        cur.execute("SELECT * FROM habit_tracker")
+    else:
+        cur.execute("SELECT * FROM habit_tracker WHERE periodicity = ?", (periodicity,))
+    yield from cur
 
 
 def data_of_all_habits(db) -> list:
@@ -12,12 +44,9 @@ def data_of_all_habits(db) -> list:
     Gets the list of all habits stored in habit_tracker database.
 
     :param db: To maintain connection with the database.
-    :return: list of all habits
+    :return: list of all habits, as HabitRecords
     """
-    cur = db.cursor()
-    cur.execute("SELECT * FROM habit_tracker")
-    records = cur.fetchall()
-    return records
+    return list(iter_habits(db))
 
 
 def data_of_custom_periodicity_habits(db, periodicity) -> list:
@@ -26,13 +55,9 @@ def data_of_custom_periodicity_habits(db, periodicity) -> list:
 
     :param db: To maintain connection with the database
     :param periodicity: To get list of specified periodicity habits
-    :return: list of all specified periodicity habits
+    :return: list of all specified periodicity habits, as HabitRecords
     """
-    cur = db.cursor()
-    query = "SELECT * FROM habit_tracker WHERE periodicity = ?"
-    cur.execute(query, (periodicity,))
-    records = cur.fetchall()
-    return records
+    return list(iter_habits(db, periodicity))
 
 
 def data_of_single_habit(db, habit_name) -> list:
@@ -41,47 +66,190 @@ def data_of_single_habit(db, habit_name) -> list:
 
     :param db: To maintain connection with the database
     :param habit_name: Habit name to gather data of
-    :return: Data of specified habit
+    :return: Data of specified habit, as a list of (at most one) HabitRecord
     """
     cur = db.cursor()
+    cur.row_factory = records.habit_rows
     query = "SELECT * FROM habit_tracker WHERE habit = ?"
     cur.execute(query, (habit_name,))
-    record = cur.fetchall()
-    return record
+    return cur.fetchall()
 
 
 def longest_habit_streak(db, habit_name) -> int:
     """
-    Gets and returns the longest habit streak ever achieved from the habit_log database.
+    Gets and returns the longest habit streak ever achieved from the habit_stats table.
 
     :param db: To maintain connection with the database
     :param habit_name: Habit name to gather data of
-    :return: longest streak of specified habit
+    :return: longest streak of specified habit (0 if it was never completed)
     """
     cur = db.cursor()
-    query = "SELECT MAX(streak) FROM habit_log WHERE habit = ?"
+    query = "SELECT longest_streak FROM habit_stats WHERE habit = ?"
     cur.execute(query, (habit_name,))
     data = cur.fetchone()
-    return data[0]
+    return data[0] if data is not None else 0
+
+
+def iter_habit_streaks(db, habit_name=None):
+    """
+    Reads the streak data of all habits, or of a single habit, lazily in one indexed read.
+
+    :param db: To maintain connection with the database
+    :param habit_name: Habit name to gather data of (default None for all habits)
+    :return: Yields StreakRecords
+    """
+    cur = db.cursor()
+    cur.row_factory = records.streak_rows
+    if habit_name is None:
+        query = """
+            SELECT habit_tracker.habit, periodicity, completion_time, streak,
+                   COALESCE(longest_streak, 0) AS longest_streak, COALESCE(completion_count, 0) AS completion_count,
+                   completed_period
+            FROM habit_tracker LEFT JOIN habit_stats ON habit_stats.habit = habit_tracker.habit"""
+        cur.execute(query)
+    else:
+        query = """
+            SELECT habit_tracker.habit, periodicity, completion_time, streak,
+                   COALESCE(longest_streak, 0) AS longest_streak, COALESCE(completion_count, 0) AS completion_count,
+                   completed_period
+            FROM habit_tracker LEFT JOIN habit_stats ON habit_stats.habit = habit_tracker.habit
+            WHERE habit_tracker.habit = ?"""
+        cur.execute(query, (habit_name,))
+    yield from cur
+
+
+def habit_streak_overview(db, habit_name=None) -> list:
+    """
+    Gets the streak data of all habits, or of a single habit, in one indexed read.
+
+    Each StreakRecord holds: habit, periodicity, completion_time, current streak, longest streak,
+    completion count and the period number of the last completion (compare it with
+    timestamps.period_ordinal(periodicity, timestamps.now()) to tell whether the habit
+    is done for the current period).
+
+    :param db: To maintain connection with the database
+    :param habit_name: Habit name to gather data of (default None for all habits)
+    :return: list of StreakRecords
+    """
+    return list(iter_habit_streaks(db, habit_name))
 
 
 def habit_log(db, habit_name) -> list:
     """
     Fetches specified habit data from the habit_log database and then returns it.
 
+    Loads the whole log at once; use iter_habit_log() to read long logs page by page.
+
     :param db: To maintain connection with the database
     :param habit_name: Habit name to gather data of
-    :return: The data of specified habit name
+    :return: The data of specified habit name, as LogEntries
     """
+    return [row for page in iter_habit_log(db, habit_name) for row in page]
+
+
+def iter_habit_log(db, habit_name, page_size=LOG_PAGE_SIZE, start=None, end=None, newest_first=False):
+    """
+    Reads the log of the specified habit lazily, one page at a time.
+
+    Pages are fetched with keyset pagination on (completion_time, rowid): every page continues
+    after the last entry of the previous one through the (habit, completion_time) index, so the
+    cost of a page depends on the page size and not on the length of the log. A page is only
+    queried when the generator is advanced.
+
+    :param db: To maintain connection with the database
+    :param habit_name: Habit name to gather data of
+    :param page_size: Maximum number of log entries per page
+    :param start: Earliest completion time to include, timestamp (default None for no lower bound)
+    :param end: Completion time to stop before, timestamp (default None for no upper bound)
+    :param newest_first: Whether to read from the most recent entry backwards (default False)
+    :return: Yields lists of LogEntries
+    """
+    start = _MIN_TIME if start is None else start
+    end = _MAX_TIME if end is None else end
+    # Keyset of the last entry read; rowids are positive, so -1 sorts before every entry at that time
+    key = (end, -1) if newest_first else (start, -1)
     cur = db.cursor()
-    query = "SELECT * FROM habit_log WHERE habit = ?"
-    cur.execute(query, (habit_name,))
-    record = cur.fetchall()
+    while True:
+        if newest_first:
+            query = """
+                SELECT rowid, habit, completed, streak, completion_time FROM habit_log
+                WHERE habit = ? AND completion_time >= ? AND (completion_time, rowid) < (?, ?)
+                ORDER BY completion_time DESC, rowid DESC LIMIT ?"""
+            cur.execute(query, (habit_name, start, *key, page_size))
+        else:
+            query = """
+                SELECT rowid, habit, completed, streak, completion_time FROM habit_log
+                WHERE habit = ? AND completion_time < ? AND (completion_time, rowid) > (?, ?)
+                ORDER BY completion_time, rowid LIMIT ?"""
+            cur.execute(query, (habit_name, end, *key, page_size))
+        rows = cur.fetchall()
+        if rows:
+            yield [records.LogEntry(*row[1:]) for row in rows]
+        if len(rows) < page_size:
+            return
+        key = (rows[-1][4], rows[-1][0])
+
+
+def habit_log_between(db, habit_name, start, end=None) -> list:
+    """
+    Fetches the log entries of the specified habit within a time range, oldest first.
+
+    The range is answered from the (habit, completion_time) index; e.g., the completions of the
+    last 30 days are habit_log_between(db, habit_name, timestamps.days_ago(30)).
+
+    :param db: To maintain connection with the database
+    :param habit_name: Habit name to gather data of
+    :param start: Earliest completion time to include, timestamp
+    :param end: Completion time to stop before, timestamp (default None for no upper bound)
+    :return: The log entries of the specified habit within the range, as LogEntries
+    """
+    cur = db.cursor()
+    cur.row_factory = records.log_rows
+    if end is None:
+        query = "SELECT * FROM habit_log WHERE habit = ? AND completion_time >= ? ORDER BY completion_time"
+        cur.execute(query, (habit_name, start))
+    else:
+        query = ("SELECT * FROM habit_log WHERE habit = ? AND completion_time >= ? AND completion_time < ? "
+                 "ORDER BY completion_time")
+        cur.execute(query, (habit_name, start, end))
+    return cur.fetchall()
+
+
+def habit_dict(row) -> dict:
+    """
+    Converts a habit (e.g., of data_of_all_habits()) to a dict, e.g. for JSON output.
+
+    :param row: HabitRecord, or a tuple in HabitRecord field order
+    :return: Dict keyed by field name
+    """
+    return records.HabitRecord(*row).as_dict()
+
+
+def streak_dict(row) -> dict:
+    """
+    Converts the streak data of a habit (see habit_streak_overview()) to a dict.
+
+    :param row: StreakRecord, or a tuple in StreakRecord field order
+    :return: Dict with habit, periodicity, completion_time, streak, longest_streak and completion_count
+    """
+    record = records.StreakRecord(*row).as_dict()
+    del record["completed_period"]
     return record
 
 
+def log_dict(row) -> dict:
+    """
+    Converts a log entry to a dict.
+
+    :param row: LogEntry, or a (habit, completed, streak, completion_time) tuple
+    :return: Dict keyed by field name, with completed as a bool
+    """
+    return records.LogEntry(*row).as_dict()
+
+
 # Table to show periodicity wise habit's data without streak
-def show_habits_data(periodicity=None):
+@profiling.operation("analytics.show_habits_data")
+def show_habits_data(periodicity=None, database="main.db", user=None):
     """
     Shows the all the habit data (without streak) in a readable tabular format.
 
@@ -93,22 +261,22 @@ def show_habits_data(periodicity=None):
 
     :param periodicity: Specific Periodicity to display data of (e.g, daily, weekly, or monthly), leaving empty will
     display all the habits' data (default None)
+    :param database: Database to read from (default main.db)
+    :param user: User whose habits to display, read from the user's own database (default None)
     """
-    db = connect_database()
-    if periodicity is not None:
-        data = data_of_custom_periodicity_habits(db, periodicity)
-    else:
-        data = data_of_all_habits(db)
-    if len(data) > 0:
+    db = get_connection(shards.database_for(user, database))
+    data = iter_habits(db, periodicity)  # read lazily, row by row
+    first = next(data, None)
+    if first is not None:
         # Uses string formatting to set columns and rows for the table
         print("\n{:<10} {:<15} {:<10} {:<15}".format("Name", "Periodicity", "Category", "Date/Time"))
         print("-------------------------------------------------------")
-        for row in data:
+        for record in itertools.chain([first], data):
             print("{:<10} {:<15} {:<10} {:<15}".format(
-                row[0].capitalize(),  # Name
-                row[1].capitalize(),  # Periodicity
-                row[2].capitalize(),  # Streak
-                row[3].capitalize()))  # Completion TIme
+                record.habit.capitalize(),
+                record.periodicity.capitalize(),
+                record.category.capitalize(),
+                timestamps.to_text(record.creation_time)))
         print("-------------------------------------------------------\n")
 
     else:
@@ -116,59 +284,72 @@ def show_habits_data(periodicity=None):
 
 
 # Table to show habit's streak along with other columns
-def show_habit_streak_data(habit=None):
+@profiling.operation("analytics.show_habit_streak_data")
+def show_habit_streak_data(habit=None, database="main.db", user=None):
     """
     Shows all or specific habit streak data in a readable tabular format.
 
     The table is formatted using string formatting technique and consists of the following columns:
-    Name, Periodicity, Completion Time and Current Streak -OR- Longest Streak.
-    The habit data from database is retrieved and looped throughout to display the rows.
-    If no habit name is provided then all the habits' data and their 'current streak' will be displayed
-    else specified habit name data will be displayed along with its 'longest streak'.
+    Name, Periodicity, Completion Time, Current Streak and Longest Streak.
+    The habit data and its statistics are retrieved with a single query and looped throughout to display the rows.
+    If no habit name is provided then all the habits' data will be displayed
+    else specified habit name data will be displayed only.
 
     :param habit: Name of the habit to display data of, leaving empty will display every habits' data (default None)
+    :param database: Database to read from (default main.db)
+    :param user: User whose habits to display, read from the user's own database (default None)
     """
 
-    db = connect_database()
-    if habit is None:
-        data = data_of_all_habits(db)
-    else:
-        data = data_of_single_habit(db, habit)
-    if len(data) > 0:
+    db = get_connection(shards.database_for(user, database))
+    data = iter_habit_streaks(db, habit)  # read lazily, row by row
+    first = next(data, None)
+    if first is not None:
         # Uses string formatting to set columns and rows for the table
-        print("\n{:<10} {:^15} {:>10} {:>10}".format("Name |", "Periodicity |", "Completion Time |",
-                                                     "Current Streak" if habit is None else "Longest Streak"))
-        print(f"{'_' * 70}")  # Print dashes - 70 times to pretty format the table
-        for row in data:
-            period = " Day(s)" if row[1] == "daily" else (" Week(s)" if row[1] == "weekly" else " Month(s)")
-            print("{:<10} {:^15} {:>10} {:^15}".format(
-                row[0].capitalize(),  # Name
-                row[1].capitalize(),  # Periodicity
-                row[5] if row[5] is not None else "--/--/-- --:--",  # Completion Time
-                str(row[4]) + period if habit is None else str(longest_habit_streak(db, habit)) + period))  # Current or Longest Streak
-            print(f"{'_' * 70}\n")
+        print("\n{:<10} {:^15} {:>10} {:>10} {:>10}".format("Name |", "Periodicity |", "Completion Time |",
+                                                            "Current Streak |", "Longest Streak"))
+        print(f"{'_' * 85}")  # Print dashes - 85 times to pretty format the table
+        for record in itertools.chain([first], data):
+            period = {"daily": " Day(s)", "weekly": " Week(s)"}.get(record.periodicity, " Month(s)")
+            print("{:<10} {:^15} {:>10} {:^15} {:^15}".format(
+                record.habit.capitalize(),
+                record.periodicity.capitalize(),
+                timestamps.to_text(record.completion_time) if record.completion_time is not None
+                else "--/--/-- --:--",
+                str(record.streak) + period,
+                str(record.longest_streak) + period))
+            print(f"{'_' * 85}\n")
     else:
         print("\nNo Habit Found; Please Add a Habit First!\n")
 
 
 # Displays habits log
-def show_habit_logged_data(name_of_habit):
+@profiling.operation("analytics.show_habit_logged_data")
+def show_habit_logged_data(name_of_habit, show_more=None, page_size=LOG_PAGE_SIZE, database="main.db", user=None):
     """
-        Shows the log of specified habit.
+        Shows the log of specified habit, most recent entries first.
 
         The custom table like format consists of "Habit Name", "Completed", "Streak" and "Logged at" columns.
-        The habit data from database is retrieved and looped throughout to display it.
+        The log is read page by page with iter_habit_log(); after every full page show_more() is asked
+        whether to continue, so older entries are only loaded when they are actually wanted.
 
         :param name_of_habit: Name of the habit to display log of
+        :param show_more: Function returning True to show the next page (default None shows every page)
+        :param page_size: Number of log entries per page
+        :param database: Database to read from (default main.db)
+        :param user: User whose habit log to display, read from the user's own database (default None)
         """
-    db = connect_database()
-    data = habit_log(db, name_of_habit)
+    db = get_connection(shards.database_for(user, database))
+    pages = iter_habit_log(db, name_of_habit, page_size, newest_first=True)
     print(f"\n{'-' * 75}")  # Print dashes - 75 times to pretty format the table
-    if len(data) > 0:
-        for row in data:
-            print(f"Habit: {row[0].capitalize()} | "
-                  f"Completed : {'True' if row[1] == 1 else 'False'} | "
-                  f"Streak: {row[2]} | Logged at: {row[3]}")
-    else:
+    shown = 0
+    for page in pages:
+        for entry in page:
+            print(f"Habit: {entry.habit.capitalize()} | "
+                  f"Completed : {'True' if entry.completed == 1 else 'False'} | "
+                  f"Streak: {entry.streak} | Logged at: {timestamps.to_text(entry.completion_time)}")
+        shown += len(page)
+        if len(page) == page_size and show_more is not None and not show_more():
+            break
+    if shown == 0:
         print("No record found!")
     print(f"{'-' * 75}\n")
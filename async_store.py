@@ -0,0 +1,192 @@
+"""
+The async_store module: An asyncio interface to the habit tracker for services.
+
+AsyncHabitStore exposes the operations of the habit and analytics modules as coroutines that
+return data instead of printing it. The blocking SQLite work runs on a bounded thread pool in
+which every worker thread keeps a connection of its own, so concurrent requests overlap while
+the event loop stays free. Connections run in concurrency mode (see db.set_concurrent_mode()),
+so the workers' writes queue up on the database lock instead of failing.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import analytics
+import db
+import habit
+import shards
+import timestamps
+
+# Default number of worker threads, and thereby connections, per store
+WORKERS = 4
+
+
+class AsyncHabitStore:
+    """
+    Coroutine-based access to one habit database.
+
+    Use it as an async context manager, or call close() when done::
+
+        async with AsyncHabitStore(user="alice") as store:
+            await store.add("reading", "daily", "knowledge")
+            result = await store.complete("reading")
+    """
+
+    def __init__(self, database="main.db", user=None, workers=WORKERS):
+        """
+        :param database: Database to use (default main.db)
+        :param user: User whose own database to use instead, see the shards module (default None)
+        :param workers: Maximum number of worker threads and connections (default WORKERS)
+        """
+        self.database = shards.database_for(user, database)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="habit-store")
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _connection(self):
+        """
+        Returns the calling worker thread's connection, opening it on first use.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = db.connect_database(self.database, check_same_thread=False, concurrent=True)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _call(self, func, args):
+        return func(self._connection(), *args)
+
+    async def run(self, func, *args):
+        """
+        Runs func(connection, *args) on a worker thread.
+
+        :param func: Function taking a connection as its first argument, e.g. one of the db module
+        :param args: Further arguments for the function
+        :return: Returns the result of the function
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self._call, func, args))
+
+    async def add(self, name, periodicity, category, time=None) -> bool:
+        """
+        Adds a new habit.
+
+        :param name: Name of the habit
+        :param periodicity: Periodicity of the habit (e.g., daily, weekly, or monthly)
+        :param category: Category of the habit
+        :param time: Creation time, timestamp (default is now)
+        :return: Returns True if the habit was added, False if it already exists
+        """
+        return await self.run(habit.add_habit, name, periodicity, category,
+                              timestamps.now() if time is None else time)
+
+    async def remove(self, name) -> bool:
+        """
+        Removes a habit together with its log.
+
+        :param name: Name of the habit
+        :return: Returns True if the habit existed else returns False
+        """
+        return await self.run(habit.remove_habit, name)
+
+    async def change_periodicity(self, name, periodicity, time=None) -> bool:
+        """
+        Changes the periodicity of a habit, resetting its streak.
+
+        :param name: Name of the habit
+        :param periodicity: New periodicity of the habit
+        :param time: Time of the change, timestamp (default is now)
+        :return: Returns True if the habit exists else returns False
+        """
+        return await self.run(habit.change_periodicity, name, periodicity,
+                              timestamps.now() if time is None else time)
+
+    async def complete(self, name, time=None) -> dict:
+        """
+        Marks a habit as completed.
+
+        :param name: Name of the habit
+        :param time: Time of the completion, timestamp (default is now)
+        :return: Dict with habit, periodicity, outcome (see the habit module) and streak
+        """
+        periodicity, outcome, streak = await self.run(habit.complete_habit, name,
+                                                      timestamps.now() if time is None else time)
+        return {"habit": name, "periodicity": periodicity, "outcome": outcome, "streak": streak}
+
+    async def complete_many(self, completions) -> list:
+        """
+        Marks many habits as completed in one transaction.
+
+        :param completions: Iterable of (habit name, timestamp) pairs
+        :return: List of dicts with habit, outcome and streak, in the order of the completions
+        """
+        results = await self.run(habit.mark_completed_many, list(completions))
+        return [{"habit": name, "outcome": outcome, "streak": streak} for name, outcome, streak in results]
+
+    async def habits(self, periodicity=None) -> list:
+        """
+        Lists the habits, optionally only those of one periodicity.
+
+        :param periodicity: Periodicity to filter by (default None lists every habit)
+        :return: List of habit dicts
+        """
+        if periodicity is None:
+            rows = await self.run(analytics.data_of_all_habits)
+        else:
+            rows = await self.run(analytics.data_of_custom_periodicity_habits, periodicity)
+        return [analytics.habit_dict(row) for row in rows]
+
+    async def streaks(self, name=None) -> list:
+        """
+        Returns the current and longest streaks of every habit or of one habit.
+
+        :param name: Name of the habit (default None returns every habit)
+        :return: List of streak dicts
+        """
+        return [analytics.streak_dict(row) for row in await self.run(analytics.habit_streak_overview, name)]
+
+    async def longest_streak(self, name) -> int:
+        """
+        Returns the longest streak a habit has ever reached.
+
+        :param name: Name of the habit
+        :return: Returns the longest streak, 0 if the habit was never completed
+        """
+        return await self.run(analytics.longest_habit_streak, name)
+
+    async def log(self, name, start=None, end=None) -> list:
+        """
+        Returns the log of a habit, oldest entries first.
+
+        :param name: Name of the habit
+        :param start: Earliest completion time to include, timestamp (default None means no bound)
+        :param end: Completion time to stop before, timestamp (default None means no bound)
+        :return: List of log entry dicts
+        """
+        rows = await self.run(_log_rows, name, start, end)
+        return [analytics.log_dict(row) for row in rows]
+
+    async def close(self):
+        """
+        Waits for running work to finish, then closes the worker connections.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, partial(self._executor.shutdown, wait=True))
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+
+def _log_rows(conn, name, start, end):
+    return [row for page in analytics.iter_habit_log(conn, name, start=start, end=end) for row in page]
@@ -0,0 +1,357 @@
+"""
+The benchmark module: Generates large synthetic databases and times the database functions on them.
+
+    python benchmark.py generate bench.db --habits 10000 --years 3
+    python benchmark.py run bench.db --output results.json --baseline baseline.json
+    python benchmark.py run bench.db --save-baseline baseline.json
+
+generate_database() fills a database with habits spread over categories and periodicities and
+with years of habit_log history, written in chunks through the bulk helpers of the db module.
+run_benchmarks() times the public query and write functions of db and analytics, the show_*
+tables and Habit.mark_as_completed on such a database. Writes are rolled back after every run,
+so the database stays unchanged and runs are repeatable. Results are saved as JSON and can be
+compared with a stored baseline to spot performance regressions.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import analytics
+import db
+import reports
+import timestamps
+from habit import Habit
+from transfer import chunked
+
+# Default size of generated databases
+HABITS = 1000
+CATEGORIES = 20
+YEARS = 1
+COMPLETION_RATE = 0.8
+
+# Timed runs per benchmark, and the slowdown of the median that counts as a regression
+REPEAT = 5
+THRESHOLD = 0.2
+
+# Slowdowns smaller than this many milliseconds are timer noise, never regressions
+MIN_DELTA_MS = 0.05
+
+
+def _period_buckets(times):
+    """
+    Groups the times of consecutive days into the days, weeks and months they belong to, numbered
+    as timestamps.period_ordinals() numbers the stored rows.
+
+    :param times: List of timestamps, one per consecutive day
+    :return: Dict mapping periodicity to a list of lists of day indexes, one list per period
+    """
+    ordinals = [timestamps.period_ordinals(time) for time in times]
+    buckets = {}
+    for position, periodicity in enumerate(timestamps.PERIODICITIES):
+        buckets[periodicity] = groups = []
+        previous = None
+        for index, key in enumerate(ordinals):
+            if key[position] != previous:
+                groups.append([])
+                previous = key[position]
+            groups[-1].append(index)
+    return buckets
+
+
+def generate_database(path, habits=HABITS, categories=CATEGORIES, years=YEARS, completion_rate=COMPLETION_RATE,
+                      end=None, seed=0, chunk_size=10000) -> dict:
+    """
+    Fills a database with synthetic habits and their log history.
+
+    Every habit is completed in a period with probability completion_rate, at a random time of a
+    random day of the period. Streaks are continued or reset the same way the habit module does,
+    so the stored streaks, logs and statistics are consistent with each other.
+
+    :param path: Database to fill (should be new or empty)
+    :param habits: Number of habits (default HABITS)
+    :param categories: Number of categories the habits are spread over (default CATEGORIES)
+    :param years: Years of history per habit (default YEARS)
+    :param completion_rate: Probability of a completion per period (default COMPLETION_RATE)
+    :param end: Last day of the history (default yesterday)
+    :param seed: Seed of the random generator, for reproducible databases (default 0)
+    :param chunk_size: Number of log rows written per executemany (default 10000)
+    :return: Dict with the number of habits and log_rows written
+    """
+    rng = random.Random(seed)
+    end = end or date.today() - timedelta(days=1)
+    days = [end - timedelta(days=offset) for offset in range(int(years * 365) - 1, -1, -1)]
+    midnights = [int(datetime(day.year, day.month, day.day).timestamp()) for day in days]
+    buckets = _period_buckets(midnights)
+    creation_time = midnights[0] - 3600
+    width = len(str(habits))
+
+    habit_rows = []
+    for number in range(habits):
+        periodicity = timestamps.PERIODICITIES[number % 3]
+        habit_rows.append([f"habit{number:0{width}d}", periodicity, f"category{number % categories:02d}",
+                           creation_time, 0, None])
+
+    def log_rows():
+        for habit_row in habit_rows:
+            name = habit_row[0]
+            yield name, False, 0, creation_time
+            streak, last_period = 0, None
+            for period, bucket in enumerate(buckets[habit_row[1]]):
+                if rng.random() >= completion_rate:
+                    continue
+                time = midnights[rng.choice(bucket)] + rng.randrange(6 * 3600, 22 * 3600)
+                continued = streak == 0 or period == last_period + 1
+                streak = streak + 1 if continued else 1
+                last_period = period
+                yield name, continued, streak, time
+            habit_row[4], habit_row[5] = streak, time if streak else None
+
+    conn = db.connect_database(path)
+    conn.execute("PRAGMA synchronous = OFF")  # generated data is disposable
+    count = 0
+    try:
+        with db.transaction(conn):
+            db.add_habits_many(conn, [tuple(row) for row in habit_rows])
+            for chunk in chunked(log_rows(), chunk_size):
+                db.update_logs_many(conn, chunk)
+                count += len(chunk)
+            # The streaks are only known once the history has been generated
+            db.update_habit_streaks_many(conn, [(row[4], row[5], row[0]) for row in habit_rows if row[4]])
+    finally:
+        conn.close()
+    return {"habits": habits, "log_rows": count}
+
+
+def _sample(conn):
+    """
+    Picks the habits, category and times the benchmarks work with.
+    """
+    name, category, completion_time = conn.execute(
+        "SELECT habit, category, completion_time FROM habit_tracker WHERE periodicity = 'daily' "
+        "ORDER BY habit LIMIT 1").fetchone()
+    names = [row[0] for row in conn.execute("SELECT habit FROM habit_tracker ORDER BY habit LIMIT 100")]
+    state = db.fetch_habit_state(conn, name)
+    latest = completion_time or timestamps.now()
+    return {"habit": name, "category": category, "names": names, "state": state,
+            "time": latest, "next_time": latest + 86400, "month_ago": latest - 30 * 86400}
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _rolled_back(operation):
+    """
+    Wraps a writing benchmark so that every run is undone afterwards.
+    """
+    def run(conn, sample):
+        try:
+            with db.transaction(conn):
+                operation(conn, sample)
+                raise _Rollback
+        except _Rollback:
+            pass
+    return run
+
+
+def _quiet(operation):
+    """
+    Wraps a benchmark that prints, discarding its output.
+    """
+    def run(conn, sample):
+        with contextlib.redirect_stdout(io.StringIO()):
+            operation(conn, sample)
+    return run
+
+
+def _new_habits(sample, count):
+    return [(f"benchmark{number}", "daily", "benchmark", sample["time"], 0, None) for number in range(count)]
+
+
+# Benchmark name -> function of (connection, sample)
+BENCHMARKS = {
+    "db.habit_exists": lambda c, s: db.habit_exists(c, s["habit"]),
+    "db.fetch_categories": lambda c, s: db.fetch_categories(c),
+    "db.fetch_habits_as_choices": lambda c, s: db.fetch_habits_as_choices(c),
+    "db.get_streak_count": lambda c, s: db.get_streak_count(c, s["habit"]),
+    "db.get_habit_completion_time": lambda c, s: db.get_habit_completion_time(c, s["habit"]),
+    "db.fetch_habit_periodicity": lambda c, s: db.fetch_habit_periodicity(c, s["habit"]),
+    "db.fetch_habit_state": lambda c, s: db.fetch_habit_state(c, s["habit"]),
+    "db.fetch_habit_states": lambda c, s: db.fetch_habit_states(c, s["names"]),
+    "db.habit_completed_in_period": lambda c, s: db.habit_completed_in_period(c, s["habit"], s["time"]),
+    "db.add_habit": _rolled_back(lambda c, s: db.add_habit(c, *_new_habits(s, 1)[0])),
+    "db.add_habits_many": _rolled_back(lambda c, s: db.add_habits_many(c, _new_habits(s, 100))),
+    "db.update_log": _rolled_back(lambda c, s: db.update_log(c, s["habit"], True, 1, s["next_time"])),
+    "db.update_logs_many": _rolled_back(lambda c, s: db.update_logs_many(
+        c, [(name, True, 1, s["next_time"]) for name in s["names"]])),
+    "db.update_habit_streak": _rolled_back(lambda c, s: db.update_habit_streak(c, s["habit"], 1, s["next_time"])),
+    "db.set_habit_streak_if_unchanged": _rolled_back(lambda c, s: db.set_habit_streak_if_unchanged(
+        c, s["habit"], s["state"][1] + 1, s["next_time"], s["state"][1], s["state"][2])),
+    "db.update_habit_streaks_many": _rolled_back(lambda c, s: db.update_habit_streaks_many(
+        c, [(1, s["next_time"], name) for name in s["names"]])),
+    "db.update_periodicity": _rolled_back(lambda c, s: db.update_periodicity(c, s["habit"], "weekly")),
+    "db.reset_logs": _rolled_back(lambda c, s: db.reset_logs(c, s["habit"])),
+    "db.remove_habit": _rolled_back(lambda c, s: db.remove_habit(c, s["habit"])),
+    "db.delete_category": _rolled_back(lambda c, s: db.delete_category(c, s["category"])),
+    "analytics.data_of_all_habits": lambda c, s: analytics.data_of_all_habits(c),
+    "analytics.data_of_custom_periodicity_habits": lambda c, s: analytics.data_of_custom_periodicity_habits(
+        c, "weekly"),
+    "analytics.data_of_single_habit": lambda c, s: analytics.data_of_single_habit(c, s["habit"]),
+    "analytics.longest_habit_streak": lambda c, s: analytics.longest_habit_streak(c, s["habit"]),
+    "analytics.habit_streak_overview": lambda c, s: analytics.habit_streak_overview(c),
+    "analytics.habit_streak_overview(habit)": lambda c, s: analytics.habit_streak_overview(c, s["habit"]),
+    "analytics.habit_log": lambda c, s: analytics.habit_log(c, s["habit"]),
+    "analytics.iter_habit_log(first page)": lambda c, s: next(analytics.iter_habit_log(
+        c, s["habit"], newest_first=True), None),
+    "analytics.habit_log_between": lambda c, s: analytics.habit_log_between(c, s["habit"], s["month_ago"]),
+    "analytics.show_habits_data": _quiet(lambda c, s: analytics.show_habits_data(database=c.path)),
+    "analytics.show_habit_streak_data": _quiet(lambda c, s: analytics.show_habit_streak_data(database=c.path)),
+    "analytics.show_habit_logged_data": _quiet(lambda c, s: analytics.show_habit_logged_data(
+        s["habit"], lambda: False, database=c.path)),
+    "reports.completion_series(category)": lambda c, s: reports.completion_series(
+        c, "weekly", s["month_ago"], s["time"], category=s["category"]),
+    "reports.completion_series(habit)": lambda c, s: reports.completion_series(c, "daily", habit=s["habit"]),
+    "Habit.mark_as_completed": _rolled_back(_quiet(lambda c, s: _mark_as_completed(c, s))),
+}
+
+
+def _mark_as_completed(conn, sample):
+    habit = Habit(sample["habit"], database=conn.path)
+    habit.current_time = sample["next_time"]
+    habit.mark_as_completed()
+
+
+def run_benchmarks(path, repeat=REPEAT, names=None) -> dict:
+    """
+    Times the benchmarks on a database.
+
+    Every benchmark is run once to warm up and then repeat times. The benchmarks use the shared
+    connection of get_connection(), the one the Habit and show_* functions borrow too.
+
+    :param path: Database to benchmark, e.g. from generate_database()
+    :param repeat: Number of timed runs per benchmark (default REPEAT)
+    :param names: Names of the benchmarks to run (default None runs all of BENCHMARKS)
+    :return: Dict with 'meta' (database size and environment) and 'results' mapping each
+        benchmark name to its min_ms, median_ms and runs
+    """
+    conn = db.get_connection(path)
+    sample = _sample(conn)
+    results = {}
+    for name in names or BENCHMARKS:
+        benchmark = BENCHMARKS[name]
+        benchmark(conn, sample)
+        durations = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            benchmark(conn, sample)
+            durations.append((time.perf_counter() - started) * 1000)
+        results[name] = {"min_ms": round(min(durations), 4), "median_ms": round(statistics.median(durations), 4),
+                         "runs": repeat}
+    meta = {
+        "habits": conn.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0],
+        "log_rows": conn.execute("SELECT COUNT(*) FROM habit_log").fetchone()[0],
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "time": timestamps.now(),
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare(results, baseline, threshold=THRESHOLD, min_delta_ms=MIN_DELTA_MS) -> list:
+    """
+    Finds the benchmarks whose median got slower than the baseline by more than threshold.
+
+    :param results: Results of run_benchmarks()
+    :param baseline: Earlier results of run_benchmarks()
+    :param threshold: Allowed slowdown as a fraction, e.g. 0.2 for 20% (default THRESHOLD)
+    :param min_delta_ms: Smallest slowdown in milliseconds that counts (default MIN_DELTA_MS)
+    :return: List of (name, baseline median ms, median ms, ratio) tuples, slowest first
+    """
+    regressions = []
+    for name, result in results["results"].items():
+        before = baseline["results"].get(name)
+        if before is None or before["median_ms"] <= 0:
+            continue
+        ratio = result["median_ms"] / before["median_ms"]
+        if ratio > 1 + threshold and result["median_ms"] - before["median_ms"] >= min_delta_ms:
+            regressions.append((name, before["median_ms"], result["median_ms"], round(ratio, 2)))
+    return sorted(regressions, key=lambda regression: -regression[3])
+
+
+def print_results(results, baseline=None):
+    """
+    Prints the results as a table, with the change against the baseline if one is given.
+    """
+    print(f"\n{'Benchmark':<45} {'Median ms':>10} {'Min ms':>10} {'Baseline':>10} {'Change':>8}")
+    print("-" * 87)
+    for name, result in results["results"].items():
+        before = (baseline or {"results": {}})["results"].get(name)
+        change = f"{result['median_ms'] / before['median_ms'] - 1:+.0%}" if before and before["median_ms"] else ""
+        print(f"{name:<45} {result['median_ms']:>10.3f} {result['min_ms']:>10.3f} "
+              f"{before['median_ms'] if before else '':>10} {change:>8}")
+    print(f"\n{results['meta']['habits']} habits, {results['meta']['log_rows']} log rows\n")
+
+
+def main(argv=None):
+    """
+    Command line interface, see the module docstring.
+
+    :return: Returns the exit status: 1 if a regression against the baseline was found else 0
+    """
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Habit Tracker benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("generate", help="build a synthetic database")
+    command.add_argument("database")
+    command.add_argument("--habits", type=int, default=HABITS)
+    command.add_argument("--categories", type=int, default=CATEGORIES)
+    command.add_argument("--years", type=float, default=YEARS)
+    command.add_argument("--completion-rate", type=float, default=COMPLETION_RATE)
+    command.add_argument("--seed", type=int, default=0)
+
+    command = commands.add_parser("run", help="time the benchmarks on a database")
+    command.add_argument("database")
+    command.add_argument("--repeat", type=int, default=REPEAT)
+    command.add_argument("--only", nargs="+", choices=BENCHMARKS, metavar="NAME", help="benchmarks to run")
+    command.add_argument("--output", help="write the results to this JSON file")
+    command.add_argument("--save-baseline", metavar="FILE", help="store the results as the new baseline")
+    command.add_argument("--baseline", metavar="FILE", help="compare the results with this baseline")
+    command.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown (default 0.2)")
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        started = time.perf_counter()
+        counts = generate_database(args.database, args.habits, args.categories, args.years,
+                                   args.completion_rate, seed=args.seed)
+        print(f"Generated {counts['habits']} habits and {counts['log_rows']} log rows "
+              f"in {time.perf_counter() - started:.1f}s.")
+        return 0
+
+    results = run_benchmarks(args.database, args.repeat, args.only)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"Regression: {name} {before:.3f} ms -> {after:.3f} ms ({ratio}x)")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
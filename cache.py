@@ -0,0 +1,71 @@
+"""
+The cache module: Remembers the habit and category choice lists until the database changes.
+
+Lookups are cached per database and tagged with db.change_count(), which the write helpers
+of the db module bump on every commit, and with the connection's PRAGMA data_version, which
+changes when another connection (possibly in another process) commits. As long as nothing has
+been written, repeated menu prompts are answered from memory with one PRAGMA read instead of
+a query.
+"""
+
+import threading
+import weakref
+
+from db import change_count, fetch_categories, fetch_habits_as_choices
+
+# (database path, lookup name) -> (weak reference to the loading connection, version when loaded, value)
+_entries = {}
+_lock = threading.Lock()
+
+
+def cached(db, name, loader):
+    """
+    Returns the cached result of loader(db), loading it again if the database has changed since.
+
+    :param db: Connection from db.connect_database() or db.get_connection()
+    :param name: Name of the lookup, unique per loader
+    :param loader: Function taking the connection and returning the value to cache
+    :return: Returns the (possibly cached) value
+    """
+    path = getattr(db, "path", None)
+    if path is None:
+        return loader(db)
+    # Read the version before loading: a write during the load leaves the entry stale, not wrong.
+    # data_version values are only comparable on the same connection, hence the connection check
+    version = change_count(path), db.execute("PRAGMA data_version").fetchone()[0]
+    with _lock:
+        entry = _entries.get((path, name))
+    if entry is not None and entry[0]() is db and entry[1] == version:
+        return entry[2]
+    value = loader(db)
+    with _lock:
+        _entries[(path, name)] = (weakref.ref(db), version, value)
+    return value
+
+
+def habits_as_choices(db):
+    """
+    Cached db.fetch_habits_as_choices().
+
+    :param db: To maintain connection with the database
+    :return: Returns the list of habit names, or None if there are no habits
+    """
+    return cached(db, "habits_as_choices", fetch_habits_as_choices)
+
+
+def categories(db):
+    """
+    Cached db.fetch_categories().
+
+    :param db: To maintain connection with the database
+    :return: Returns the list of category names
+    """
+    return cached(db, "categories", fetch_categories)
+
+
+def clear():
+    """
+    Drops every cached lookup.
+    """
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,356 @@
+"""
+The cli module: Non-interactive commands of the habit tracker.
+
+Commands are run as 'python main.py <command> ...'; running main.py without a command starts
+the interactive menu instead.
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+
+import analytics
+import db
+import habit
+import profiling
+import reports
+import retention
+import shards
+import timestamps
+import transfer
+
+
+def _open(path, mode):
+    """
+    Opens a file for transfer, where '-' stands for stdin or stdout.
+    """
+    if path == "-":
+        return open(sys.stdin.fileno() if "r" in mode else sys.stdout.fileno(), mode, newline="", closefd=False)
+    return open(path, mode, newline="", encoding="utf-8")
+
+
+def _connection(args):
+    """
+    Returns the shared connection to the database chosen with --database or --user.
+    """
+    return db.get_connection(shards.database_for(args.user, args.database))
+
+
+@profiling.operation("cli.export")
+def export_command(args):
+    """
+    Streams a table of the database to a CSV or JSONL file.
+    """
+    file_format = args.format or transfer.format_of(args.file)
+    with _open(args.file, "w") as file:
+        count = transfer.export_table(_connection(args), args.table, file,
+                                      file_format, args.chunk_size)
+    print(f"Exported {count} rows from {args.table}.", file=sys.stderr)
+
+
+@profiling.operation("cli.import")
+def import_command(args):
+    """
+    Streams a CSV or JSONL file into a table of the database; nothing is imported if a record is invalid.
+    """
+    file_format = args.format or transfer.format_of(args.file)
+    with _open(args.file, "r") as file:
+        try:
+            count = transfer.import_table(_connection(args), args.table, file,
+                                          file_format, args.chunk_size)
+        except (ValueError, sqlite3.IntegrityError) as error:
+            print(f"Nothing imported into {args.table}: {error}", file=sys.stderr)
+            return 1
+    print(f"Imported {count} rows into {args.table}.", file=sys.stderr)
+
+
+def _names(names):
+    """
+    Expands the habit names of a command, where '-' stands for one name per line of stdin.
+    """
+    for name in names:
+        if name == "-":
+            yield from (line.strip().lower() for line in sys.stdin if line.strip())
+        else:
+            yield name.lower()
+
+
+def _time(text):
+    """
+    argparse type for times, see timestamps.parse().
+    """
+    try:
+        return timestamps.parse(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time: {text!r}")
+
+
+def _horizon(text):
+    """
+    argparse type for retention horizons, in days.
+    """
+    days = int(text)
+    if days < retention.MIN_HORIZON_DAYS:
+        raise argparse.ArgumentTypeError(f"must be at least {retention.MIN_HORIZON_DAYS} days")
+    return days
+
+
+def _emit(records):
+    """
+    Writes records to stdout as JSON lines, one object per line.
+    """
+    sys.stdout.writelines(json.dumps(record) + "\n" for record in records)
+
+
+@profiling.operation("cli.add")
+def add_command(args):
+    """
+    Adds habits of one periodicity and category, in one transaction.
+    """
+    conn, time = _connection(args), timestamps.now() if args.time is None else args.time
+    with db.transaction(conn):
+        results = [{"habit": name, "added": habit.add_habit(conn, name, args.periodicity, args.category.lower(), time)}
+                   for name in _names(args.habits)]
+    _emit(results)
+    return 0 if all(result["added"] for result in results) else 1
+
+
+@profiling.operation("cli.complete")
+def complete_command(args):
+    """
+    Marks habits as completed, in one transaction.
+    """
+    time = timestamps.now() if args.time is None else args.time
+    results = habit.mark_completed_many(_connection(args), [(name, time) for name in _names(args.habits)])
+    _emit({"habit": name, "outcome": outcome, "streak": streak} for name, outcome, streak in results)
+    return 1 if any(outcome == habit.UNKNOWN_HABIT for _, outcome, _ in results) else 0
+
+
+@profiling.operation("cli.remove")
+def remove_command(args):
+    """
+    Removes habits together with their logs, in one transaction.
+    """
+    conn = _connection(args)
+    with db.transaction(conn):
+        results = [{"habit": name, "removed": habit.remove_habit(conn, name)} for name in _names(args.habits)]
+    _emit(results)
+    return 0 if all(result["removed"] for result in results) else 1
+
+
+@profiling.operation("cli.set-periodicity")
+def set_periodicity_command(args):
+    """
+    Changes the periodicity of habits, in one transaction.
+    """
+    conn, time = _connection(args), timestamps.now() if args.time is None else args.time
+    with db.transaction(conn):
+        results = [{"habit": name, "changed": habit.change_periodicity(conn, name, args.periodicity, time)}
+                   for name in _names(args.habits)]
+    _emit(results)
+    return 0 if all(result["changed"] for result in results) else 1
+
+
+@profiling.operation("cli.streaks")
+def streaks_command(args):
+    """
+    Prints the current and longest streaks of the given habits, or of every habit.
+    """
+    conn = _connection(args)
+    names = list(_names(args.habits))
+    if not names:
+        _emit(analytics.streak_dict(row) for row in analytics.habit_streak_overview(conn))
+        return 0
+    rows = [analytics.habit_streak_overview(conn, name) for name in names]
+    _emit(analytics.streak_dict(row[0]) for row in rows if row)
+    return 0 if all(rows) else 1
+
+
+@profiling.operation("cli.log")
+def log_command(args):
+    """
+    Prints the log entries of habits, oldest first, optionally limited to a time range.
+    """
+    conn = _connection(args)
+    for name in _names(args.habits):
+        for page in analytics.iter_habit_log(conn, name, start=args.since, end=args.until):
+            _emit(analytics.log_dict(row) for row in page)
+    return 0
+
+
+@profiling.operation("cli.report")
+def report_command(args):
+    """
+    Prints an aggregate report, one JSON line per habit, category or periodicity.
+    """
+    _emit(reports.REPORTS[args.report](_connection(args), args.since, args.until))
+    return 0
+
+
+@profiling.operation("cli.trend")
+def trend_command(args):
+    """
+    Prints the completions per day, week or month from the rollup tables.
+    """
+    _emit(reports.completion_series(_connection(args), args.bucket, args.since, args.until,
+                                    habit=args.habit and args.habit.lower(),
+                                    category=args.category and args.category.lower()))
+    return 0
+
+
+@profiling.operation("cli.rebuild-rollups")
+def rebuild_rollups_command(args):
+    """
+    Recomputes the rollup tables from the log, including its archived entries.
+    """
+    retention.rebuild_rollups(_connection(args))
+    return 0
+
+
+@profiling.operation("cli.archive")
+def archive_command(args):
+    """
+    Moves old log entries into the archive database and gives the freed space back.
+    """
+    _emit([retention.archive_logs(_connection(args), args.horizon_days, args.archive, args.batch_size,
+                                  args.max_batches, vacuum=not args.no_vacuum)])
+    return 0
+
+
+def serve_command(args):
+    """
+    Runs the HTTP/JSON service until interrupted.
+    """
+    import server
+    server.serve(shards.database_for(args.user, args.database), args.host, args.port,
+                 pool_size=args.pool_size, max_batch=args.max_batch, quiet=not args.verbose)
+
+
+def loadgen_command(args):
+    """
+    Sends load to a running service and prints latency percentiles and throughput as JSON.
+    """
+    import loadgen
+    print(json.dumps(loadgen.run_load(args.url, args.clients, args.requests, args.write_ratio, keep=args.keep)))
+
+
+def build_parser():
+    """
+    Builds the argument parser for every non-interactive command.
+
+    :return: Returns the argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(prog="main.py", description="Habit Tracker")
+    parser.add_argument("--database", default="main.db", help="database file to use (default main.db)")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the SQL statements of every operation on exit")
+    parser.add_argument("--user", help="use this user's own database in the shard directory instead")
+    parser.add_argument("--shard-dir", help=f"directory of the user databases (default {shards.SHARD_DIRECTORY})")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    for name, func, help_text in (("export", export_command, "stream a table out as CSV or JSONL"),
+                                  ("import", import_command, "stream CSV or JSONL rows into a table")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("table", choices=transfer.TABLES)
+        command.add_argument("file", help="CSV or JSONL file, '-' for stdin/stdout")
+        command.add_argument("--format", choices=transfer.FORMATS, help="file format (default from extension)")
+        command.add_argument("--chunk-size", type=int, default=transfer.CHUNK_SIZE, help="rows per batch")
+        command.set_defaults(func=func)
+
+    command = commands.add_parser("add", help="add habits")
+    command.add_argument("habits", nargs="+", metavar="habit", help="habit names, '-' reads names from stdin")
+    command.add_argument("--periodicity", required=True, choices=timestamps.PERIODICITIES)
+    command.add_argument("--category", required=True)
+    command.add_argument("--time", type=_time, help="creation time (default now)")
+    command.set_defaults(func=add_command)
+
+    command = commands.add_parser("complete", help="mark habits as completed")
+    command.add_argument("habits", nargs="+", metavar="habit", help="habit names, '-' reads names from stdin")
+    command.add_argument("--time", type=_time, help="completion time (default now)")
+    command.set_defaults(func=complete_command)
+
+    command = commands.add_parser("remove", help="remove habits and their logs")
+    command.add_argument("habits", nargs="+", metavar="habit", help="habit names, '-' reads names from stdin")
+    command.set_defaults(func=remove_command)
+
+    command = commands.add_parser("set-periodicity", help="change the periodicity of habits (resets streaks)")
+    command.add_argument("periodicity", choices=timestamps.PERIODICITIES)
+    command.add_argument("habits", nargs="+", metavar="habit", help="habit names, '-' reads names from stdin")
+    command.add_argument("--time", type=_time, help="time of the change (default now)")
+    command.set_defaults(func=set_periodicity_command)
+
+    command = commands.add_parser("streaks", help="print current and longest streaks")
+    command.add_argument("habits", nargs="*", metavar="habit", help="habit names (default every habit)")
+    command.set_defaults(func=streaks_command)
+
+    command = commands.add_parser("log", help="print the log of habits")
+    command.add_argument("habits", nargs="+", metavar="habit", help="habit names, '-' reads names from stdin")
+    command.add_argument("--since", type=_time, help="first completion time to include")
+    command.add_argument("--until", type=_time, help="completion time to stop before")
+    command.set_defaults(func=log_command)
+
+    command = commands.add_parser("report", help="print completion rates, streak and periodicity figures")
+    command.add_argument("report", choices=reports.REPORTS)
+    command.add_argument("--since", type=_time,
+                         help=f"first completion time to include (completion-rates: {reports.RATE_WINDOW_DAYS} days ago)")
+    command.add_argument("--until", type=_time, help="completion time to stop before")
+    command.set_defaults(func=report_command)
+
+    command = commands.add_parser("trend", help="print completions per day, week or month")
+    command.add_argument("bucket", choices=timestamps.PERIODICITIES)
+    command.add_argument("--habit", help="only count this habit")
+    command.add_argument("--category", help="only count the habits of this category")
+    command.add_argument("--since", type=_time, help="time within the first period to include")
+    command.add_argument("--until", type=_time, help="time within the last period to include")
+    command.set_defaults(func=trend_command)
+
+    command = commands.add_parser("rebuild-rollups", help="recompute the completion rollups from the log")
+    command.set_defaults(func=rebuild_rollups_command)
+
+    command = commands.add_parser("archive", help="move old log entries into the archive database")
+    command.add_argument("--horizon-days", type=_horizon, default=retention.HORIZON_DAYS,
+                         help=f"archive entries older than this (default {retention.HORIZON_DAYS}, "
+                              f"at least {retention.MIN_HORIZON_DAYS})")
+    command.add_argument("--archive", help="archive database (default <database>_archive.db)")
+    command.add_argument("--batch-size", type=int, default=retention.BATCH_SIZE,
+                         help=f"entries moved per transaction (default {retention.BATCH_SIZE})")
+    command.add_argument("--max-batches", type=int, help="stop after this many batches (default all)")
+    command.add_argument("--no-vacuum", action="store_true", help="keep the freed pages in the database file")
+    command.set_defaults(func=archive_command)
+
+    command = commands.add_parser("serve", help="serve habits, completions and analytics as HTTP/JSON")
+    command.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    command.add_argument("--port", type=int, default=8080, help="port to listen on (default 8080)")
+    command.add_argument("--pool-size", type=int, default=8, help="pooled database connections (default 8)")
+    command.add_argument("--max-batch", type=int, default=256, help="most completions per commit (default 256)")
+    command.add_argument("--verbose", action="store_true", help="log every request to stderr")
+    command.set_defaults(func=serve_command)
+
+    command = commands.add_parser("loadgen", help="measure a running service")
+    command.add_argument("--url", default="http://127.0.0.1:8080", help="service to measure")
+    command.add_argument("--clients", type=int, default=8, help="concurrent connections (default 8)")
+    command.add_argument("--requests", type=int, default=200, help="requests per client (default 200)")
+    command.add_argument("--write-ratio", type=float, default=0.5, help="share of completions (default 0.5)")
+    command.add_argument("--keep", action="store_true", help="leave the habits of the run in the database")
+    command.set_defaults(func=loadgen_command)
+    return parser
+
+
+def main(argv=None):
+    """
+    Parses the command line and runs the chosen command.
+
+    :param argv: Command line arguments (default sys.argv[1:])
+    :return: Returns the exit status: 0 on success, 1 if a command failed for some of its habits
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 0
+    if args.profile:
+        profiling.enable(summary_at_exit=True)
+    if args.shard_dir:
+        shards.set_shard_directory(args.shard_dir)
+    return args.func(args) or 0
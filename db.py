@@ -2,51 +2,389 @@
 The database module: Primarily creates database tables, stores information and returns data.
 """
 
+import atexit
+import json
+import os
+import random
 import sqlite3
+import threading
+import time as clock
+import weakref
+from contextlib import contextmanager
 
+import migrations
+import records
+import timestamps
 
-def connect_database(name="main.db"):
+# Shared connections handed out by get_connection(): every thread has its own registry mapping
+# absolute database paths to its connections, which are closed when the thread exits
+_local = threading.local()
+
+# Every live thread registry, keyed by id, as a (connections dict, finalizer) tuple
+_registries = {}
+_connections_lock = threading.Lock()
+
+# Concurrency mode (see set_concurrent_mode()): WAL journaling and immediate write transactions
+_concurrent_mode = False
+
+# Seconds a statement waits for another connection's lock before failing with SQLITE_BUSY
+BUSY_TIMEOUT = 5.0
+
+# Attempts and initial delay (seconds, doubled on every attempt) of retry_on_busy()
+RETRY_ATTEMPTS = 8
+RETRY_DELAY = 0.01
+
+# Number of committed writes per database path, made through this module (see change_count())
+_change_counts = {}
+
+
+class HabitConnection(sqlite3.Connection):
+    """
+    SQLite connection that keeps track of the unit of work opened on it with transaction().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Number of transaction() blocks currently open on this connection
+        self.transaction_depth = 0
+        # Absolute path of the database file, set by connect_database()
+        self.path = None
+        # Whether the connection runs in concurrency mode, set by connect_database()
+        self.concurrent = False
+
+
+# Connection class used by connect_database(), see set_connection_factory()
+_connection_factory = HabitConnection
+
+
+def set_connection_factory(factory=HabitConnection):
+    """
+    Changes the connection class of connections opened from now on, e.g. to instrument them.
+
+    :param factory: Subclass of HabitConnection (default HabitConnection restores the default)
+    """
+    global _connection_factory
+    _connection_factory = factory
+
+
+def set_concurrent_mode(enabled=True):
+    """
+    Turns concurrency mode on or off for connections opened from now on.
+
+    Use it when several processes share one database file. Connections in concurrency mode switch
+    the database to WAL journaling, so readers are not blocked by a writer, and start their
+    transaction() blocks with BEGIN IMMEDIATE, so writers queue up on the busy timeout instead of
+    failing on a lock upgrade.
+
+    :param enabled: Whether to enable concurrency mode (default True)
+    """
+    global _concurrent_mode
+    _concurrent_mode = enabled
+
+
+def connect_database(name="main.db", check_same_thread=True, concurrent=None):
     """
     Function to create and maintain connection with database.
 
+    The caller owns the returned connection and is responsible for closing it; use
+    get_connection() to borrow the shared connection instead.
+
     :param name: Name of the database to create or connect with (default main.db)
+    :param check_same_thread: Whether only the creating thread may use the connection (default True)
+    :param concurrent: Whether to use concurrency mode (default None follows set_concurrent_mode())
     :return: Returns the database connection
     """
-    db = sqlite3.connect(name)
-    create_tables(db)
+    db = sqlite3.connect(name, timeout=BUSY_TIMEOUT, check_same_thread=check_same_thread,
+                         factory=_connection_factory)
+    db.path = _database_path(name)
+    db.concurrent = _concurrent_mode if concurrent is None else concurrent
+    if migrations.schema_version(db) == 0:
+        # Only takes effect on a new database; lets the retention module give freed pages back
+        db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    if db.concurrent:
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA synchronous = NORMAL")
+    db.create_function("period_ordinal", 2, timestamps.period_ordinal, deterministic=True)
+    migrations.migrate(db)
+    return db
+
+
+def _database_path(name):
+    """
+    Returns the absolute path of a database, which identifies it across connections.
+
+    :param name: Name of the database
+    :return: Returns the absolute path, or ':memory:' for in-memory databases
+    """
+    return name if name == ":memory:" else os.path.abspath(name)
+
+
+def change_count(path):
+    """
+    Returns how many writes have been committed to the database through this module.
+
+    The count only ever grows, so a value that has not changed means the data has not changed
+    (writes made by other processes are not counted).
+
+    :param path: Absolute path of the database, as in HabitConnection.path
+    :return: Returns the number of committed writes, int
+    """
+    return _change_counts.get(path, 0)
+
+
+def _changed(db):
+    """
+    Counts a committed write to the connection's database, invalidating cached lookups of it.
+
+    :param db: To maintain connection with the database
+    """
+    path = getattr(db, "path", None)
+    if path is not None:
+        with _connections_lock:
+            _change_counts[path] = _change_counts.get(path, 0) + 1
+
+
+class _Registry:
+    """
+    Holds the calling thread's shared connections in a threading.local(), so that they are
+    closed when the thread exits and drops it.
+    """
+    __slots__ = ("connections", "__weakref__")
+
+    def __init__(self):
+        self.connections = {}
+
+
+def _close_registry(key):
+    """
+    Closes the connections of a thread registry and forgets it.
+
+    :param key: Key of the registry in _registries
+    """
+    with _connections_lock:
+        connections = _registries.pop(key, ({}, None))[0]
+        handles = list(connections.values())
+        connections.clear()
+    for db in handles:
+        db.close()
+
+
+def _thread_connections():
+    """
+    Returns the calling thread's registry of shared connections, creating it on first use.
+
+    :return: Returns the dict mapping absolute database paths to the thread's connections
+    """
+    registry = getattr(_local, "registry", None)
+    if registry is None:
+        registry = _local.registry = _Registry()
+        finalizer = weakref.finalize(registry, _close_registry, id(registry))
+        with _connections_lock:
+            _registries[id(registry)] = registry.connections, finalizer
+    return registry.connections
+
+
+def get_connection(name="main.db"):
+    """
+    Returns the calling thread's shared connection to the database, opening it on first use.
+
+    Connections are kept in a registry per thread, keyed by database path, so repeated calls
+    borrow the same connection instead of opening a new one. A thread's connections are closed
+    when the thread exits.
+
+    :param name: Name of the database to connect with (default main.db)
+    :return: Returns the shared database connection
+    """
+    path = _database_path(name)
+    connections = _thread_connections()
+    with _connections_lock:
+        db = connections.get(path)
+    if db is None:
+        # The registry may close the handle from another thread, hence check_same_thread=False
+        db = connect_database(name, check_same_thread=False)
+        with _connections_lock:
+            connections[path] = db
     return db
 
 
+def close_connection(name="main.db"):
+    """
+    Closes every shared connection (in all threads) to the specified database.
+
+    :param name: Name of the database
+    """
+    path = _database_path(name)
+    with _connections_lock:
+        handles = [connections.pop(path) for connections, _ in _registries.values() if path in connections]
+    for db in handles:
+        db.close()
+
+
+def close_all_connections():
+    """
+    Closes every shared connection held by the registry.
+    """
+    with _connections_lock:
+        handles = [db for connections, _ in _registries.values() for db in connections.values()]
+        for connections, _ in _registries.values():
+            connections.clear()
+    for db in handles:
+        db.close()
+
+
+atexit.register(close_all_connections)
+
+
+def _forget_connections():
+    """
+    Drops the registry in a forked child: SQLite handles must not be used across a fork.
+
+    The parent's handles are left open (closing them could disturb the parent's locks), the
+    child simply opens its own connections on first use.
+    """
+    global _connections_lock, _local
+    _connections_lock = threading.Lock()
+    for _, finalizer in _registries.values():
+        finalizer.detach()
+    _registries.clear()
+    _local = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_connections)
+
+
+@contextmanager
+def connection(name="main.db"):
+    """
+    Borrows the shared connection to the database for the duration of a with block.
+
+    The connection is closed on exit only if the block opened it, so nested borrowers
+    keep sharing the same handle.
+
+    :param name: Name of the database to connect with (default main.db)
+    :return: Yields the shared database connection
+    """
+    path = _database_path(name)
+    connections = _thread_connections()
+    with _connections_lock:
+        opened_here = path not in connections
+    db = get_connection(name)
+    try:
+        yield db
+    finally:
+        if opened_here:
+            with _connections_lock:
+                connections.pop(path, None)
+            db.close()
+
+
+@contextmanager
+def transaction(db):
+    """
+    Runs a with block as a single unit of work on the connection.
+
+    Write helpers called inside the block do not commit on their own; everything is committed
+    once when the outermost block exits, or rolled back if it raises. Nested blocks run in a
+    savepoint, so a failing inner block is undone without aborting the outer one.
+
+    :param db: Connection from connect_database() or get_connection()
+    :return: Yields the connection
+    """
+    savepoint = f"unit_of_work_{db.transaction_depth}"
+    if db.transaction_depth > 0:
+        db.execute(f"SAVEPOINT {savepoint}")
+    elif not db.in_transaction:
+        db.execute("BEGIN IMMEDIATE" if db.concurrent else "BEGIN")
+    db.transaction_depth += 1
+    try:
+        yield db
+    except BaseException:
+        db.transaction_depth -= 1
+        if db.transaction_depth > 0:
+            db.execute(f"ROLLBACK TO {savepoint}")
+            db.execute(f"RELEASE {savepoint}")
+        else:
+            db.rollback()
+            _changed(db)
+        raise
+    db.transaction_depth -= 1
+    if db.transaction_depth > 0:
+        db.execute(f"RELEASE {savepoint}")
+    else:
+        db.commit()
+        _changed(db)
+
+
+def is_busy_error(error):
+    """
+    Checks whether an exception means the database was locked by another connection.
+
+    :param error: The exception
+    :return: Returns True for SQLITE_BUSY and SQLITE_LOCKED errors else returns False
+    """
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)  # Python 3.11+
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def retry_on_busy(operation, *args, attempts=RETRY_ATTEMPTS, delay=RETRY_DELAY):
+    """
+    Calls operation(*args), retrying with exponential backoff while the database is busy.
+
+    The operation must be safe to repeat, i.e. do its writes in a transaction() block, which is
+    rolled back when the lock cannot be obtained.
+
+    :param operation: Function to call
+    :param args: Arguments for the function
+    :param attempts: Maximum number of calls (default RETRY_ATTEMPTS)
+    :param delay: Seconds to wait after the first failure, doubled after every further one
+    :return: Returns the result of the operation
+    :raises sqlite3.OperationalError: If the database is still busy after the last attempt
+    """
+    for attempt in range(attempts):
+        try:
+            return operation(*args)
+        except sqlite3.OperationalError as error:
+            if not is_busy_error(error) or attempt == attempts - 1:
+                raise
+            clock.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def _commit(db):
+    """
+    Commits the pending changes unless they belong to a unit of work opened with transaction().
+
+    :param db: To maintain connection with the database
+    """
+    if getattr(db, "transaction_depth", 0) == 0:
+        db.commit()
+        _changed(db)
+
+
 def create_tables(db):
     """
-    Creates two database tables: namely 'habit_tracker and 'habit_log'.
+    Brings the database schema up to date by applying any pending migrations.
 
-    The habit_tracker database consists of the following columns: habit, periodicity, category,
-    creation_time, streak, and completion_time.
-    The habit_log database has the following columns: habit, completed, streak, and completion_time.
+    The habit_tracker and habit_log tables are created by the first migration; see the
+    migrations module for the full schema history.
 
     :param db: To maintain connection with the database
     """
-    cur = db.cursor()
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS habit_tracker (
-               habit TEXT PRIMARY KEY , 
-               periodicity TEXT,
-               category TEXT,
-               creation_time TEXT,
-               streak INT,
-               completion_time TEXT   
-           )''')
+    migrations.migrate(db)
 
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS habit_log (
-            habit TEXT,
-            completed BOOL,
-            streak INT DEFAULT 0,
-            completion_time TIME,
-            FOREIGN KEY (habit) REFERENCES habit_tracker(habit)
-        )''')
-    db.commit()
+
+HABIT_INSERT = """
+    INSERT INTO habit_tracker (habit, periodicity, category, creation_time, streak, completion_time,
+                               day_ordinal, week_ordinal, month_ordinal, log_generation)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, abs(random()))"""
+
+LOG_INSERT = """
+    INSERT INTO habit_log (habit, completed, streak, completion_time, day_ordinal, week_ordinal, month_ordinal)
+    VALUES (?, ?, ?, ?, ?, ?, ?)"""
 
 
 def add_habit(db, name, periodicity, category, creation_time, streak, completion_time=None):
@@ -57,31 +395,120 @@ def add_habit(db, name, periodicity, category, creation_time, streak, completion
     :param name: Name of the habit
     :param periodicity: Periodicity of the habit (e.g., daily, weekly, or monthly)
     :param category: Category of the habit
-    :param creation_time: Time of habit creation
+    :param creation_time: Time of habit creation, timestamp
     :param streak: Streak of the habit (if any), int
-    :param completion_time: Time when habit was marked as completed, optional
+    :param completion_time: Time when habit was marked as completed, timestamp, optional
     """
     cur = db.cursor()
-    cur.execute("INSERT INTO habit_tracker VALUES(?, ?, ?, ?, ?, ?)",
+    cur.execute(HABIT_INSERT,
                 (name, periodicity, category,
-                 creation_time, streak, completion_time))
-    db.commit()
+                 creation_time, streak, completion_time, *timestamps.period_ordinals(completion_time)))
+    _commit(db)
+
+
+def add_habits_many(db, rows):
+    """
+    Adds many habits to the habit_tracker database with a single executemany.
+
+    :param db: To maintain connection with the database
+    :param rows: Iterable of (name, periodicity, category, creation_time, streak, completion_time) tuples
+    """
+    cur = db.cursor()
+    cur.executemany(HABIT_INSERT, (row + timestamps.period_ordinals(row[5]) for row in rows))
+    _commit(db)
+
+
+# Folds one completion (a log entry with a positive streak) into the habit's habit_stats row.
+# Parameters: (name, streak, completion_time, completion_time, name, completion_time)
+STATS_UPSERT = """
+    INSERT INTO habit_stats VALUES (?, ?, 1, ?, ?, period_ordinal((SELECT periodicity FROM habit_tracker WHERE habit = ?), ?))
+    ON CONFLICT (habit) DO UPDATE SET
+        longest_streak = MAX(longest_streak, excluded.longest_streak),
+        completion_count = completion_count + 1,
+        first_completion = MIN(first_completion, excluded.first_completion),
+        last_completion = MAX(last_completion, excluded.last_completion),
+        completed_period = CASE WHEN excluded.last_completion >= last_completion
+                                THEN excluded.completed_period ELSE completed_period END"""
+
+
+def _stats_rows(rows):
+    """
+    Returns the STATS_UPSERT parameters of the completions among habit_log rows.
+
+    :param rows: Iterable of (name, is_completed, streak, completion_time) tuples
+    :return: List of STATS_UPSERT parameter tuples
+    """
+    return [(name, streak, time, time, name, time) for name, _, streak, time in rows if streak > 0]
+
+
+# Counts one completion in the habit's day, week and month buckets of habit_rollup.
+# Parameters: (name, day_ordinal, name, week_ordinal, name, month_ordinal)
+HABIT_ROLLUP_UPSERT = """
+    INSERT INTO habit_rollup (habit, bucket, period, completions)
+    VALUES (?, 'daily', ?, 1), (?, 'weekly', ?, 1), (?, 'monthly', ?, 1)
+    ON CONFLICT (habit, bucket, period) DO UPDATE SET completions = completions + 1"""
+
+# Counts one completion in the buckets of the habit's category in category_rollup.
+# Parameters: (day_ordinal, name, week_ordinal, name, month_ordinal, name)
+CATEGORY_ROLLUP_UPSERT = """
+    INSERT INTO category_rollup (category, bucket, period, completions)
+    SELECT category, 'daily', ?, 1 FROM habit_tracker WHERE habit = ? AND category IS NOT NULL
+    UNION ALL SELECT category, 'weekly', ?, 1 FROM habit_tracker WHERE habit = ? AND category IS NOT NULL
+    UNION ALL SELECT category, 'monthly', ?, 1 FROM habit_tracker WHERE habit = ? AND category IS NOT NULL
+    ON CONFLICT (category, bucket, period) DO UPDATE SET completions = completions + 1"""
+
+
+def _rollup_parameters(name, completion_time):
+    """
+    Returns the HABIT_ROLLUP_UPSERT and CATEGORY_ROLLUP_UPSERT parameters of one completion.
+
+    :param name: Name of the habit
+    :param completion_time: Time of the completion, timestamp
+    :return: Tuple of (habit rollup parameters, category rollup parameters)
+    """
+    day, week, month = timestamps.period_ordinals(completion_time)
+    return (name, day, name, week, name, month), (day, name, week, name, month, name)
 
 
 def update_log(db, name, is_completed, streak, completion_time):
     """
     Updates the habit_log database with the provided data.
 
+    Entries with a positive streak are completions and are also counted in habit_stats and the
+    rollup tables.
+
     :param db: To maintain connection with the database
     :param name: Name of the habit
     :param is_completed: Whether habit was completed or not, boolean
     :param streak: Streak of the habit, int
-    :param completion_time: Time when habit was marked as completed
+    :param completion_time: Time when habit was marked as completed, timestamp
         """
     cur = db.cursor()
-    cur.execute("INSERT INTO habit_log VALUES(?, ?, ?, ?)",
-                (name, is_completed, streak, completion_time))
-    db.commit()
+    cur.execute(LOG_INSERT,
+                (name, is_completed, streak, completion_time, *timestamps.period_ordinals(completion_time)))
+    if streak > 0:
+        cur.execute(STATS_UPSERT, (name, streak, completion_time, completion_time, name, completion_time))
+        habit_rollup, category_rollup = _rollup_parameters(name, completion_time)
+        cur.execute(HABIT_ROLLUP_UPSERT, habit_rollup)
+        cur.execute(CATEGORY_ROLLUP_UPSERT, category_rollup)
+    _commit(db)
+
+
+def update_logs_many(db, rows):
+    """
+    Adds many entries to the habit_log database with a single executemany.
+
+    :param db: To maintain connection with the database
+    :param rows: Iterable of (name, is_completed, streak, completion_time) tuples
+    """
+    rows = list(rows)
+    cur = db.cursor()
+    cur.executemany(LOG_INSERT, (row + timestamps.period_ordinals(row[3]) for row in rows))
+    cur.executemany(STATS_UPSERT, _stats_rows(rows))
+    rollups = [_rollup_parameters(name, time) for name, _, streak, time in rows if streak > 0]
+    cur.executemany(HABIT_ROLLUP_UPSERT, [habit_rollup for habit_rollup, _ in rollups])
+    cur.executemany(CATEGORY_ROLLUP_UPSERT, [category_rollup for _, category_rollup in rollups])
+    _commit(db)
 
 
 def habit_exists(db, habit_name):
@@ -99,6 +526,20 @@ def habit_exists(db, habit_name):
     return True if data is not None else False
 
 
+def fetch_habit(db, habit_name):
+    """
+    Returns the stored data of the provided habit.
+
+    :param db: To maintain connection with the database
+    :param habit_name: Name of the habit
+    :return: Returns the habit as a records.HabitRecord, or None if it does not exist
+    """
+    cur = db.cursor()
+    cur.row_factory = records.habit_rows
+    cur.execute("SELECT * FROM habit_tracker WHERE habit = ?", (habit_name,))
+    return cur.fetchone()
+
+
 def remove_habit(db, habit_name):
     """
     Removes the provided habit from the habit_tracker database and also resets the log
@@ -107,10 +548,10 @@ def remove_habit(db, habit_name):
     :param db: To maintain connection with the database
     :param habit_name: Name of the habit
     """
-    cur = db.cursor()
-    cur.execute(f"DELETE FROM habit_tracker WHERE habit == '{habit_name}';")
-    db.commit()
-    reset_logs(db, habit_name)
+    with transaction(db):
+        # The logs go first: their rollups are taken off the category the habit still belongs to
+        reset_logs(db, habit_name)
+        db.cursor().execute("DELETE FROM habit_tracker WHERE habit = ?", (habit_name,))
 
 
 def fetch_categories(db):
@@ -121,21 +562,29 @@ def fetch_categories(db):
     :return: Returns the list of category names
     """
     cur = db.cursor()
-    cur.execute("SELECT category FROM habit_tracker")
+    cur.execute("SELECT DISTINCT category FROM habit_tracker")
     data = cur.fetchall()
-    return [i[0].capitalize() for i in set(data)]
+    return [i[0].capitalize() for i in data]
 
 
 def delete_category(db, category_name):
     """
-    Deletes the specified category from the habit_tracker database.
+    Deletes the specified category from the habit_tracker database, along with the logs,
+    statistics and rollups of its habits.
 
     :param db: To maintain connection with the database
     :param category_name: Name of the category
     """
-    cur = db.cursor()
-    cur.execute(f"DELETE FROM habit_Tracker where category == '{category_name}';")
-    db.commit()
+    with transaction(db):
+        cur = db.cursor()
+        cur.execute("DELETE FROM habit_log WHERE habit IN (SELECT habit FROM habit_tracker WHERE category = ?)",
+                    (category_name,))
+        cur.execute("DELETE FROM habit_stats WHERE habit IN (SELECT habit FROM habit_tracker WHERE category = ?)",
+                    (category_name,))
+        cur.execute("DELETE FROM habit_rollup WHERE habit IN (SELECT habit FROM habit_tracker WHERE category = ?)",
+                    (category_name,))
+        cur.execute("DELETE FROM category_rollup WHERE category = ?", (category_name,))
+        cur.execute("DELETE FROM habit_tracker WHERE category = ?", (category_name,))
 
 
 def fetch_habits_as_choices(db):
@@ -148,7 +597,7 @@ def fetch_habits_as_choices(db):
     cur = db.cursor()
     cur.execute("SELECT habit FROM habit_tracker")
     data = cur.fetchall()
-    return [i[0].capitalize() for i in set(data)] if len(data) > 0 else None
+    return [i[0].capitalize() for i in data] if len(data) > 0 else None
 
 
 def update_periodicity(db, habit_name, new_periodicity):
@@ -160,12 +609,13 @@ def update_periodicity(db, habit_name, new_periodicity):
     :param habit_name: Name of the habit
     :param new_periodicity: New periodicity to assign to the habit
     """
-    cur = db.cursor()
-    query = "UPDATE habit_tracker SET periodicity = ?, streak = 0, completion_time = NULL WHERE habit = ?"
-    data = (new_periodicity, habit_name)
-    cur.execute(query, data)
-    db.commit()
-    reset_logs(db, habit_name)
+    with transaction(db):
+        cur = db.cursor()
+        query = ("UPDATE habit_tracker SET periodicity = ?, streak = 0, completion_time = NULL, "
+                 "day_ordinal = NULL, week_ordinal = NULL, month_ordinal = NULL WHERE habit = ?")
+        data = (new_periodicity, habit_name)
+        cur.execute(query, data)
+        reset_logs(db, habit_name)
 
 
 def get_streak_count(db, habit_name):
@@ -190,18 +640,118 @@ def update_habit_streak(db, habit_name, streak, time=None):
     :param db: To maintain connection with the database
     :param habit_name: Name of the habit
     :param streak: New streak for the habit, int
-    :param time: Time when the streak has been updated
+    :param time: Time when the streak has been updated, timestamp
     """
     cur = db.cursor()
-    query = "UPDATE habit_tracker SET streak = ?, completion_time = ? WHERE habit = ?"
-    data = (streak, time, habit_name)
+    query = ("UPDATE habit_tracker SET streak = ?, completion_time = ?, "
+             "day_ordinal = ?, week_ordinal = ?, month_ordinal = ? WHERE habit = ?")
+    data = (streak, time, *timestamps.period_ordinals(time), habit_name)
     cur.execute(query, data)
-    db.commit()
+    _commit(db)
+
+
+def set_habit_streak_if_unchanged(db, habit_name, streak, time, expected_streak, expected_time):
+    """
+    Updates the streak of the specified habit only if nobody has changed it since it was read.
+
+    The check and the write are one conditional UPDATE, so two writers that read the same state
+    cannot both apply a completion: the second one matches no row and has to read again.
+
+    :param db: To maintain connection with the database
+    :param habit_name: Name of the habit
+    :param streak: New streak for the habit, int
+    :param time: Time when the habit was completed, timestamp
+    :param expected_streak: Streak the habit had when its state was read
+    :param expected_time: Completion time the habit had when its state was read, or None
+    :return: Returns True if the streak was updated else returns False
+    """
+    cur = db.cursor()
+    query = ("UPDATE habit_tracker SET streak = ?, completion_time = ?, day_ordinal = ?, week_ordinal = ?, "
+             "month_ordinal = ? WHERE habit = ? AND streak = ? AND completion_time IS ?")
+    cur.execute(query, (streak, time, *timestamps.period_ordinals(time), habit_name, expected_streak, expected_time))
+    _commit(db)
+    return cur.rowcount == 1
+
+
+def update_habit_streaks_many(db, rows):
+    """
+    Updates the streak of many habits with a single executemany.
+
+    :param db: To maintain connection with the database
+    :param rows: Iterable of (streak, time, name) tuples
+    """
+    cur = db.cursor()
+    query = ("UPDATE habit_tracker SET streak = ?, completion_time = ?, "
+             "day_ordinal = ?, week_ordinal = ?, month_ordinal = ? WHERE habit = ?")
+    cur.executemany(query, ((streak, time, *timestamps.period_ordinals(time), name) for streak, time, name in rows))
+    _commit(db)
+
+
+def fetch_habit_state(db, habit_name):
+    """
+    Returns everything needed to decide how completing the specified habit affects its streak.
+
+    :param db: To maintain connection with the database
+    :param habit_name: Name of the habit
+    :return: Returns a (periodicity, streak, completion_time, last period) tuple, where the last period is the
+        number of the day, week or month (following the periodicity) of the last completion, or None if the
+        habit does not exist
+    """
+    cur = db.cursor()
+    query = """
+        SELECT periodicity, streak, completion_time,
+               CASE periodicity WHEN 'daily' THEN day_ordinal WHEN 'weekly' THEN week_ordinal ELSE month_ordinal END
+        FROM habit_tracker WHERE habit = ?"""
+    cur.execute(query, (habit_name,))
+    return cur.fetchone()
+
+
+def fetch_habit_states(db, habit_names):
+    """
+    Returns the state (see fetch_habit_state) of many habits in one query.
+
+    The names are passed as a single JSON array parameter, so any number of habits is fetched
+    with one statement. Habits that do not exist are left out of the result.
+
+    :param db: To maintain connection with the database
+    :param habit_names: Iterable of habit names
+    :return: Returns a dict mapping habit name to a (periodicity, streak, completion_time, last period) tuple
+    """
+    cur = db.cursor()
+    query = """
+        SELECT habit, periodicity, streak, completion_time,
+               CASE periodicity WHEN 'daily' THEN day_ordinal WHEN 'weekly' THEN week_ordinal ELSE month_ordinal END
+        FROM habit_tracker WHERE habit IN (SELECT value FROM json_each(?))"""
+    cur.execute(query, (json.dumps(list(habit_names)),))
+    return {row[0]: row[1:] for row in cur}
+
+
+def habit_completed_in_period(db, habit_name, time):
+    """
+    Checks whether the specified habit was already completed in the day, week or month (following
+    its periodicity) that contains the given time.
+
+    :param db: To maintain connection with the database
+    :param habit_name: Name of the habit
+    :param time: Time within the period to check, timestamp
+    :return: Returns True if the habit was completed in that period else returns False
+    """
+    cur = db.cursor()
+    query = """
+        SELECT 1 FROM habit_tracker WHERE habit = ? AND streak > 0 AND
+            CASE periodicity WHEN 'daily' THEN day_ordinal WHEN 'weekly' THEN week_ordinal ELSE month_ordinal END =
+            CASE periodicity WHEN 'daily' THEN ? WHEN 'weekly' THEN ? ELSE ? END"""
+    cur.execute(query, (habit_name, *timestamps.period_ordinals(time)))
+    return cur.fetchone() is not None
 
 
 def reset_logs(db, habit_name):
     """
-    Resets the old log entries of the specified habit.
+    Resets the old log entries, the statistics and the rollups of the specified habit, and starts
+    a new log generation for it.
+
+    The habit's completions are subtracted from the rollups of its category, so the habit must
+    still be in habit_tracker.
 
     :param db: To maintain connection with the database
     :param habit_name: Name of the habit
@@ -209,7 +759,50 @@ def reset_logs(db, habit_name):
     cur = db.cursor()
     query = "DELETE FROM habit_log WHERE habit = ?"
     cur.execute(query, (habit_name,))
-    db.commit()
+    cur.execute("DELETE FROM habit_stats WHERE habit = ?", (habit_name,))
+    # Archived entries of the old log no longer belong to the habit (see the retention module)
+    cur.execute("UPDATE habit_tracker SET log_generation = abs(random()) WHERE habit = ?", (habit_name,))
+    cur.execute("""
+        UPDATE category_rollup SET completions = completions - (
+            SELECT habit_rollup.completions FROM habit_rollup
+            WHERE habit_rollup.habit = ? AND habit_rollup.bucket = category_rollup.bucket
+              AND habit_rollup.period = category_rollup.period)
+        WHERE category = (SELECT category FROM habit_tracker WHERE habit = ?)
+          AND (bucket, period) IN (SELECT bucket, period FROM habit_rollup WHERE habit = ?)""", (habit_name,) * 3)
+    cur.execute("DELETE FROM category_rollup WHERE category = (SELECT category FROM habit_tracker WHERE habit = ?) "
+                "AND completions <= 0", (habit_name,))
+    cur.execute("DELETE FROM habit_rollup WHERE habit = ?", (habit_name,))
+    _commit(db)
+
+
+def fill_rollups(db, log="habit_log"):
+    """
+    Fills the empty habit_rollup and category_rollup tables from a log.
+
+    Used by the migration that creates the tables and by retention.rebuild_rollups(), which passes
+    the log including the archived entries (see retention.current_log()); runs in the caller's
+    transaction.
+
+    :param db: To maintain connection with the database
+    :param log: Table or subquery with the habit_log columns to count (default habit_log)
+    """
+    cur = db.cursor()
+    # {log} is a table name or subquery from code, never user input
+    cur.execute("""
+        INSERT INTO habit_rollup
+        WITH days AS MATERIALIZED (
+            SELECT habit, day_ordinal, week_ordinal, month_ordinal, SUM(streak > 0) AS completions
+            FROM {log} GROUP BY habit, day_ordinal HAVING completions > 0)
+        SELECT habit, 'daily', day_ordinal, completions FROM days
+        UNION ALL SELECT habit, 'weekly', week_ordinal, SUM(completions) FROM days GROUP BY habit, week_ordinal
+        UNION ALL SELECT habit, 'monthly', month_ordinal, SUM(completions) FROM days GROUP BY habit, month_ordinal"""
+                .format(log=log))
+    cur.execute("""
+        INSERT INTO category_rollup
+        SELECT habit_tracker.category, habit_rollup.bucket, habit_rollup.period, SUM(habit_rollup.completions)
+        FROM habit_rollup JOIN habit_tracker ON habit_tracker.habit = habit_rollup.habit
+                               AND habit_tracker.category IS NOT NULL
+        GROUP BY habit_tracker.category, habit_rollup.bucket, habit_rollup.period""")
 
 
 def get_habit_completion_time(db, habit_name):
@@ -218,7 +811,7 @@ def get_habit_completion_time(db, habit_name):
 
     :param db: To maintain connection with the database
     :param habit_name: Name of the habit
-    :return: Returns the time, int
+    :return: Returns the timestamp, int
     """
     cur = db.cursor()
     query = "SELECT completion_time FROM habit_tracker WHERE habit = ?"
@@ -8,7 +8,8 @@ Hence, increasing the re-usability of the code.
 """
 
 import questionary as qt
-from db import connect_database, fetch_categories, fetch_habits_as_choices
+import cache
+from db import get_connection
 
 
 def habit_name():
@@ -56,8 +57,8 @@ def defined_categories():
     :return: Returns the selected category from the list of choices
     :raises ValueError: If no categories are available in the database then raises a ValueError
     """
-    db = connect_database()
-    arr = fetch_categories(db)
+    db = get_connection()
+    arr = cache.categories(db)
     if len(arr) > 0:
         return qt.select("Please Select a Category",
                          choices=sorted(arr)).ask().lower()
@@ -91,8 +92,8 @@ def habits_from_db():
     :return: Returns the selected habit from the list of choices
     :raises ValueError: If no habits are available in the database then raises a ValueError
     """
-    db = connect_database()
-    list_of_habits = fetch_habits_as_choices(db)
+    db = get_connection()
+    list_of_habits = cache.habits_as_choices(db)
     if list_of_habits is not None:
         return qt.select("Please Select a Habit",
                          choices=sorted(list_of_habits)).ask().lower()
@@ -109,6 +110,15 @@ def habit_delete_confirmation(habit_name_to_delete):
     return qt.confirm(f"Would you like to delete '{habit_name_to_delete}' habit from database?").ask()
 
 
+def show_more_log_entries():
+    """
+    Prompts the user to confirm whether they like to see older log entries or not.
+
+    :return: Return True if yes else returns False
+    """
+    return qt.confirm("Show older log entries?").ask()
+
+
 def show_period_choices():
     """
     Prompts the user to select from the list of provided period display choices.
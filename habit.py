@@ -1,5 +1,183 @@
 import db
-from datetime import datetime
+import profiling
+import shards
+import timestamps
+
+# Outcomes of marking a habit as completed
+ALREADY_COMPLETED = "already completed"
+CONTINUED = "continued"
+RESET = "reset"
+UNKNOWN_HABIT = "unknown habit"
+
+ALREADY_COMPLETED_MESSAGES = {
+    "daily": "\nYou have already completed this habit today, please try again tomorrow.\n",
+    "weekly": "\nYou have already completed the habit this week, please try again next week.\n",
+    "monthly": "\nYou have already completed the habit this month, please try again next month.\n",
+}
+
+
+def streak_transition(streak, last_period, period):
+    """
+    Decides what completing a habit does to its streak, without touching the database.
+
+    Periods are the day, week or month numbers (following the habit's periodicity) returned by
+    timestamps.period_ordinal(), so consecutive calendar periods differ by exactly 1.
+
+    :param streak: Current streak of the habit, int
+    :param last_period: Period of the last completion, or None
+    :param period: Period of the new completion
+    :return: ALREADY_COMPLETED, CONTINUED or RESET
+    """
+    if streak == 0 or last_period is None:
+        return CONTINUED
+    if period <= last_period:
+        return ALREADY_COMPLETED
+    return CONTINUED if period == last_period + 1 else RESET
+
+
+def add_habit(conn, name, periodicity, category, time):
+    """
+    Adds a new habit and logs its creation in one transaction.
+
+    :param conn: To maintain connection with the database
+    :param name: Name of the habit
+    :param periodicity: Periodicity of the habit (e.g., daily, weekly, or monthly)
+    :param category: Category of the habit
+    :param time: Creation time, timestamp
+    :return: Returns True if the habit was added, False if it already exists
+    """
+    def add():
+        with db.transaction(conn):
+            if db.habit_exists(conn, name):
+                return False
+            db.add_habit(conn, name, periodicity, category, time, 0)
+            db.update_log(conn, name, False, 0, time)
+        return True
+    return db.retry_on_busy(add)
+
+
+def remove_habit(conn, name):
+    """
+    Removes a habit together with its log.
+
+    :param conn: To maintain connection with the database
+    :param name: Name of the habit
+    :return: Returns True if the habit existed else returns False
+    """
+    def remove():
+        with db.transaction(conn):
+            existed = db.habit_exists(conn, name)
+            db.remove_habit(conn, name)
+        return existed
+    return db.retry_on_busy(remove)
+
+
+def change_periodicity(conn, name, periodicity, time):
+    """
+    Changes the periodicity of a habit, which resets its streak and log, and logs the change.
+
+    :param conn: To maintain connection with the database
+    :param name: Name of the habit
+    :param periodicity: New periodicity of the habit
+    :param time: Time of the change, timestamp
+    :return: Returns True if the habit exists else returns False
+    """
+    def change():
+        with db.transaction(conn):
+            if not db.habit_exists(conn, name):
+                return False
+            db.update_periodicity(conn, name, periodicity)
+            db.update_log(conn, name, False, 0, time)
+        return True
+    return db.retry_on_busy(change)
+
+
+def complete_habit(conn, name, time):
+    """
+    Marks a single habit as completed.
+
+    The habit's state is fetched with one query, streak_transition() decides the outcome and the
+    streak is changed with a conditional UPDATE that only applies if the state is still the one
+    that was read, logged in the same transaction. If another connection got there first the
+    state is read again, and a busy database is retried with backoff (see db.retry_on_busy()).
+
+    :param conn: To maintain connection with the database
+    :param name: Name of the habit
+    :param time: Time of the completion, timestamp
+    :return: Tuple of (periodicity, outcome, streak); periodicity and streak are None for UNKNOWN_HABIT
+    """
+    while True:
+        result = db.retry_on_busy(_try_complete_habit, conn, name, time)
+        if result is not None:
+            return result
+
+
+def _try_complete_habit(conn, name, time):
+    """
+    Makes one attempt of complete_habit().
+
+    :return: Returns the result of complete_habit(), or None if the habit changed meanwhile
+    """
+    state = db.fetch_habit_state(conn, name)
+    if state is None:
+        return None, UNKNOWN_HABIT, None
+    periodicity, streak, completion_time, last_period = state
+    outcome = streak_transition(streak, last_period, timestamps.period_ordinal(periodicity, time))
+    if outcome == ALREADY_COMPLETED:
+        return periodicity, outcome, streak
+    new_streak = streak + 1 if outcome == CONTINUED else 1
+    with db.transaction(conn):
+        if not db.set_habit_streak_if_unchanged(conn, name, new_streak, time, streak, completion_time):
+            return None
+        db.update_log(conn, name, outcome == CONTINUED, new_streak, time)
+    return periodicity, outcome, new_streak
+
+
+def mark_completed_many(conn, completions):
+    """
+    Marks many habits as completed in one transaction.
+
+    The affected habits are fetched with a single query, every streak transition is worked out in
+    memory (completions of the same habit are applied oldest first), and the results are written
+    with one executemany per table. Reading and writing happen in the same transaction, so no
+    other connection can change the habits in between; a busy database is retried with backoff.
+
+    :param conn: To maintain connection with the database
+    :param completions: Iterable of (habit name, timestamp) pairs
+    :return: List of (habit name, outcome, streak) tuples in the order of the completions; the
+        streak is None for UNKNOWN_HABIT
+    """
+    return db.retry_on_busy(_mark_completed_many, conn, list(completions))
+
+
+def _mark_completed_many(conn, completions):
+    """
+    Makes one attempt of mark_completed_many().
+    """
+    with db.transaction(conn):
+        states = {name: list(state)
+                  for name, state in db.fetch_habit_states(conn, {c[0] for c in completions}).items()}
+        results = [None] * len(completions)
+        log_rows = []
+        for index in sorted(range(len(completions)), key=lambda i: completions[i][1]):
+            name, time = completions[index]
+            state = states.get(name)
+            if state is None:
+                results[index] = (name, UNKNOWN_HABIT, None)
+                continue
+            periodicity, streak, _, last_period = state
+            period = timestamps.period_ordinal(periodicity, time)
+            outcome = streak_transition(streak, last_period, period)
+            if outcome != ALREADY_COMPLETED:
+                state[1] = streak + 1 if outcome == CONTINUED else 1
+                state[2], state[3] = time, period
+                log_rows.append((name, outcome == CONTINUED, state[1], time))
+            results[index] = (name, outcome, state[1])
+
+        changed = {row[0] for row in log_rows}
+        db.update_habit_streaks_many(conn, [(states[name][1], states[name][2], name) for name in changed])
+        db.update_logs_many(conn, log_rows)
+    return results
 
 
 class Habit:
@@ -7,7 +185,8 @@ class Habit:
         Habit class for interacting with different habits
     """
 
-    def __init__(self, name: str = None, periodicity: str = None, category: str = None, database="main.db"):
+    def __init__(self, name: str = None, periodicity: str = None, category: str = None, database="main.db",
+                 user: str = None):
         """
         Parameters
         ----------
@@ -19,34 +198,63 @@ class Habit:
             The category of the habit (default is None)
         database: str, optional
             For connecting to a different database for running tests (default is main.db)
+        user: str, optional
+            The user the habit belongs to; habits of a user are kept in the user's own database
+            (see the shards module) and the database parameter is ignored (default is None)
                 """
 
         self.name = name
         self.periodicity = periodicity
         self.category = category
-        self.db = db.connect_database(database)
+        self.user = user
+        self.database = shards.database_for(user, database)
         self.streak = 0
-        self.current_time = datetime.now().strftime("%m/%d/%Y %H:%M")
+        self.current_time = timestamps.now()
 
+    @classmethod
+    def load(cls, name, database="main.db", user=None):
+        """
+        Creates the Habit object of a stored habit, with its periodicity, category and streak.
+
+        :param name: Name of the habit
+        :param database: Database the habit is stored in (default main.db)
+        :param user: User the habit belongs to (default None)
+        :return: Returns the Habit, or None if the habit does not exist
+        """
+        habit = cls(name, database=database, user=user)
+        record = db.fetch_habit(habit.db, name)
+        if record is None:
+            return None
+        habit.periodicity, habit.category, habit.streak = record.periodicity, record.category, record.streak
+        return habit
+
+    @property
+    def db(self):
+        """
+        The shared connection to the habit's database, borrowed from the connection registry.
+        """
+        return db.get_connection(self.database)
+
+    @profiling.operation("Habit.add")
     def add(self):
         """
-        Adds habit information to the habit_tracker database and updates the log.
+        Adds habit information to the habit_tracker database and updates the log in one transaction.
         """
-        if db.habit_exists(self.db, self.name) is False:
-            db.add_habit(self.db, self.name, self.periodicity, self.category, self.current_time, self.streak)
-            db.update_log(self.db, self.name, False, 0, self.current_time)
+        if add_habit(self.db, self.name, self.periodicity, self.category, self.current_time):
             print(f"\nYour request to add '{self.name.capitalize()}' as '{self.periodicity.capitalize()}' "
                   f"Habit in '{self.category.capitalize()}' has been completed.\n")
         else:
             print("\nHabit already exists, please choose another habit.\n")
 
+    @profiling.operation("Habit.remove")
     def remove(self):
         """
         Removes the habit from the habit_tracker database.
         """
-        db.remove_habit(self.db, self.name)
+        remove_habit(self.db, self.name)
         print(f"\nDeleted '{self.name.capitalize()}' from database successfully.\n")
 
+    @profiling.operation("Habit.delete_category")
     def delete_category(self):
         """
         Deletes the category and all the assigned habit to that category from the habit_tracker database.
@@ -54,114 +262,29 @@ class Habit:
         db.delete_category(self.db, self.category)
         print(f"\nSuccessfully deleted the category '{self.category.capitalize()}'.\n")
 
+    @profiling.operation("Habit.change_periodicity")
     def change_periodicity(self):
         """
         Changes the habit periodicity and updates the log.
         """
-        db.update_periodicity(self.db, self.name, self.periodicity)
-        db.update_log(self.db, self.name, False, 0, self.current_time)
+        change_periodicity(self.db, self.name, self.periodicity, self.current_time)
         print(f"\nChanged Periodicity of the Habit '{self.name.capitalize()}' to '{self.periodicity.capitalize()}'\n")
 
-    def increment_streak(self):
-        """
-        Gets the current habit streak from database and increments it by 1.
-        """
-        self.streak = db.get_streak_count(self.db, self.name)
-        self.streak += 1
-
-    def reset_streak(self):
-        """
-        Resets the habit streak to 1, also updates the log and the database.
-        """
-        self.streak = 1
-        db.update_habit_streak(self.db, self.name, self.streak, self.current_time)
-        db.update_log(self.db, self.name, False, db.get_streak_count(self.db, self.name), self.current_time)
-        print("\nOops! Looks like you missed your streak. Your streak has been reset.")
-        print(f"Your new streak for Habit '{self.name.capitalize()}' is now {self.streak} because you completed it.\n")
-
-    def update_streak(self):
-        """
-        Calls increment_streak() and updates the habit streak and the log.
-        """
-        self.increment_streak()
-        db.update_habit_streak(self.db, self.name, self.streak, self.current_time)
-        db.update_log(self.db, self.name, True, db.get_streak_count(self.db, self.name), self.current_time)
-        print(f"\nGreat! Your new streak for habit '{self.name.capitalize()}' is {self.streak}\n")
-
+    @profiling.operation("Habit.mark_as_completed")
     def mark_as_completed(self):
         """
         Marks the habit as completed.
 
-        This function checks the periodicity of the habit and calls the relevant method to
-        verify whether the streak should be incremented or not depending on the day/week/month of the habit.
-        """
-        # Daily Streak Tracker & Assignment
-        if db.fetch_habit_periodicity(self.db, self.name) == "daily":
-            if self.daily_habit_streak_verification() == 0:
-                print("\nYou have already completed this habit today, please try again tomorrow.\n")
-            elif self.daily_habit_streak_verification() == 1:
-                self.update_streak()
-            else:
-                self.reset_streak()
-
-        # Weekly Streak Tracker & Assignment
-        elif db.fetch_habit_periodicity(self.db, self.name) == "weekly":
-            if self.weekly_habit_streak_verification() == 1:
-                print("\nYou have already completed the habit this week, please try again next week.\n")
-            elif self.weekly_habit_streak_verification() == 2:
-                self.update_streak()
-            else:
-                self.reset_streak()
-
-        # Monthly Streak Tracker & Assignment
-        elif db.fetch_habit_periodicity(self.db, self.name) == "monthly":
-            if self.monthly_habit_streak_verification() == 0:
-                print("\nYou have already completed the habit this month, please try again next month.\n")
-            elif self.monthly_habit_streak_verification() == 1:
-                self.update_streak()
-            else:
-                self.reset_streak()
-
-    def daily_habit_streak_verification(self):
-        """
-        Return the number of day(s) passed since the last habit completion.
-        :return date.days: Number of day(s) since last completion of habit
-        """
-        last_visit = db.get_habit_completion_time(self.db, self.name)
-        previous_streak = db.get_streak_count(self.db, self.name)
-        if previous_streak == 0 or last_visit is None:
-            return 1
-        else:
-            today = self.current_time
-            date = datetime.strptime(today[:10], "%m/%d/%Y") - datetime.strptime(last_visit[:10], "%m/%d/%Y")
-            return date.days
-
-    def weekly_habit_streak_verification(self):
-        """
-        Return the number of week(s) passed since the last habit completion.
-        :return week: Number of week(s) since last completion of habit
-        """
-        last_streak = db.get_habit_completion_time(self.db, self.name)
-        previous_streak = db.get_streak_count(self.db, self.name)
-        if (previous_streak == 0) or (last_streak is None):
-            return 2
-        else:
-            today = self.current_time
-            delt = datetime.strptime(today[:10], "%m/%d/%Y") - datetime.strptime(last_streak[:10], "%m/%d/%Y")
-            week = 3 if (delt.days + 1) > 14 else (2 if (delt.days + 1) > 7 else 1)
-            return week
-
-    def monthly_habit_streak_verification(self):
-        """
-        Return the number of month(s) passed since the last habit completion.
-        :return months: Number of month(s) since last completion of habit
+        The habit's state is read once and complete_habit() decides, depending on the day/week/month of
+        the last completion, whether the streak is continued, reset or left alone.
         """
-        last_visit = db.get_habit_completion_time(self.db, self.name)
-        previous_streak = db.get_streak_count(self.db, self.name)
-        if (previous_streak == 0) or (last_visit is None):
-            return 1
+        periodicity, outcome, self.streak = complete_habit(self.db, self.name, self.current_time)
+        if outcome == UNKNOWN_HABIT:
+            print("\nHabit not found, please add it first.\n")
+        elif outcome == ALREADY_COMPLETED:
+            print(ALREADY_COMPLETED_MESSAGES[periodicity])
+        elif outcome == CONTINUED:
+            print(f"\nGreat! Your new streak for habit '{self.name.capitalize()}' is {self.streak}\n")
         else:
-            current_month = self.current_time
-            month = int(current_month[:2]) - int(last_visit[:2])
-            print(month)
-            return month
+            print("\nOops! Looks like you missed your streak. Your streak has been reset.")
+            print(f"Your new streak for Habit '{self.name.capitalize()}' is now {self.streak} because you completed it.\n")
@@ -0,0 +1,139 @@
+"""
+The loadgen module: Load generator for the HTTP service of the server module.
+
+Every client thread keeps one persistent HTTP connection open and sends a mix of completion
+writes and streak reads. Each thread completes a habit of its own one day further on every
+write, so the writes really change streaks. Latencies of all requests are collected and
+summarised as percentiles and throughput.
+
+The habits are named after the run (loadgen-<run>-<client>) and removed again at the end, so
+measuring a service leaves its database as it was.
+"""
+
+import http.client
+import json
+import math
+import threading
+import time
+import uuid
+from urllib.parse import quote, urlsplit
+
+# One day in seconds, the distance between the completions of a client
+DAY = 86400
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of a list of numbers.
+
+    :param values: Non-empty list of numbers
+    :param fraction: Percentile as a fraction, e.g. 0.99
+    :return: Returns the smallest value that at least that fraction of the values do not exceed
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class _Client:
+    """
+    One persistent connection to the service.
+    """
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+
+    def request(self, method, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        self.connection.request(method, path, body=data, headers=headers)
+        response = self.connection.getresponse()
+        payload = response.read()
+        if response.status >= 500:
+            raise RuntimeError(f"{method} {path} failed with {response.status}: {payload!r}")
+        return response.status, json.loads(payload) if payload else None
+
+    def close(self):
+        self.connection.close()
+
+
+def run_load(url, clients=8, requests=200, write_ratio=0.5, start_time=0, keep=False):
+    """
+    Sends requests to the service from several client threads and measures them.
+
+    :param url: Base URL of the service, e.g. http://127.0.0.1:8080
+    :param clients: Number of concurrent clients, each with its own connection (default 8)
+    :param requests: Number of requests per client (default 200)
+    :param write_ratio: Fraction of requests that are completions, the rest read streaks (default 0.5)
+    :param start_time: Timestamp of the first completion of every client (default 0)
+    :param keep: Whether to leave the habits of the run in the database (default False removes them)
+    :return: Dict with requests, errors, seconds, rps, p50_ms, p99_ms and habits (names of the
+        habits of the run)
+    """
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    ready = threading.Barrier(clients + 1)
+    run = uuid.uuid4().hex[:8]
+    names = [f"loadgen-{run}-{number}" for number in range(clients)]
+
+    setup = _Client(url)
+    try:
+        for name in names:
+            setup.request("POST", "/habits", {"habit": name, "periodicity": "daily", "category": "loadgen",
+                                              "time": start_time})
+        seconds = _measure(url, names, requests, write_ratio, start_time, latencies, errors, ready)
+    finally:
+        if not keep:
+            for name in names:
+                setup.request("DELETE", f"/habits/{quote(name)}")
+        setup.close()
+
+    measured = [latency for client_latencies in latencies for latency in client_latencies]
+    return {
+        "requests": len(measured),
+        "errors": sum(errors),
+        "seconds": round(seconds, 3),
+        "rps": round(len(measured) / seconds, 1) if seconds else 0.0,
+        "p50_ms": round(percentile(measured, 0.50) * 1000, 3) if measured else None,
+        "p99_ms": round(percentile(measured, 0.99) * 1000, 3) if measured else None,
+        "habits": names,
+    }
+
+
+def _measure(url, names, requests, write_ratio, start_time, latencies, errors, ready):
+    """
+    Runs the client threads of run_load(), collecting the latencies and errors per client.
+
+    :return: Returns the seconds from the start of the first to the end of the last client
+    """
+    def client(number):
+        name = names[number]
+        path = f"/habits/{quote(name)}/completions"
+        writes = 0
+        ready.wait()
+        session = _Client(url)
+        try:
+            for index in range(requests):
+                started = time.perf_counter()
+                try:
+                    if (index + 1) * write_ratio >= writes + 1:
+                        writes += 1
+                        session.request("POST", path, {"time": start_time + writes * DAY})
+                    else:
+                        session.request("GET", f"/streaks?habit={quote(name)}")
+                except (OSError, RuntimeError, http.client.HTTPException):
+                    errors[number] += 1
+                    session.close()
+                    session = _Client(url)
+                latencies[number].append(time.perf_counter() - started)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(len(names))]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
@@ -1,12 +1,12 @@
-import questionary as qt
-import get
-from habit import Habit
-import analytics
+"""
+Entry point of the habit tracker: the interactive menu, or a command of the cli module.
 
-# Greeting message
-print("""
-*** Welcome to the Habit Tracker ***
-""")
+Importing this module has no side effects and stays cheap: questionary (with prompt_toolkit)
+and the modules behind the menu are only imported once the menu actually runs, and the cli
+module only when a command is given.
+"""
+
+import sys
 
 
 #  CLI Interface
@@ -15,6 +15,11 @@ def menu():
     CLI Interface utilized with questionary library to
     pretty display the menu of the habit tracker for the user.
     """
+    import questionary as qt
+    import analytics
+    import get
+    from habit import Habit
+
     # Shows 6 choices for the user to choose from
     choice = qt.select(
         "What do you want to do?",
@@ -124,7 +129,7 @@ def menu():
             except ValueError:  # ValueError is raised when there are no habit's log in the database
                 print("\nNo habit log found; Please add a habit first\n")
             else:
-                analytics.show_habit_logged_data(habit_name)
+                analytics.show_habit_logged_data(habit_name, get.show_more_log_entries)
         elif second_choice == "Back to Main Menu":
             menu()
 
@@ -133,6 +138,28 @@ def menu():
         exit()  # exit() completely exits the program
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """
+    Runs a command if one is given, else the interactive menu.
+
+    :param argv: Command line arguments (default sys.argv[1:])
+    :return: Returns the exit status of the command
+    """
+    arguments = sys.argv[1:] if argv is None else list(argv)
+    if arguments == ["--profile"]:  # Profile the interactive menu
+        import profiling
+        arguments = []
+        profiling.enable(summary_at_exit=True)
+    if arguments:  # Non-interactive commands, e.g. 'python main.py export habits habits.csv'
+        import cli
+        return cli.main(arguments)
+    # Greeting message
+    print("""
+*** Welcome to the Habit Tracker ***
+""")
     while True:
         menu()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+The migrations module: Versions the database schema and upgrades it in numbered steps.
+
+The schema version is tracked with SQLite's 'PRAGMA user_version'. Every migration is applied
+exactly once, in order, and a database that is already current runs no DDL at all. Schema
+changes (new tables, columns or indexes) are added as new migrations at the end of MIGRATIONS;
+existing migrations must never be edited once released.
+"""
+
+import timestamps
+
+
+def _create_tables(db):
+    """
+    Migration 1: Creates the habit_tracker and habit_log tables.
+
+    The habit_tracker table consists of the following columns: habit, periodicity, category,
+    creation_time, streak, and completion_time.
+    The habit_log table has the following columns: habit, completed, streak, and completion_time.
+
+    :param db: To maintain connection with the database
+    """
+    cur = db.cursor()
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS habit_tracker (
+               habit TEXT PRIMARY KEY ,
+               periodicity TEXT,
+               category TEXT,
+               creation_time TEXT,
+               streak INT,
+               completion_time TEXT
+           )''')
+
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS habit_log (
+            habit TEXT,
+            completed BOOL,
+            streak INT DEFAULT 0,
+            completion_time TIME,
+            FOREIGN KEY (habit) REFERENCES habit_tracker(habit)
+        )''')
+
+
+def _add_lookup_indexes(db):
+    """
+    Migration 2: Indexes the columns that habit lookups filter on.
+
+    habit_log gets a composite (habit, completion_time) index for per-habit log reads and deletes,
+    plus a covering (habit, streak) index so MAX(streak) is answered from the index alone.
+    habit_tracker gets indexes on periodicity and category for the filtered listings and deletes.
+
+    :param db: To maintain connection with the database
+    """
+    cur = db.cursor()
+    cur.execute("CREATE INDEX IF NOT EXISTS habit_log_habit_time ON habit_log (habit, completion_time)")
+    cur.execute("CREATE INDEX IF NOT EXISTS habit_log_habit_streak ON habit_log (habit, streak)")
+    cur.execute("CREATE INDEX IF NOT EXISTS habit_tracker_periodicity ON habit_tracker (periodicity)")
+    cur.execute("CREATE INDEX IF NOT EXISTS habit_tracker_category ON habit_tracker (category)")
+
+
+def _epoch_from_text(value):
+    """
+    Converts a time stored in the legacy text format to a timestamp.
+
+    Values that are not legacy text (NULL, or already converted) are returned unchanged.
+
+    :param value: Stored time
+    :return: Seconds since the epoch, or the unchanged value
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        return timestamps.from_text(value)
+    except ValueError:
+        return value
+
+
+def _store_times_as_timestamps(db):
+    """
+    Migration 3: Stores every time as integer seconds since the epoch.
+
+    habit_tracker is rebuilt with INTEGER time columns (its TEXT columns would turn integers back
+    into text) and its existing rows are converted; habit_log times are converted in place.
+
+    :param db: To maintain connection with the database
+    """
+    db.create_function("epoch_from_text", 1, _epoch_from_text, deterministic=True)
+    cur = db.cursor()
+    cur.execute('''
+        CREATE TABLE habit_tracker_new (
+            habit TEXT PRIMARY KEY,
+            periodicity TEXT,
+            category TEXT,
+            creation_time INTEGER,
+            streak INT,
+            completion_time INTEGER
+        )''')
+    cur.execute("""
+        INSERT INTO habit_tracker_new
+        SELECT habit, periodicity, category, epoch_from_text(creation_time), streak, epoch_from_text(completion_time)
+        FROM habit_tracker""")
+    cur.execute("DROP TABLE habit_tracker")
+    cur.execute("ALTER TABLE habit_tracker_new RENAME TO habit_tracker")
+    cur.execute("CREATE INDEX habit_tracker_periodicity ON habit_tracker (periodicity)")
+    cur.execute("CREATE INDEX habit_tracker_category ON habit_tracker (category)")
+    cur.execute("UPDATE habit_log SET completion_time = epoch_from_text(completion_time) "
+                "WHERE typeof(completion_time) = 'text'")
+
+
+def _add_habit_stats(db):
+    """
+    Migration 4: Creates the habit_stats table and fills it from the existing log.
+
+    habit_stats keeps, per habit, the longest streak, the number of completions, the first and last
+    completion time and the period number (see timestamps.period_ordinal) of the last completion.
+    It is maintained by the write helpers in the db module.
+
+    :param db: To maintain connection with the database
+    """
+    db.create_function("period_ordinal", 2, timestamps.period_ordinal, deterministic=True)
+    cur = db.cursor()
+    cur.execute('''
+        CREATE TABLE habit_stats (
+            habit TEXT PRIMARY KEY,
+            longest_streak INT,
+            completion_count INT,
+            first_completion INTEGER,
+            last_completion INTEGER,
+            completed_period INT
+        )''')
+    cur.execute("""
+        INSERT INTO habit_stats
+        SELECT habit_log.habit, MAX(habit_log.streak), COUNT(*), MIN(habit_log.completion_time),
+               MAX(habit_log.completion_time), period_ordinal(habit_tracker.periodicity, MAX(habit_log.completion_time))
+        FROM habit_log JOIN habit_tracker ON habit_tracker.habit = habit_log.habit
+        WHERE habit_log.streak > 0
+        GROUP BY habit_log.habit""")
+
+
+def _add_period_ordinals(db):
+    """
+    Migration 5: Stores the day, week and month number (see timestamps.period_ordinals) of every
+    completion time on habit_log and habit_tracker rows.
+
+    With the numbers stored, continuing a streak is an integer comparison and "completed this
+    period?" is an equality check on the habit's row.
+
+    :param db: To maintain connection with the database
+    """
+    db.create_function("period_ordinal", 2, timestamps.period_ordinal, deterministic=True)
+    cur = db.cursor()
+    for table in ("habit_log", "habit_tracker"):
+        for column in ("day_ordinal", "week_ordinal", "month_ordinal"):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} INT")
+        cur.execute(f"""
+            UPDATE {table} SET day_ordinal = period_ordinal('daily', completion_time),
+                               week_ordinal = period_ordinal('weekly', completion_time),
+                               month_ordinal = period_ordinal('monthly', completion_time)""")
+
+
+def _add_rollups(db):
+    """
+    Migration 6: Creates the habit_rollup and category_rollup tables and fills them from the
+    existing log.
+
+    The rollups count the completions of every habit and every category per day, week and month;
+    bucket is the periodicity the period was numbered for (see timestamps.period_ordinal). They
+    are maintained by the write helpers in the db module.
+
+    :param db: To maintain connection with the database
+    """
+    from db import fill_rollups  # the db module imports this one
+
+    cur = db.cursor()
+    cur.execute('''
+        CREATE TABLE habit_rollup (
+            habit TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            period INT NOT NULL,
+            completions INT NOT NULL,
+            PRIMARY KEY (habit, bucket, period)
+        ) WITHOUT ROWID''')
+    cur.execute('''
+        CREATE TABLE category_rollup (
+            category TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            period INT NOT NULL,
+            completions INT NOT NULL,
+            PRIMARY KEY (category, bucket, period)
+        ) WITHOUT ROWID''')
+    fill_rollups(db)
+
+
+def _add_log_time_index(db):
+    """
+    Migration 7: Indexes habit_log by completion_time alone, so the oldest entries of every habit
+    can be found for archiving (see the retention module) without scanning the log.
+
+    :param db: To maintain connection with the database
+    """
+    db.cursor().execute("CREATE INDEX habit_log_time ON habit_log (completion_time)")
+
+
+def _add_log_generations(db):
+    """
+    Migration 8: Gives every habit a log generation, a random number that is replaced whenever
+    the habit's log is reset (periodicity change or removal, see db.reset_logs).
+
+    Entries moved to the archive database (see the retention module) keep the generation they were
+    archived under, so archived entries of an earlier log of the habit can be told apart from the
+    current one.
+
+    :param db: To maintain connection with the database
+    """
+    cur = db.cursor()
+    cur.execute("ALTER TABLE habit_tracker ADD COLUMN log_generation INT")
+    cur.execute("UPDATE habit_tracker SET log_generation = abs(random())")
+
+
+# Ordered list of migrations; the position of a migration (starting at 1) is its schema version
+MIGRATIONS = [
+    _create_tables,
+    _add_lookup_indexes,
+    _store_times_as_timestamps,
+    _add_habit_stats,
+    _add_period_ordinals,
+    _add_rollups,
+    _add_log_time_index,
+    _add_log_generations,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(db):
+    """
+    Returns the schema version the database is currently at.
+
+    :param db: To maintain connection with the database
+    :return: Returns the schema version, int
+    """
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db):
+    """
+    Applies every pending migration to the database in a single transaction.
+
+    Returns after one PRAGMA read when the schema is already current. Otherwise the write lock
+    is taken before the version is checked again, so concurrent processes never apply the same
+    migration twice.
+
+    :param db: To maintain connection with the database
+    """
+    if schema_version(db) >= SCHEMA_VERSION:
+        return
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        version = schema_version(db)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(db)
+            db.execute(f"PRAGMA user_version = {number}")
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
@@ -0,0 +1,234 @@
+"""
+The profiling module: Counts and times the SQL statements issued by each high-level operation.
+
+Once enable() is called, connections opened by the db module are ProfiledConnections whose
+cursors record every statement: its text, how often it ran, how long it took (executing and
+fetching) and how many rows it returned. Statements are attributed to the operation running at
+the time, e.g. Habit.mark_as_completed or analytics.show_habit_streak_data, which are marked
+with the operation() decorator. Nested operations count towards the outermost one.
+
+report() returns the collected data for monitoring; 'python main.py --profile' prints a summary
+with format_report() when the program exits.
+"""
+
+import atexit
+import contextvars
+import functools
+import sqlite3
+import sys
+import threading
+import time
+
+import db
+
+# Name used for statements issued outside of any operation
+NO_OPERATION = "(no operation)"
+
+_enabled = False
+_current_operation = contextvars.ContextVar("operation", default=None)
+
+# operation -> [calls, seconds]; (operation, sql) -> [count, seconds, rows]
+_operations = {}
+_statements = {}
+_lock = threading.Lock()
+
+
+def _record_statement(sql, seconds, rows=0, executed=True):
+    key = (_current_operation.get() or NO_OPERATION, sql)
+    with _lock:
+        entry = _statements.get(key)
+        if entry is None:
+            entry = _statements[key] = [0, 0.0, 0]
+        entry[0] += executed
+        entry[1] += seconds
+        entry[2] += rows
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """
+    Cursor that records its statements, including the time spent fetching their rows.
+    """
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._sql = " ".join(sql.split())
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_statement(self._sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = " ".join(sql.split())
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_statement(self._sql, time.perf_counter() - started)
+
+    def _fetched(self, started, rows):
+        if self._sql is not None:
+            _record_statement(self._sql, time.perf_counter() - started, rows, executed=False)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0)
+            raise
+        self._fetched(started, 1)
+        return row
+
+
+class ProfiledConnection(db.HabitConnection):
+    """
+    HabitConnection whose cursors, including those of execute(), are ProfiledCursors.
+    """
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # The shortcuts of sqlite3.Connection create plain cursors internally
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def operation(name):
+    """
+    Decorator marking a function as a high-level operation that statements are attributed to.
+
+    While profiling is disabled the function is called directly.
+
+    :param name: Name of the operation, e.g. 'Habit.mark_as_completed'
+    :return: Returns the decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled or _current_operation.get() is not None:
+                return func(*args, **kwargs)
+            token = _current_operation.set(name)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+                _current_operation.reset(token)
+                with _lock:
+                    entry = _operations.setdefault(name, [0, 0.0])
+                    entry[0] += 1
+                    entry[1] += seconds
+        return wrapper
+    return decorator
+
+
+def enable(summary_at_exit=False):
+    """
+    Starts profiling the connections opened from now on.
+
+    Shared connections that are already open are closed, so they are reopened instrumented.
+
+    :param summary_at_exit: Whether to print format_report() to stderr when the program exits
+    """
+    global _enabled
+    if summary_at_exit and not _enabled:
+        atexit.register(print_summary)
+    _enabled = True
+    db.set_connection_factory(ProfiledConnection)
+    db.close_all_connections()
+
+
+def disable():
+    """
+    Stops profiling connections opened from now on; the collected data is kept.
+    """
+    global _enabled
+    _enabled = False
+    db.set_connection_factory()
+
+
+def reset():
+    """
+    Drops the collected data.
+    """
+    with _lock:
+        _operations.clear()
+        _statements.clear()
+
+
+def report() -> dict:
+    """
+    Returns the collected data.
+
+    :return: Dict mapping operation name to a dict with calls, seconds (wall time of the
+        operation), statements (number executed), sql_seconds, rows and queries, a list of dicts
+        with sql, count, seconds and rows per distinct statement, slowest first
+    """
+    with _lock:
+        operations = {name: list(entry) for name, entry in _operations.items()}
+        statements = {key: list(entry) for key, entry in _statements.items()}
+    result = {}
+    for (name, sql), (count, seconds, rows) in statements.items():
+        calls, wall = operations.get(name, (0, 0.0))
+        entry = result.setdefault(name, {"calls": calls, "seconds": wall, "statements": 0, "sql_seconds": 0.0,
+                                         "rows": 0, "queries": []})
+        entry["statements"] += count
+        entry["sql_seconds"] += seconds
+        entry["rows"] += rows
+        entry["queries"].append({"sql": sql, "count": count, "seconds": seconds, "rows": rows})
+    for name, (calls, wall) in operations.items():
+        result.setdefault(name, {"calls": calls, "seconds": wall, "statements": 0, "sql_seconds": 0.0,
+                                 "rows": 0, "queries": []})
+    for entry in result.values():
+        entry["queries"].sort(key=lambda query: -query["seconds"])
+    return result
+
+
+def format_report(data=None, top=5) -> str:
+    """
+    Formats report() as a readable summary.
+
+    :param data: Result of report() (default is the current report())
+    :param top: Number of slowest statements listed per operation (default 5)
+    :return: Returns the summary text
+    """
+    data = report() if data is None else data
+    lines = ["", f"{'Operation':<45} {'Calls':>6} {'Statements':>11} {'Rows':>8} {'SQL ms':>9} {'Total ms':>9}",
+             "-" * 93]
+    for name, entry in sorted(data.items(), key=lambda item: -item[1]["sql_seconds"]):
+        lines.append(f"{name:<45} {entry['calls']:>6} {entry['statements']:>11} {entry['rows']:>8} "
+                     f"{entry['sql_seconds'] * 1000:>9.2f} {entry['seconds'] * 1000:>9.2f}")
+        for query in entry["queries"][:top]:
+            sql = query["sql"] if len(query["sql"]) <= 70 else query["sql"][:67] + "..."
+            lines.append(f"    {query['count']:>5}x {query['seconds'] * 1000:>8.2f} ms {query['rows']:>7} rows  {sql}")
+    return "\n".join(lines) + "\n"
+
+
+def print_summary(file=None):
+    """
+    Prints format_report() (to stderr by default).
+    """
+    print(format_report(), file=file or sys.stderr)
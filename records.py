@@ -0,0 +1,112 @@
+"""
+The records module: Compact row objects for habits, log entries and streak data.
+
+Records keep their values in __slots__ and are filled by column name through row_factory(),
+so queries may select columns in any order (or add columns) without breaking the code that
+reads them. For older callers records still behave like the tuples they replace: they can be
+indexed, sliced, unpacked and compared with tuples, in the order of their fields.
+"""
+
+
+class Record:
+    """
+    Base class of the records; subclasses list their fields in __slots__.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        """
+        :param values: Field values in __slots__ order; missing trailing values are None
+        """
+        for index, name in enumerate(self.__slots__):
+            setattr(self, name, values[index] if index < len(values) else None)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def as_dict(self) -> dict:
+        """
+        Returns the fields as a dict, e.g. for JSON output.
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class HabitRecord(Record):
+    """
+    A habit_tracker row.
+    """
+
+    __slots__ = ("habit", "periodicity", "category", "creation_time", "streak", "completion_time")
+
+
+class LogEntry(Record):
+    """
+    A habit_log row.
+    """
+
+    __slots__ = ("habit", "completed", "streak", "completion_time")
+
+    def as_dict(self) -> dict:
+        entry = super().as_dict()
+        entry["completed"] = bool(entry["completed"])
+        return entry
+
+
+class StreakRecord(Record):
+    """
+    The streak data of a habit: its habit_tracker row joined with its habit_stats row.
+
+    completed_period is the period number of the last completion (see timestamps.period_ordinal()).
+    """
+
+    __slots__ = ("habit", "periodicity", "completion_time", "streak", "longest_streak", "completion_count",
+                 "completed_period")
+
+
+def row_factory(record_class):
+    """
+    Creates a sqlite3 row factory that builds records of a class by column name.
+
+    Columns the record has no field for are ignored and fields without a column are None. The
+    column positions are worked out once per executed statement, not once per row.
+
+    :param record_class: Subclass of Record
+    :return: Returns the row factory, for cursor.row_factory
+    """
+    cache = (None, None)  # (cursor description, column position of every field)
+
+    def factory(cursor, row):
+        nonlocal cache
+        description, positions = cache
+        if description is not cursor.description:
+            description = cursor.description
+            names = [column[0] for column in description]
+            positions = [names.index(name) if name in names else None for name in record_class.__slots__]
+            cache = (description, positions)
+        return record_class(*[None if position is None else row[position] for position in positions])
+
+    return factory
+
+
+habit_rows = row_factory(HabitRecord)
+log_rows = row_factory(LogEntry)
+streak_rows = row_factory(StreakRecord)
@@ -0,0 +1,225 @@
+"""
+The reports module: Aggregate analytics computed inside SQLite.
+
+Every report is a single SQL statement over the rollup tables, which count the completions of
+every habit per day, week and month: a habit's completed periods are its rollup rows of its own
+periodicity, streak runs and breaks are found with window functions (LAG and running sums over
+the periods of each habit) and the figures are aggregated with GROUP BY. Only the aggregated rows
+reach Python, so the reports scale with the number of habits and periods rather than with the
+length of habit_log, and they are unaffected by archiving old log entries (see the retention module).
+
+Time ranges select whole periods of each habit's periodicity: the periods the start and the end
+time fall in are included in full.
+"""
+
+import profiling
+import timestamps
+
+# Window of completion_rates() when no start is given, in days
+RATE_WINDOW_DAYS = 30
+
+# Rollup rows of every habit's own periods; the completed periods of a habit are its rows here.
+# The rollups keep counting the completions that the retention module moved out of habit_log.
+_PERIODS = """
+    FROM habit_tracker
+    {join} habit_rollup ON habit_rollup.habit = habit_tracker.habit AND habit_rollup.bucket = habit_tracker.periodicity
+                        AND (? IS NULL OR habit_rollup.period >= period_ordinal(habit_tracker.periodicity, ?))
+                        AND (? IS NULL OR habit_rollup.period <= period_ordinal(habit_tracker.periodicity, ?))"""
+
+COMPLETION_RATES = """
+    SELECT habit_tracker.habit, habit_tracker.periodicity, habit_tracker.category,
+           COUNT(habit_rollup.period) AS completed_periods,
+           MAX(0, period_ordinal(habit_tracker.periodicity, ?)
+                  - period_ordinal(habit_tracker.periodicity, MAX(habit_tracker.creation_time, ?)) + 1)
+               AS expected_periods""" + _PERIODS.format(join="LEFT JOIN") + """
+    GROUP BY habit_tracker.habit
+    ORDER BY habit_tracker.habit"""
+
+# Completed periods of every habit with the gap to the previous one (NULL for the first)
+_GAPS = """
+    WITH gaps AS (
+        SELECT habit_tracker.habit, habit_tracker.category, habit_tracker.periodicity, habit_rollup.period,
+               habit_rollup.period - LAG(habit_rollup.period) OVER (PARTITION BY habit_tracker.habit
+                                                                   ORDER BY habit_rollup.period) AS gap""" \
+    + _PERIODS.format(join="JOIN") + ")"
+
+BROKEN_STREAKS = _GAPS + """
+    SELECT habit, category, periodicity, COUNT(*) AS completed_periods,
+           SUM(gap > 1) AS broken_streaks, MAX(gap) - 1 AS longest_gap
+    FROM gaps
+    GROUP BY habit
+    ORDER BY broken_streaks DESC, habit"""
+
+CATEGORY_STREAKS = _GAPS + """,
+    runs AS (
+        SELECT habit, category,
+               SUM(gap IS NULL OR gap > 1) OVER (PARTITION BY habit ORDER BY period
+                                                 ROWS UNBOUNDED PRECEDING) AS run
+        FROM gaps),
+    lengths AS (
+        SELECT habit, category, COUNT(*) AS length FROM runs GROUP BY habit, run)
+    SELECT category, COUNT(DISTINCT habit) AS habits, COUNT(*) AS streaks,
+           ROUND(AVG(length), 2) AS average_streak, MAX(length) AS longest_streak
+    FROM lengths
+    GROUP BY category
+    ORDER BY category"""
+
+COMPLETIONS_PER_PERIODICITY = """
+    SELECT habit_tracker.periodicity, COUNT(DISTINCT habit_tracker.habit) AS habits,
+           IFNULL(SUM(habit_rollup.completions), 0) AS completions,
+           ROUND(IFNULL(SUM(habit_rollup.completions), 0) * 1.0 / COUNT(DISTINCT habit_tracker.habit), 2)
+               AS completions_per_habit""" + _PERIODS.format(join="LEFT JOIN") + """
+    GROUP BY habit_tracker.periodicity
+    ORDER BY habit_tracker.periodicity"""
+
+HABIT_SERIES = """
+    SELECT period, completions FROM habit_rollup
+    WHERE habit = ? AND bucket = ? AND period >= ? AND period <= ?
+    ORDER BY period"""
+
+CATEGORY_SERIES = """
+    SELECT period, completions FROM category_rollup
+    WHERE category = ? AND bucket = ? AND period >= ? AND period <= ?
+    ORDER BY period"""
+
+TOTAL_SERIES = """
+    SELECT period, SUM(completions) AS completions FROM category_rollup
+    WHERE bucket = ? AND period >= ? AND period <= ?
+    GROUP BY period
+    ORDER BY period"""
+
+# Open ends of time ranges
+_MIN_TIME, _MAX_TIME = -2 ** 63, 2 ** 63 - 1
+
+
+def _dicts(cur) -> list:
+    """
+    Fetches the rows of an executed cursor as dicts keyed by column name.
+    """
+    names = [column[0] for column in cur.description]
+    return [dict(zip(names, row)) for row in cur.fetchall()]
+
+
+def _bounds(start, end) -> tuple:
+    """
+    Returns the parameters of the _PERIODS range for a start and an exclusive end time.
+    """
+    last = None if end is None else end - 1
+    return start, start, last, last
+
+
+@profiling.operation("reports.completion_rates")
+def completion_rates(db, start=None, end=None) -> list:
+    """
+    Reports how many of its periods within a time window every habit was completed in.
+
+    Periods are counted from the later of the window start and the habit's creation, so a habit
+    created during the window is not blamed for periods before it existed.
+
+    :param db: To maintain connection with the database
+    :param start: Time within the first period of the window, timestamp (default RATE_WINDOW_DAYS
+        days before end)
+    :param end: End of the last period of the window (exclusive), timestamp (default now)
+    :return: List of dicts with habit, periodicity, category, completed_periods, expected_periods and
+        completion_rate (completed / expected, None if no period was expected), by habit name
+    """
+    end = timestamps.now() if end is None else end
+    start = timestamps.days_ago(RATE_WINDOW_DAYS, end) if start is None else start
+    cur = db.cursor()
+    cur.execute(COMPLETION_RATES, (end - 1, start) + _bounds(start, end))
+    rows = _dicts(cur)
+    for row in rows:
+        expected = row["expected_periods"]
+        row["completion_rate"] = round(min(row["completed_periods"], expected) / expected, 4) if expected else None
+    return rows
+
+
+@profiling.operation("reports.broken_streaks")
+def broken_streaks(db, start=None, end=None) -> list:
+    """
+    Reports how often every habit's streak was broken, i.e. a period was missed between completions.
+
+    :param db: To maintain connection with the database
+    :param start: Time within the first period to count, timestamp (default None for all)
+    :param end: End of the last period to count (exclusive), timestamp (default None for all)
+    :return: List of dicts with habit, category, periodicity, completed_periods, broken_streaks and
+        longest_gap (most periods missed in a row, None with a single completion), most broken first;
+        habits that were never completed are left out
+    """
+    cur = db.cursor()
+    cur.execute(BROKEN_STREAKS, _bounds(start, end))
+    return _dicts(cur)
+
+
+@profiling.operation("reports.category_streaks")
+def category_streaks(db, start=None, end=None) -> list:
+    """
+    Reports the average and longest streak of the habits of every category.
+
+    Streaks are the runs of consecutive completed periods, including those that have been broken since.
+
+    :param db: To maintain connection with the database
+    :param start: Time within the first period to count, timestamp (default None for all)
+    :param end: End of the last period to count (exclusive), timestamp (default None for all)
+    :return: List of dicts with category, habits (completed at least once), streaks (number of
+        runs), average_streak and longest_streak, by category name
+    """
+    cur = db.cursor()
+    cur.execute(CATEGORY_STREAKS, _bounds(start, end))
+    return _dicts(cur)
+
+
+@profiling.operation("reports.completions_per_periodicity")
+def completions_per_periodicity(db, start=None, end=None) -> list:
+    """
+    Reports the number of completions of the daily, weekly and monthly habits.
+
+    :param db: To maintain connection with the database
+    :param start: Time within the first period to count, timestamp (default None for all)
+    :param end: End of the last period to count (exclusive), timestamp (default None for all)
+    :return: List of dicts with periodicity, habits, completions and completions_per_habit
+    """
+    cur = db.cursor()
+    cur.execute(COMPLETIONS_PER_PERIODICITY, _bounds(start, end))
+    return _dicts(cur)
+
+
+@profiling.operation("reports.completion_series")
+def completion_series(db, bucket, start=None, end=None, habit=None, category=None) -> list:
+    """
+    Returns the number of completions per day, week or month, read from the rollup tables.
+
+    A series over several years reads one rollup row per period instead of every log entry.
+
+    :param db: To maintain connection with the database
+    :param bucket: Length of the periods: daily, weekly or monthly
+    :param start: Time within the first period to include, timestamp (default None for all)
+    :param end: Time within the last period to include, timestamp (default None for all)
+    :param habit: Only count the completions of this habit (default None)
+    :param category: Only count the completions of this category's habits (default None); without
+        habit and category, the completions of every habit with a category are counted
+    :return: List of dicts with period (first day of the period, ISO date) and completions, oldest
+        first; periods without completions are left out
+    """
+    if bucket not in timestamps.PERIODICITIES:
+        raise ValueError(f"unknown bucket: {bucket!r}")
+    first = _MIN_TIME if start is None else timestamps.period_ordinal(bucket, start)
+    last = _MAX_TIME if end is None else timestamps.period_ordinal(bucket, end)
+    cur = db.cursor()
+    if habit is not None:
+        cur.execute(HABIT_SERIES, (habit, bucket, first, last))
+    elif category is not None:
+        cur.execute(CATEGORY_SERIES, (category, bucket, first, last))
+    else:
+        cur.execute(TOTAL_SERIES, (bucket, first, last))
+    return [{"period": timestamps.period_start(bucket, period).isoformat(), "completions": completions}
+            for period, completions in cur.fetchall()]
+
+
+# Report name -> function of (connection, start, end)
+REPORTS = {
+    "completion-rates": completion_rates,
+    "broken-streaks": broken_streaks,
+    "category-streaks": category_streaks,
+    "periodicities": completions_per_periodicity,
+}
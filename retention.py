@@ -0,0 +1,249 @@
+"""
+The retention module: Moves old habit_log entries into an archive database and compacts the log.
+
+habit_log grows by one row on every add, completion, reset and periodicity change. Entries older
+than a horizon are moved, oldest first and in bounded batches, into the habit_log table of an
+archive database in an archive directory next to the main one (main.db -> archive/main.db), where
+listings of the databases in a directory (e.g. shards.users()) do not pick it up. Every batch is its own short
+transaction, so other connections are never blocked for long and an interrupted run simply
+continues where it stopped the next time.
+
+Archiving changes no statistics: longest streaks and completion counts live in habit_stats, and
+the completions per day, week and month in the rollup tables, which are left untouched and which
+the reports module reads. Code that recomputes figures from the entries themselves (the streaks
+module, rebuild_rollups()) reads the archived entries too, through current_log(). Only listings
+of the log itself (e.g. analytics.habit_log) no longer show the archived entries.
+
+The space freed in the main database is given back to the file system with incremental VACUUM.
+Databases created by connect_database() use auto_vacuum = INCREMENTAL; older databases are
+converted once by compact(), which then needs a full VACUUM.
+"""
+
+import json
+import os
+from contextlib import contextmanager
+
+import db
+import records
+import timestamps
+
+# Entries older than this many days are archived by default
+HORIZON_DAYS = 365
+
+# Shortest horizon allowed: recent entries are kept for the log listings and the current periods
+MIN_HORIZON_DAYS = 62
+
+# Entries moved per transaction
+BATCH_SIZE = 5000
+
+# PRAGMA auto_vacuum value of incremental vacuuming
+_INCREMENTAL = 2
+
+# Name of the archive database while it is attached
+_SCHEMA = "archive"
+
+
+def archive_path(database):
+    """
+    Returns the path of the archive database belonging to a database.
+
+    :param database: Path of the main database, e.g. shards/alice.db
+    :return: Returns the archive path, e.g. shards/archive/alice.db
+    """
+    directory, name = os.path.split(database)
+    return os.path.join(directory, "archive", name)
+
+
+def _attach(conn, archive):
+    """
+    Attaches the archive database to a connection, creating its habit_log table if needed.
+
+    :param conn: Connection to the main database, outside of any transaction
+    :param archive: Path of the archive database
+    """
+    if conn.execute("SELECT 1 FROM pragma_database_list WHERE name = ?", (_SCHEMA,)).fetchone():
+        return
+    os.makedirs(os.path.dirname(archive) or ".", exist_ok=True)
+    conn.execute("ATTACH DATABASE ? AS " + _SCHEMA, (archive,))
+    if conn.execute(f"PRAGMA {_SCHEMA}.page_count").fetchone()[0] == 0:
+        conn.execute(f"PRAGMA {_SCHEMA}.auto_vacuum = INCREMENTAL")
+    # Entries are unique per habit and log generation, so copying a batch twice stores it once
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {_SCHEMA}.habit_log (
+            habit TEXT NOT NULL,
+            completed BOOL,
+            streak INT DEFAULT 0,
+            completion_time INTEGER,
+            day_ordinal INT,
+            week_ordinal INT,
+            month_ordinal INT,
+            log_generation INT NOT NULL,
+            UNIQUE (habit, log_generation, completion_time, streak, completed)
+        )""")
+    conn.commit()
+
+
+def _detach(conn):
+    """
+    Detaches the archive database again.
+    """
+    conn.execute("DETACH DATABASE " + _SCHEMA)
+
+
+def archive_logs(conn, horizon_days=HORIZON_DAYS, archive=None, batch_size=BATCH_SIZE, max_batches=None,
+                 now=None, vacuum=True) -> dict:
+    """
+    Moves habit_log entries older than the horizon into the archive database.
+
+    Must not be called inside a db.transaction() block, since the archive is attached to the
+    connection for the duration of the run. Each batch is copied and deleted in one transaction;
+    in WAL mode the two files commit separately, so a crash in between can leave a batch in both
+    databases, never in neither. Such a batch is picked up again by the next run, where copying
+    it is a no-op, and the readers of this module count it once in the meantime.
+
+    :param conn: Connection to the main database
+    :param horizon_days: Age in days of the newest entry to archive (default HORIZON_DAYS)
+    :param archive: Path of the archive database (default archive_path() of the connection's database)
+    :param batch_size: Entries moved per transaction (default BATCH_SIZE)
+    :param max_batches: Stop after this many batches, e.g. to bound the time of a run (default None for all)
+    :param now: Time the horizon is counted back from, timestamp (default now)
+    :param vacuum: Whether to give the freed pages back with incremental VACUUM afterwards (default True)
+    :return: Dict with archived (number of entries moved), batches, done (False if max_batches
+        stopped the run early) and freed_pages
+    """
+    if horizon_days < MIN_HORIZON_DAYS:
+        raise ValueError(f"the retention horizon must be at least {MIN_HORIZON_DAYS} days")
+    cutoff = timestamps.days_ago(horizon_days, now)
+    _attach(conn, archive or archive_path(conn.path))
+    archived = batches = 0
+    done = False
+    try:
+        while max_batches is None or batches < max_batches:
+            with db.transaction(conn):
+                cur = conn.cursor()
+                cur.execute("SELECT rowid FROM main.habit_log WHERE completion_time < ? "
+                            "ORDER BY completion_time LIMIT ?", (cutoff, batch_size))
+                rowids = json.dumps([row[0] for row in cur.fetchall()])
+                cur.execute(f"""
+                    INSERT OR IGNORE INTO {_SCHEMA}.habit_log
+                    SELECT habit_log.habit, habit_log.completed, habit_log.streak, habit_log.completion_time,
+                           habit_log.day_ordinal, habit_log.week_ordinal, habit_log.month_ordinal,
+                           IFNULL(habit_tracker.log_generation, 0)
+                    FROM main.habit_log LEFT JOIN main.habit_tracker ON habit_tracker.habit = habit_log.habit
+                    WHERE habit_log.rowid IN (SELECT value FROM json_each(?))""", (rowids,))
+                count = cur.execute("DELETE FROM main.habit_log WHERE rowid IN (SELECT value FROM json_each(?))",
+                                    (rowids,)).rowcount
+            if count:
+                archived += count
+                batches += 1
+            if count < batch_size:
+                done = True
+                break
+    finally:
+        _detach(conn)
+    freed = compact(conn) if vacuum and archived else 0
+    return {"archived": archived, "batches": batches, "done": done, "freed_pages": freed}
+
+
+def compact(conn, pages=None) -> int:
+    """
+    Gives free pages of the main database back to the file system.
+
+    A database that does not use incremental auto_vacuum yet is switched to it, which takes one
+    full VACUUM; from then on only the free pages are released.
+
+    :param conn: Connection to the main database, outside of any transaction
+    :param pages: Most pages to release (default None for all free pages)
+    :return: Returns the number of pages released
+    """
+    before = conn.execute("PRAGMA main.page_count").fetchone()[0]
+    if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != _INCREMENTAL:
+        conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM main")
+    else:
+        # execute() steps the pragma only once, releasing a single page; executescript() runs it to the end
+        conn.executescript("PRAGMA main.incremental_vacuum" + ("" if pages is None else f"({int(pages)})"))
+    return before - conn.execute("PRAGMA main.page_count").fetchone()[0]
+
+
+@contextmanager
+def current_log(conn, archive=None):
+    """
+    Makes the archived entries readable together with habit_log for the duration of a with block.
+
+    Yields a subquery of every entry of the habits' current logs with the habit_log columns:
+    the entries in habit_log and the archived entries of the habits' current log generation.
+    Entries of logs that were reset since they were archived are left out, and an entry that is in
+    both databases (see archive_logs()) appears once. Without an archive the subquery is habit_log.
+
+    :param conn: Connection to the main database, outside of any transaction
+    :param archive: Path of the archive database (default archive_path() of the connection's database)
+    :return: Yields the subquery, for use in a FROM clause
+    """
+    archive = archive or archive_path(conn.path)
+    if not os.path.exists(archive):
+        yield "main.habit_log"
+        return
+    _attach(conn, archive)
+    try:
+        yield f"""(
+            SELECT habit, completed, streak, completion_time, day_ordinal, week_ordinal, month_ordinal
+            FROM main.habit_log
+            UNION
+            SELECT archived.habit, archived.completed, archived.streak, archived.completion_time,
+                   archived.day_ordinal, archived.week_ordinal, archived.month_ordinal
+            FROM {_SCHEMA}.habit_log AS archived
+            JOIN main.habit_tracker ON habit_tracker.habit = archived.habit
+                                   AND IFNULL(habit_tracker.log_generation, 0) = archived.log_generation)"""
+    finally:
+        _detach(conn)
+
+
+def rebuild_rollups(conn, archive=None):
+    """
+    Recomputes the rollup tables from habit_log and the archived entries, in one transaction.
+
+    The rollups are kept up to date by the write helpers of the db module; rebuilding is only
+    needed for data written around them (e.g. with plain SQL). Like the rollups maintained on
+    every write, the rebuilt ones only count the habits' current logs (see current_log()).
+
+    :param conn: Connection to the main database, outside of any transaction
+    :param archive: Path of the archive database (default archive_path() of the connection's database)
+    """
+    with current_log(conn, archive) as log, db.transaction(conn):
+        cur = conn.cursor()
+        cur.execute("DELETE FROM main.habit_rollup")
+        cur.execute("DELETE FROM main.category_rollup")
+        db.fill_rollups(conn, log)
+
+
+def archived_log(conn, habit_name, archive=None) -> list:
+    """
+    Returns the archived log entries of a habit's current log, oldest first.
+
+    Entries that are still in habit_log as well (see archive_logs()) are left out.
+
+    :param conn: Connection to the main database, outside of any transaction
+    :param habit_name: Name of the habit
+    :param archive: Path of the archive database (default archive_path() of the connection's database)
+    :return: Returns the entries as records.LogEntry objects
+    """
+    archive = archive or archive_path(conn.path)
+    if not os.path.exists(archive):
+        return []
+    _attach(conn, archive)
+    try:
+        cur = conn.cursor()
+        cur.row_factory = records.log_rows
+        cur.execute(f"""
+            SELECT archived.habit, archived.completed, archived.streak, archived.completion_time
+            FROM {_SCHEMA}.habit_log AS archived
+            JOIN main.habit_tracker ON habit_tracker.habit = archived.habit
+                                   AND IFNULL(habit_tracker.log_generation, 0) = archived.log_generation
+            WHERE archived.habit = ?
+            EXCEPT
+            SELECT habit, completed, streak, completion_time FROM main.habit_log WHERE habit = ?
+            ORDER BY 4""", (habit_name, habit_name))
+        return cur.fetchall()
+    finally:
+        _detach(conn)
@@ -0,0 +1,392 @@
+"""
+The server module: Serves the habit tracker as a local HTTP/JSON service.
+
+Endpoints (all bodies and responses are JSON):
+
+    GET    /habits[?periodicity=daily]        list habits
+    POST   /habits                            add a habit: {"habit", "periodicity", "category"}
+    PATCH  /habits/<name>                     change the periodicity: {"periodicity"}
+    DELETE /habits/<name>                     remove a habit
+    POST   /habits/<name>/completions         mark a habit as completed: {"time"} is optional
+    POST   /completions                       mark many habits: [{"habit", "time"}, ...]
+    GET    /streaks[?habit=<name>]            current and longest streaks
+    GET    /habits/<name>/log[?start=&end=]   log of a habit
+
+Reads borrow a connection from a fixed pool, so connections persist across requests. Completion
+writes from all request threads are handed to a single writer thread, which applies whatever
+has queued up with one habit.mark_completed_many() call: many concurrent completions share one
+transaction and one commit (group commit) instead of contending for the database lock.
+"""
+
+import json
+import queue
+import re
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import analytics
+import db
+import habit
+import timestamps
+
+HOST = "127.0.0.1"
+PORT = 8080
+
+# Connections kept open for reads and single-habit writes
+POOL_SIZE = 8
+
+# Most completions applied in one group commit, and seconds the writer waits for more to arrive
+MAX_BATCH = 256
+MAX_DELAY = 0.001
+
+
+class ConnectionPool:
+    """
+    Fixed set of connections in concurrency mode, shared by the request threads.
+    """
+
+    def __init__(self, database, size=POOL_SIZE):
+        self._idle = queue.LifoQueue()
+        self._all = []
+        for _ in range(size):
+            conn = db.connect_database(database, check_same_thread=False, concurrent=True)
+            self._all.append(conn)
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows an idle connection for the duration of a with block, waiting if none is idle.
+        """
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        for conn in self._all:
+            conn.close()
+
+
+class _Pending:
+    """
+    Completions submitted by one request, waiting for the writer thread.
+    """
+
+    def __init__(self, completions):
+        self.completions = completions
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class CompletionBatcher:
+    """
+    Writer thread that applies queued completions in group commits.
+    """
+
+    def __init__(self, database, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.commits = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="completion-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, completions) -> list:
+        """
+        Queues completions and waits until they are committed.
+
+        :param completions: List of (habit name, timestamp) pairs
+        :return: List of (habit name, outcome, streak) tuples, as habit.mark_completed_many()
+        """
+        pending = _Pending(completions)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.results
+
+    def _next_batch(self):
+        """
+        Blocks for the first pending request, then collects whatever else arrives shortly after.
+
+        :return: List of _Pending, or None once close() was called
+        """
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch, count = [first], len(first.completions)
+        while count < self.max_batch:
+            try:
+                pending = self._queue.get(timeout=self.max_delay) if self.max_delay else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is None:
+                self._queue.put(None)  # stop after this batch
+                break
+            batch.append(pending)
+            count += len(pending.completions)
+        return batch
+
+    def _run(self):
+        conn = db.connect_database(self.database, concurrent=True)
+        try:
+            while (batch := self._next_batch()) is not None:
+                completions = [completion for pending in batch for completion in pending.completions]
+                try:
+                    results = habit.mark_completed_many(conn, completions)
+                except Exception as error:
+                    if len(batch) == 1:
+                        batch[0].error = error
+                    else:
+                        # The group commit was rolled back: retry the requests one by one, so only
+                        # the request that caused the error fails
+                        for pending in batch:
+                            self._apply(conn, pending)
+                else:
+                    self.commits += 1
+                    start = 0
+                    for pending in batch:
+                        pending.results = results[start:start + len(pending.completions)]
+                        start += len(pending.completions)
+                for pending in batch:
+                    pending.done.set()
+        finally:
+            conn.close()
+
+    def _apply(self, conn, pending):
+        """
+        Commits the completions of a single request, recording its results or its error.
+        """
+        try:
+            pending.results = habit.mark_completed_many(conn, pending.completions)
+        except Exception as error:
+            pending.error = error
+        else:
+            self.commits += 1
+
+    def close(self):
+        """
+        Finishes the queued completions and stops the writer thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+
+class HttpError(Exception):
+    """
+    Error answered with an HTTP status code and a JSON message.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _completion_dict(result):
+    name, outcome, streak = result
+    return {"habit": name, "outcome": outcome, "streak": streak}
+
+
+class HabitRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes the JSON endpoints to the habit and analytics functions.
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients reuse their TCP connection
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    # (method, path pattern, handler method name)
+    ROUTES = (
+        ("GET", re.compile(r"/habits"), "list_habits"),
+        ("POST", re.compile(r"/habits"), "add_habit"),
+        ("PATCH", re.compile(r"/habits/([^/]+)"), "change_periodicity"),
+        ("DELETE", re.compile(r"/habits/([^/]+)"), "remove_habit"),
+        ("POST", re.compile(r"/habits/([^/]+)/completions"), "complete_habit"),
+        ("POST", re.compile(r"/completions"), "complete_many"),
+        ("GET", re.compile(r"/streaks"), "streaks"),
+        ("GET", re.compile(r"/habits/([^/]+)/log"), "habit_log"),
+    )
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            for route_method, pattern, name in self.ROUTES:
+                match = pattern.fullmatch(url.path)
+                if match and route_method == method:
+                    status, body = getattr(self, name)(*(unquote(group) for group in match.groups()))
+                    break
+            else:
+                raise HttpError(404, f"No endpoint {method} {url.path}")
+        except HttpError as error:
+            status, body = error.status, {"error": str(error)}
+        except Exception as error:  # keep serving; the client gets the reason
+            self.log_error("%s %s failed: %r", method, url.path, error)
+            status, body = 500, {"error": repr(error)}
+        self._send(status, body)
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length == 0:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            raise HttpError(400, "Request body is not valid JSON")
+
+    def _field(self, body, name, convert=str, required=True):
+        value = body.get(name) if isinstance(body, dict) else None
+        if value is None:
+            if required:
+                raise HttpError(400, f"Missing field '{name}'")
+            return None
+        try:
+            return convert(value)
+        except (TypeError, ValueError):
+            raise HttpError(400, f"Invalid field '{name}'")
+
+    def _time(self, body):
+        time = self._field(body, "time", int, required=False)
+        return timestamps.now() if time is None else time
+
+    def _periodicity(self, body):
+        periodicity = self._field(body, "periodicity")
+        if periodicity not in timestamps.PERIODICITIES:
+            raise HttpError(400, f"Periodicity must be one of {', '.join(timestamps.PERIODICITIES)}")
+        return periodicity
+
+    def list_habits(self):
+        periodicity = self.query.get("periodicity")
+        with self.server.pool.connection() as conn:
+            if periodicity is None:
+                rows = analytics.data_of_all_habits(conn)
+            else:
+                rows = analytics.data_of_custom_periodicity_habits(conn, periodicity)
+        return 200, [analytics.habit_dict(row) for row in rows]
+
+    def add_habit(self):
+        body = self._body()
+        name, periodicity = self._field(body, "habit"), self._periodicity(body)
+        category = self._field(body, "category")
+        with self.server.pool.connection() as conn:
+            if not habit.add_habit(conn, name, periodicity, category, self._time(body)):
+                raise HttpError(409, f"Habit '{name}' already exists")
+        return 201, {"habit": name}
+
+    def change_periodicity(self, name):
+        body = self._body()
+        with self.server.pool.connection() as conn:
+            if not habit.change_periodicity(conn, name, self._periodicity(body), self._time(body)):
+                raise HttpError(404, f"No habit '{name}'")
+        return 200, {"habit": name}
+
+    def remove_habit(self, name):
+        with self.server.pool.connection() as conn:
+            if not habit.remove_habit(conn, name):
+                raise HttpError(404, f"No habit '{name}'")
+        return 200, {"habit": name}
+
+    def complete_habit(self, name):
+        result = self.server.batcher.submit([(name, self._time(self._body()))])[0]
+        if result[1] == habit.UNKNOWN_HABIT:
+            raise HttpError(404, f"No habit '{name}'")
+        return 200, _completion_dict(result)
+
+    def complete_many(self):
+        body = self._body()
+        if not isinstance(body, list):
+            raise HttpError(400, "Expected a list of completions")
+        completions = [(self._field(item, "habit"), self._time(item)) for item in body]
+        return 200, [_completion_dict(result) for result in self.server.batcher.submit(completions)]
+
+    def streaks(self):
+        with self.server.pool.connection() as conn:
+            rows = analytics.habit_streak_overview(conn, self.query.get("habit"))
+        return 200, [analytics.streak_dict(row) for row in rows]
+
+    def habit_log(self, name):
+        start = self._field(self.query, "start", int, required=False)
+        end = self._field(self.query, "end", int, required=False)
+        with self.server.pool.connection() as conn:
+            rows = [row for page in analytics.iter_habit_log(conn, name, start=start, end=end) for row in page]
+        return 200, [analytics.log_dict(row) for row in rows]
+
+
+class HabitServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server owning the connection pool and the completion writer.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=(HOST, PORT), database="main.db", pool_size=POOL_SIZE,
+                 max_batch=MAX_BATCH, max_delay=MAX_DELAY, quiet=True):
+        """
+        :param address: (host, port) to listen on; port 0 picks a free port
+        :param database: Database to serve (default main.db)
+        :param pool_size: Number of pooled connections (default POOL_SIZE)
+        :param max_batch: Most completions per group commit (default MAX_BATCH)
+        :param max_delay: Seconds the writer waits for further completions (default MAX_DELAY)
+        :param quiet: Whether to suppress the request log on stderr (default True)
+        """
+        super().__init__(address, HabitRequestHandler)
+        self.pool = ConnectionPool(database, pool_size)
+        self.batcher = CompletionBatcher(database, max_batch, max_delay)
+        self.quiet = quiet
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+        self.pool.close()
+
+
+def serve(database="main.db", host=HOST, port=PORT, **options):
+    """
+    Runs the service until interrupted with Ctrl+C.
+
+    :param database: Database to serve (default main.db)
+    :param host: Address to listen on (default HOST)
+    :param port: Port to listen on (default PORT)
+    :param options: Further HabitServer options
+    """
+    with HabitServer((host, port), database, **options) as server:
+        print(f"Serving {database} on {server.url} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,87 @@
+"""
+The shards module: Routes every user of the habit tracker to a database file of their own.
+
+Each user's habits, logs and statistics live in <shard directory>/<user>.db, so users never
+contend on the same file lock and no query can ever read another user's rows. Without a user
+the single database given by the caller (main.db by default) is used as before.
+"""
+
+import os
+import re
+
+import db
+
+# Directory holding one database per user, see set_shard_directory()
+SHARD_DIRECTORY = os.environ.get("HABIT_TRACKER_SHARDS", "shards")
+
+# User names become file names, so only a safe subset of characters is accepted
+_USER_NAME = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}")
+
+
+def set_shard_directory(path):
+    """
+    Changes the directory the user databases are kept in.
+
+    :param path: Directory of the user databases, created on first use
+    """
+    global SHARD_DIRECTORY
+    SHARD_DIRECTORY = path
+
+
+def shard_path(user) -> str:
+    """
+    Returns the database file of a user.
+
+    :param user: Name of the user, letters, digits, '_', '-' and '.' (not leading) only
+    :return: Path of the user's database inside SHARD_DIRECTORY
+    :raises ValueError: If the user name cannot be used as a file name
+    """
+    if not isinstance(user, str) or not _USER_NAME.fullmatch(user):
+        raise ValueError(f"Invalid user name: {user!r}")
+    return os.path.join(SHARD_DIRECTORY, f"{user.lower()}.db")
+
+
+def database_for(user=None, database="main.db") -> str:
+    """
+    Resolves the database to use for a user, creating the shard directory when needed.
+
+    :param user: Name of the user, or None for the shared single-user database
+    :param database: Database to use when no user is given (default main.db)
+    :return: Returns the database name to pass to db.get_connection()
+    """
+    if user is None:
+        return database
+    path = shard_path(user)
+    os.makedirs(SHARD_DIRECTORY, exist_ok=True)
+    return path
+
+
+def connection(user):
+    """
+    Returns the calling thread's shared connection to a user's database.
+
+    :param user: Name of the user
+    :return: Returns the shared database connection
+    """
+    return db.get_connection(database_for(user))
+
+
+def users() -> list:
+    """
+    Lists the users that have a database in the shard directory.
+
+    :return: Returns the sorted list of user names
+    """
+    if not os.path.isdir(SHARD_DIRECTORY):
+        return []
+    return sorted(name[:-3] for name in os.listdir(SHARD_DIRECTORY)
+                  if name.endswith(".db") and _USER_NAME.fullmatch(name[:-3]))
+
+
+def close_user(user):
+    """
+    Closes every shared connection to a user's database.
+
+    :param user: Name of the user
+    """
+    db.close_connection(shard_path(user))
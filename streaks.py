@@ -0,0 +1,152 @@
+"""
+The streaks module: Recomputes every habit's streaks from its log with vectorized NumPy passes.
+
+Streaks are otherwise only kept as the running counter in habit_tracker.streak. This engine
+rebuilds them from the completions in habit_log and its archive for all habits at once: each completion is
+bucketed into its period (day, ISO week or month, following the habit's periodicity), and runs
+of consecutive periods are found with array operations instead of a Python loop per row.
+It serves as a fast bulk analytics path and as a consistency check of the stored counters.
+
+Requires NumPy (pip install numpy).
+"""
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+import retention
+import timestamps
+
+# Completions are log rows with a positive streak: added habits and periodicity changes log 0.
+# {log} is the log including the archived entries (see retention.current_log)
+COMPLETIONS_QUERY = """
+    SELECT habit_log.habit, habit_tracker.periodicity, habit_log.completion_time
+    FROM {log} AS habit_log JOIN habit_tracker ON habit_tracker.habit = habit_log.habit
+    WHERE habit_log.streak > 0 AND habit_log.completion_time IS NOT NULL
+    ORDER BY habit_log.habit, habit_log.completion_time"""
+
+
+def local_days(times):
+    """
+    Converts timestamps to local day numbers (days since 1970-01-01), honouring DST changes.
+
+    The UTC offset is looked up once per distinct hour rather than once per timestamp.
+
+    :param times: Array of timestamps
+    :return: Array of day numbers, int64
+    """
+    times = np.asarray(times, dtype=np.int64)
+    hours, inverse = np.unique(times // 3600, return_inverse=True)
+    offsets = np.array([datetime.fromtimestamp(int(hour) * 3600, timezone.utc).astimezone().utcoffset()
+                        .total_seconds() for hour in hours], dtype=np.int64)
+    return (times + offsets[inverse]) // 86400
+
+
+def period_numbers(days, periodicity_codes):
+    """
+    Buckets day numbers into the period numbers of each row's periodicity, the same numbers that
+    timestamps.period_ordinal() gives and habit_log stores.
+
+    :param days: Array of local day numbers (days since 1970-01-01)
+    :param periodicity_codes: Array of indexes into timestamps.PERIODICITIES, one per day
+    :return: Array of period numbers; consecutive periods differ by exactly 1
+    """
+    days = np.asarray(days, dtype=np.int64)
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)  # since 1970-01
+    ordinals = days + timestamps.EPOCH_ORDINAL
+    return np.choose(np.asarray(periodicity_codes),
+                     [ordinals, timestamps.week_ordinal(ordinals),
+                      timestamps.month_ordinal(1970 + months // 12, months % 12 + 1)])
+
+
+def streak_runs(habit_codes, periods):
+    """
+    Finds the runs of consecutive periods of every habit.
+
+    :param habit_codes: Array of habit codes, sorted
+    :param periods: Array of period numbers, sorted within each habit
+    :return: Tuple of arrays (run habit code, first period, last period, length), one entry per run,
+        ordered by habit and period
+    """
+    habit_codes = np.asarray(habit_codes)
+    periods = np.asarray(periods, dtype=np.int64)
+    if len(periods) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty, empty
+    # Several completions in one period count once
+    new_habit = np.r_[True, habit_codes[1:] != habit_codes[:-1]]
+    keep = new_habit | np.r_[True, periods[1:] != periods[:-1]]
+    habit_codes, periods, new_habit = habit_codes[keep], periods[keep], new_habit[keep]
+
+    new_run = new_habit | np.r_[True, np.diff(periods) != 1]
+    starts = np.flatnonzero(new_run)
+    ends = np.r_[starts[1:], len(periods)] - 1
+    return habit_codes[starts], periods[starts], periods[ends], ends - starts + 1
+
+
+def compute_streaks(conn, now=None):
+    """
+    Recomputes the streaks of every habit from its completions in habit_log and the archive.
+
+    Habits with a periodicity other than daily, weekly or monthly have no periods to count and are
+    left out.
+
+    :param conn: To maintain connection with the database, outside of any transaction
+    :param now: Timestamp to evaluate current streaks at (default is now)
+    :return: Dict mapping habit name to a dict with 'current' (0 once a period has been missed),
+        'last_run' (length of the latest run, which the stored counter tracks), 'longest' and
+        'runs' (list of (first period, length) tuples)
+    """
+    with retention.current_log(conn) as log:
+        rows = [row for row in conn.execute(COMPLETIONS_QUERY.format(log=log))
+                if row[1] in timestamps.PERIODICITIES]
+    if not rows:
+        return {}
+    names, habit_codes = np.unique(np.array([row[0] for row in rows]), return_inverse=True)
+    periodicity_codes = np.array([timestamps.PERIODICITIES.index(row[1]) for row in rows])
+    periods = period_numbers(local_days([row[2] for row in rows]), periodicity_codes)
+    run_habits, run_firsts, run_lasts, run_lengths = streak_runs(habit_codes, periods)
+
+    # Current period of each habit, to tell whether its latest run is still alive
+    today = local_days([timestamps.now() if now is None else now])
+    habit_periodicity = np.zeros(len(names), dtype=np.int64)
+    habit_periodicity[habit_codes] = periodicity_codes
+    current_periods = period_numbers(np.repeat(today, len(names)), habit_periodicity)
+
+    first_runs = np.flatnonzero(np.r_[True, run_habits[1:] != run_habits[:-1]])
+    last_runs = np.r_[first_runs[1:], len(run_habits)] - 1
+    longest = np.maximum.reduceat(run_lengths, first_runs)
+    alive = run_lasts[last_runs] >= current_periods[run_habits[last_runs]] - 1
+    current = np.where(alive, run_lengths[last_runs], 0)
+
+    result = {}
+    for index, code in enumerate(run_habits[first_runs]):
+        runs = slice(first_runs[index], last_runs[index] + 1)
+        result[str(names[code])] = {
+            "current": int(current[index]),
+            "last_run": int(run_lengths[last_runs[index]]),
+            "longest": int(longest[index]),
+            "runs": list(zip(run_firsts[runs].tolist(), run_lengths[runs].tolist())),
+        }
+    return result
+
+
+def check_stored_streaks(conn):
+    """
+    Compares the stored streak counters with the streaks recomputed from the log.
+
+    :param conn: To maintain connection with the database
+    :return: List of (habit name, stored streak, recomputed streak) tuples for every mismatch; the
+        recomputed streak is None for a habit with an unknown periodicity
+    """
+    recomputed = compute_streaks(conn)
+    mismatches = []
+    query = "SELECT habit, streak, periodicity FROM habit_tracker ORDER BY habit"
+    for name, stored, periodicity in conn.execute(query):
+        if periodicity not in timestamps.PERIODICITIES:
+            expected = None
+        else:
+            expected = recomputed[name]["last_run"] if name in recomputed else 0
+        if stored != expected:
+            mismatches.append((name, stored, expected))
+    return mismatches
@@ -0,0 +1,50 @@
+"""
+Shared fixtures: a fresh database per test, filled by the test module's own data.
+
+A test module that needs data in its database defines populate(db); the db fixture calls it
+on the new database before the test runs.
+"""
+
+import pytest
+
+from db import connect_database
+
+
+@pytest.fixture
+def database_path(request, tmp_path):
+    """
+    Path of the test's database, named after the test module, e.g. test_cache.db.
+    """
+    return str(tmp_path / f"{request.module.__name__.rpartition('.')[2]}.db")
+
+
+@pytest.fixture
+def open_database(tmp_path):
+    """
+    Opens further databases in the test's directory; all of them are closed after the test.
+    """
+    opened = []
+
+    def open_database(name, populate=None):
+        db = connect_database(str(tmp_path / name))
+        opened.append(db)
+        if populate is not None:
+            populate(db)
+        return db
+
+    yield open_database
+    for db in opened:
+        db.close()
+
+
+@pytest.fixture
+def db(request, database_path):
+    """
+    Connection to the test's database, filled by the module's populate(db) if it has one.
+    """
+    db = connect_database(database_path)
+    populate = getattr(request.module, "populate", None)
+    if populate is not None:
+        populate(db)
+    yield db
+    db.close()
@@ -0,0 +1,58 @@
+from analytics import habit_log, habit_log_between, habit_streak_overview, iter_habit_log, longest_habit_streak
+from db import add_habit, reset_logs, update_log, update_logs_many
+from timestamps import days_ago, from_text, period_ordinal
+
+
+def populate(db):
+    add_habit(db, "coding", "daily", "career", from_text("01/01/2022 13:00"), 0)
+    for day in range(1, 11):
+        update_log(db, "coding", True, day, from_text(f"01/{day:02}/2022 13:00"))
+
+
+def test_habit_log_between(db):
+    rows = habit_log_between(db, "coding", from_text("01/03/2022 00:00"), from_text("01/06/2022 00:00"))
+    assert [row[2] for row in rows] == [3, 4, 5]
+
+
+def test_habit_log_between_open_ended(db):
+    start = days_ago(2, from_text("01/10/2022 13:00"))
+    assert [row[2] for row in habit_log_between(db, "coding", start)] == [8, 9, 10]
+
+
+def test_longest_habit_streak(db):
+    assert longest_habit_streak(db, "coding") == 10
+    update_logs_many(db, [("coding", False, 1, from_text("01/12/2022 13:00")),
+                          ("coding", True, 11, from_text("01/13/2022 13:00"))])
+    assert longest_habit_streak(db, "coding") == 11
+    reset_logs(db, "coding")
+    assert longest_habit_streak(db, "coding") == 0
+
+
+def test_habit_streak_overview(db):
+    add_habit(db, "hiking", "monthly", "fun", from_text("01/01/2022 13:00"), 0)
+    rows = {row[0]: row for row in habit_streak_overview(db)}
+    assert rows["coding"][4:] == (10, 10, period_ordinal("daily", from_text("01/10/2022 13:00")))
+    assert rows["hiking"][4:] == (0, 0, None)
+    assert habit_streak_overview(db, "hiking") == [rows["hiking"]]
+
+
+def test_iter_habit_log_pages(db):
+    update_log(db, "coding", True, 11, from_text("01/10/2022 13:00"))  # same time as day 10, ordered by rowid
+    pages = list(iter_habit_log(db, "coding", page_size=4))
+    assert [len(page) for page in pages] == [4, 4, 3]
+    assert [row[2] for page in pages for row in page] == list(range(1, 12))
+    assert habit_log(db, "coding") == [row for page in pages for row in page]
+
+
+def test_iter_habit_log_newest_first_in_range(db):
+    pages = iter_habit_log(db, "coding", page_size=2, start=from_text("01/05/2022 00:00"),
+                           end=from_text("01/09/2022 00:00"), newest_first=True)
+    assert [[row[2] for row in page] for page in pages] == [[8, 7], [6, 5]]
+
+
+def test_iter_habit_log_is_lazy(db):
+    statements = []
+    db.set_trace_callback(statements.append)
+    pages = iter_habit_log(db, "coding", page_size=3)
+    assert next(pages) and len(statements) == 1
+    db.set_trace_callback(None)
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from async_store import AsyncHabitStore
+from habit import ALREADY_COMPLETED, CONTINUED
+from timestamps import from_text
+
+
+def test_operations_return_data(tmp_path):
+    async def scenario():
+        async with AsyncHabitStore(str(tmp_path / "test_async.db")) as store:
+            assert await store.add("reading", "daily", "knowledge", from_text("01/01/2022 08:00"))
+            assert not await store.add("reading", "daily", "knowledge")
+            first = await store.complete("reading", from_text("01/02/2022 08:00"))
+            again = await store.complete("reading", from_text("01/02/2022 20:00"))
+            many = await store.complete_many([("reading", from_text("01/03/2022 08:00")), ("gym", 0)])
+            return first, again, many, await store.habits("daily"), await store.streaks(), \
+                await store.log("reading", start=from_text("01/02/2022 00:00")), await store.longest_streak("reading")
+
+    first, again, many, habits, streaks, log, longest = asyncio.run(scenario())
+    assert first == {"habit": "reading", "periodicity": "daily", "outcome": CONTINUED, "streak": 1}
+    assert again["outcome"] == ALREADY_COMPLETED
+    assert [result["streak"] for result in many] == [2, None]
+    assert [row["habit"] for row in habits] == ["reading"]
+    assert streaks[0]["longest_streak"] == longest == 2
+    assert [(entry["completed"], entry["streak"]) for entry in log] == [(True, 1), (True, 2)]
+
+
+def test_change_periodicity_and_remove(tmp_path):
+    async def scenario():
+        async with AsyncHabitStore(str(tmp_path / "test_async.db")) as store:
+            await store.add("reading", "daily", "knowledge")
+            changed = await store.change_periodicity("reading", "weekly")
+            habits = await store.habits("weekly")
+            return changed, habits, await store.remove("reading"), await store.remove("reading")
+
+    changed, habits, removed, removed_again = asyncio.run(scenario())
+    assert changed and [row["habit"] for row in habits] == ["reading"]
+    assert removed and not removed_again
+
+
+def test_concurrent_requests_overlap(tmp_path):
+    def slow_query(conn):
+        time.sleep(0.2)
+        return conn.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0]
+
+    async def scenario():
+        async with AsyncHabitStore(str(tmp_path / "test_async.db"), workers=4) as store:
+            started = time.perf_counter()
+            results = await asyncio.gather(*(store.run(slow_query) for _ in range(4)))
+            return results, time.perf_counter() - started, len(store._connections)
+
+    results, elapsed, connections = asyncio.run(scenario())
+    assert results == [0, 0, 0, 0]
+    assert elapsed < 0.6
+    assert connections == 4
+
+
+def test_concurrent_completions(tmp_path):
+    names = [f"habit{number}" for number in range(8)]
+
+    async def scenario():
+        async with AsyncHabitStore(str(tmp_path / "test_async.db")) as store:
+            await asyncio.gather(*(store.add(name, "daily", "test", 0) for name in names))
+            for day in range(1, 6):
+                await asyncio.gather(*(store.complete(name, from_text(f"01/{day:02d}/2022 12:00"))
+                                       for name in names))
+            return await store.streaks()
+
+    assert [row["streak"] for row in asyncio.run(scenario())] == [5] * len(names)
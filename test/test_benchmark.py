@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import benchmark
+from db import close_connection, connect_database
+from timestamps import from_text, period_ordinal
+
+
+@pytest.fixture(scope="module")
+def bench_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("bench") / "test_bench.db")
+    counts = benchmark.generate_database(path, habits=30, categories=4, years=1)
+    yield path, counts
+    close_connection(path)
+
+
+def test_generated_history_is_consistent(bench_db):
+    path, counts = bench_db
+    conn = connect_database(path)
+    assert conn.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0] == counts["habits"] == 30
+    assert conn.execute("SELECT COUNT(*) FROM habit_log").fetchone()[0] == counts["log_rows"] > 30 * 12
+    assert conn.execute("SELECT COUNT(DISTINCT category) FROM habit_tracker").fetchone()[0] == 4
+    # The stored streak is the streak of the latest log entry of every habit
+    mismatches = conn.execute("""
+        SELECT COUNT(*) FROM habit_tracker WHERE streak != (
+            SELECT streak FROM habit_log WHERE habit_log.habit = habit_tracker.habit
+            ORDER BY completion_time DESC LIMIT 1)""").fetchone()[0]
+    assert mismatches == 0
+    assert conn.execute("SELECT SUM(completion_count) FROM habit_stats").fetchone()[0] == \
+        conn.execute("SELECT COUNT(*) FROM habit_log WHERE streak > 0").fetchone()[0]
+    conn.close()
+
+
+def test_period_buckets_follow_the_stored_ordinals():
+    times = [from_text("12/20/2021 00:00") + day * 86400 for day in range(60)]
+    for periodicity, groups in benchmark._period_buckets(times).items():
+        ordinals = [{period_ordinal(periodicity, times[index]) for index in group} for group in groups]
+        assert all(len(numbers) == 1 for numbers in ordinals)
+        firsts = [min(numbers) for numbers in ordinals]
+        assert firsts == list(range(firsts[0], firsts[0] + len(firsts)))
+
+
+def test_benchmarks_leave_the_database_unchanged(bench_db):
+    path, counts = bench_db
+    results = benchmark.run_benchmarks(path, repeat=1)
+    assert set(results["results"]) == set(benchmark.BENCHMARKS)
+    assert results["meta"]["log_rows"] == counts["log_rows"]
+    conn = connect_database(path)
+    assert conn.execute("SELECT COUNT(*) FROM habit_log").fetchone()[0] == counts["log_rows"]
+    assert conn.execute("SELECT COUNT(*) FROM habit_tracker WHERE habit LIKE 'benchmark%'").fetchone()[0] == 0
+    conn.close()
+
+
+def test_compare_finds_regressions():
+    baseline = {"results": {"fast": {"median_ms": 1.0}, "steady": {"median_ms": 2.0}, "tiny": {"median_ms": 0.01}}}
+    results = {"results": {"fast": {"median_ms": 1.5}, "steady": {"median_ms": 2.1}, "tiny": {"median_ms": 0.03},
+                           "new": {"median_ms": 9.0}}}
+    assert benchmark.compare(results, baseline) == [("fast", 1.0, 1.5, 1.5)]
+
+
+def test_command_line_baseline(bench_db, tmp_path, capsys):
+    path, _ = bench_db
+    baseline = str(tmp_path / "baseline.json")
+    assert benchmark.main(["run", path, "--repeat", "1", "--only", "db.habit_exists",
+                           "--save-baseline", baseline]) == 0
+    with open(baseline, encoding="utf-8") as file:
+        assert list(json.load(file)["results"]) == ["db.habit_exists"]
+    assert benchmark.main(["run", path, "--repeat", "1", "--only", "db.habit_exists", "--baseline", baseline,
+                           "--threshold", "1000"]) == 0
+    assert "db.habit_exists" in capsys.readouterr().out
@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+import cache
+from db import add_habit, connect_database, remove_habit, transaction
+
+
+def populate(db):
+    add_habit(db, "coding", "daily", "career", 0, 0)
+    add_habit(db, "study", "daily", "career", 0, 0)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    yield
+    cache.clear()
+
+
+def test_repeated_lookups_skip_the_database(db):
+    assert cache.categories(db) == ["Career"]
+    statements = []
+    db.set_trace_callback(statements.append)
+    assert cache.categories(db) == ["Career"]
+    assert sorted(cache.habits_as_choices(db)) == ["Coding", "Study"]
+    assert sorted(cache.habits_as_choices(db)) == ["Coding", "Study"]
+    db.set_trace_callback(None)
+    assert len([statement for statement in statements if statement != "PRAGMA data_version"]) == 1
+
+
+def test_writes_invalidate_the_cache(db):
+    assert sorted(cache.habits_as_choices(db)) == ["Coding", "Study"]
+    remove_habit(db, "study")
+    assert cache.habits_as_choices(db) == ["Coding"]
+    add_habit(db, "gym", "daily", "health", 0, 0)
+    assert sorted(cache.categories(db)) == ["Career", "Health"]
+
+
+def test_writes_through_other_connections_invalidate_the_cache(db):
+    assert cache.categories(db) == ["Career"]
+    other = connect_database(db.path)
+    add_habit(other, "gym", "daily", "health", 0, 0)
+    other.close()
+    assert sorted(cache.categories(db)) == ["Career", "Health"]
+
+
+def test_writes_of_other_processes_invalidate_the_cache(db):
+    assert cache.categories(db) == ["Career"]
+    # A plain connection does not go through the db module, like a write from another process
+    other = sqlite3.connect(db.path)
+    other.execute("UPDATE habit_tracker SET category = 'work' WHERE habit = 'study'")
+    other.commit()
+    other.close()
+    assert sorted(cache.categories(db)) == ["Career", "Work"]
+
+
+def test_rolled_back_writes_invalidate_the_cache(db):
+    with pytest.raises(RuntimeError):
+        with transaction(db):
+            add_habit(db, "gym", "daily", "health", 0, 0)
+            assert sorted(cache.categories(db)) == ["Career", "Health"]
+            raise RuntimeError("write abandoned")
+    assert cache.categories(db) == ["Career"]
@@ -0,0 +1,94 @@
+import io
+import json
+
+import pytest
+
+import cli
+from db import close_all_connections
+
+
+@pytest.fixture
+def run(tmp_path, capsys, monkeypatch):
+    database = str(tmp_path / "test_cli.db")
+
+    def run(*argv, stdin=None):
+        if stdin is not None:
+            monkeypatch.setattr("sys.stdin", io.StringIO(stdin))
+        status = cli.main(["--database", database, *argv])
+        return status, [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+    yield run
+    close_all_connections()
+
+
+def test_batch_commands(run):
+    assert run("add", "Reading", "running", "--periodicity", "daily", "--category", "health",
+               "--time", "01/01/2022 08:00") == (0, [{"habit": "reading", "added": True},
+                                                     {"habit": "running", "added": True}])
+    status, output = run("add", "reading", "--periodicity", "daily", "--category", "health")
+    assert status == 1 and output == [{"habit": "reading", "added": False}]
+
+    status, output = run("complete", "-", "--time", "2022-01-02T09:00", stdin="reading\nrunning\n\n")
+    assert status == 0 and [result["streak"] for result in output] == [1, 1]
+    status, output = run("complete", "reading", "gym", "--time", "01/03/2022 09:00")
+    assert status == 1 and [result["outcome"] for result in output] == ["continued", "unknown habit"]
+
+    status, output = run("streaks")
+    assert [(row["habit"], row["streak"], row["longest_streak"]) for row in output] == \
+        [("reading", 2, 2), ("running", 1, 1)]
+    status, output = run("log", "reading", "--since", "01/02/2022 00:00")
+    assert [(entry["completed"], entry["streak"]) for entry in output] == [(True, 1), (True, 2)]
+
+    assert run("set-periodicity", "weekly", "running")[1] == [{"habit": "running", "changed": True}]
+    assert run("streaks", "running")[1][0]["periodicity"] == "weekly"
+    assert run("remove", "reading", "gym") == (1, [{"habit": "reading", "removed": True},
+                                                   {"habit": "gym", "removed": False}])
+    assert [row["habit"] for row in run("streaks")[1]] == ["running"]
+
+
+def test_time_zero_is_kept(run):
+    run("add", "reading", "--periodicity", "daily", "--category", "knowledge", "--time", "0")
+    run("complete", "reading", "--time", "0")
+    assert [entry["completion_time"] for entry in run("log", "reading")[1]] == [0, 0]
+
+
+def test_invalid_time_is_rejected(run):
+    with pytest.raises(SystemExit):
+        run("complete", "reading", "--time", "yesterday")
+
+
+def test_invalid_import_is_reported(run, tmp_path, capsys):
+    file = tmp_path / "habits.csv"
+    file.write_text("habit,periodicity,category,creation_time,streak,completion_time\nfoo,yearly,x,,0,\n")
+    assert cli.main(["--database", str(tmp_path / "test_cli.db"), "import", "habits", str(file)]) == 1
+    assert "Nothing imported into habits" in capsys.readouterr().err
+    assert run("streaks") == (0, [])
+
+
+def test_report_command(run):
+    run("add", "reading", "--periodicity", "daily", "--category", "knowledge", "--time", "01/01/2022 08:00")
+    run("complete", "reading", "--time", "01/01/2022 09:00")
+    run("complete", "reading", "--time", "01/02/2022 09:00")
+    status, output = run("report", "completion-rates", "--since", "01/01/2022 00:00", "--until", "01/05/2022 00:00")
+    assert status == 0 and (output[0]["habit"], output[0]["completion_rate"]) == ("reading", 0.5)
+    assert run("report", "category-streaks")[1][0]["longest_streak"] == 2
+
+
+def test_trend_and_rebuild_rollups(run):
+    run("add", "reading", "--periodicity", "daily", "--category", "knowledge", "--time", "01/01/2022 08:00")
+    run("complete", "reading", "--time", "01/01/2022 09:00")
+    run("complete", "reading", "--time", "01/02/2022 09:00")
+    assert run("trend", "monthly", "--category", "Knowledge") == (0, [{"period": "2022-01-01", "completions": 2}])
+    assert run("rebuild-rollups") == (0, [])
+    assert run("trend", "daily", "--habit", "reading", "--since", "01/02/2022 00:00")[1] == \
+        [{"period": "2022-01-02", "completions": 1}]
+
+
+def test_archive_command(run):
+    run("add", "reading", "--periodicity", "daily", "--category", "knowledge", "--time", "01/01/2022 08:00")
+    run("complete", "reading", "--time", "01/01/2022 09:00")
+    status, output = run("archive", "--horizon-days", "90")
+    assert status == 0 and output[0]["archived"] == 2 and output[0]["done"]
+    assert run("streaks", "reading")[1][0]["longest_streak"] == 1
+    with pytest.raises(SystemExit):
+        run("archive", "--horizon-days", "7")
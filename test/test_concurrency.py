@@ -0,0 +1,83 @@
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from db import add_habit, connect_database, get_connection, retry_on_busy, set_concurrent_mode, transaction
+from habit import complete_habit
+from timestamps import from_text
+
+HABITS = ("reading", "running", "coding")
+DAYS = 20
+PROCESSES = 6
+
+
+def _complete_all(path):
+    set_concurrent_mode()
+    conn = get_connection(path)
+    for day in range(1, DAYS + 1):
+        for name in HABITS:
+            complete_habit(conn, name, from_text(f"01/{day:02d}/2022 12:00"))
+
+
+def _complete_once(path):
+    set_concurrent_mode()
+    return complete_habit(get_connection(path), "reading", from_text("01/01/2022 12:00"))[1]
+
+
+@pytest.fixture
+def shared_db(database_path):
+    path = database_path
+    setup_db = connect_database(path, concurrent=True)
+    for name in HABITS:
+        add_habit(setup_db, name, "daily", "stress", from_text("12/31/2021 08:00"), 0)
+    setup_db.close()
+    return path
+
+
+def test_processes_completing_the_same_habits(shared_db):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(PROCESSES) as pool:
+        pool.map(_complete_all, [shared_db] * PROCESSES)
+
+    conn = connect_database(shared_db)
+    for name in HABITS:
+        assert conn.execute("SELECT streak FROM habit_tracker WHERE habit = ?", (name,)).fetchone()[0] == DAYS
+        streaks = [row[0] for row in conn.execute("SELECT streak FROM habit_log WHERE habit = ? AND streak > 0",
+                                                  (name,))]
+        assert sorted(streaks) == list(range(1, DAYS + 1))
+        assert conn.execute("SELECT completion_count, longest_streak FROM habit_stats WHERE habit = ?",
+                            (name,)).fetchone() == (DAYS, DAYS)
+    conn.close()
+
+
+def test_only_one_process_completes_a_period(shared_db):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(PROCESSES) as pool:
+        outcomes = pool.map(_complete_once, [shared_db] * PROCESSES)
+    assert outcomes.count("continued") == 1
+    assert outcomes.count("already completed") == PROCESSES - 1
+
+
+def test_retry_on_busy(shared_db):
+    writer = connect_database(shared_db, concurrent=True)
+    blocked = connect_database(shared_db, concurrent=True)
+    blocked.execute("PRAGMA busy_timeout = 0")
+    writer.execute("BEGIN IMMEDIATE")
+    calls = []
+
+    def write():
+        calls.append(1)
+        if len(calls) == 3:
+            writer.rollback()
+        with transaction(blocked):
+            blocked.execute("UPDATE habit_tracker SET streak = 5 WHERE habit = 'reading'")
+
+    retry_on_busy(write, delay=0)
+    assert len(calls) == 3
+    with pytest.raises(sqlite3.OperationalError):
+        writer.execute("BEGIN IMMEDIATE")
+        retry_on_busy(write, attempts=2, delay=0)
+    writer.rollback()
+    writer.close()
+    blocked.close()
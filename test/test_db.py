@@ -1,5 +1,13 @@
+import sqlite3
+import threading
+
+import pytest
+
+import db
+from timestamps import from_text
 from db import add_habit, connect_database, fetch_habits_as_choices, habit_exists, remove_habit, \
-    fetch_categories, update_periodicity, fetch_habit_periodicity, update_habit_streak, get_streak_count
+    fetch_categories, update_periodicity, fetch_habit_periodicity, update_habit_streak, get_streak_count, \
+    get_connection, close_connection, connection, transaction, update_log, delete_category
 
 
 class TestDatabase:
@@ -10,12 +18,12 @@ class TestDatabase:
     def setup_method(self):
         self.db = connect_database("test_db.db")
         # Total 6 habits and 4 categories (3 career = only 1 category, 1 atmosphere, 1 growth and 1 games)
-        add_habit(self.db, "coding", "daily", "career", "01/01/2022 13:00", 0)
-        add_habit(self.db, "study", "daily", "career", "01/02/2022 13:00", 0)
-        add_habit(self.db, "gym", "daily", "career", "01/02/2022 13:00", 0)
-        add_habit(self.db, "cleaning", "weekly", "atmosphere", "02/01/2022 13:00", 0)
-        add_habit(self.db, "reflection", "monthly", "growth", "02/01/2022 13:00", 0)
-        add_habit(self.db, "gaming", "daily", "games", "01/01/2022 13:00", 0)
+        add_habit(self.db, "coding", "daily", "career", from_text("01/01/2022 13:00"), 0)
+        add_habit(self.db, "study", "daily", "career", from_text("01/02/2022 13:00"), 0)
+        add_habit(self.db, "gym", "daily", "career", from_text("01/02/2022 13:00"), 0)
+        add_habit(self.db, "cleaning", "weekly", "atmosphere", from_text("02/01/2022 13:00"), 0)
+        add_habit(self.db, "reflection", "monthly", "growth", from_text("02/01/2022 13:00"), 0)
+        add_habit(self.db, "gaming", "daily", "games", from_text("01/01/2022 13:00"), 0)
 
     def test_fetch_habits_as_choices(self):
         assert len(fetch_habits_as_choices(self.db)) == 6
@@ -33,9 +41,81 @@ class TestDatabase:
         assert fetch_habit_periodicity(self.db, "reflection") == "weekly"
 
     def test_update_habit_streak(self):
-        update_habit_streak(self.db, "coding", 1, "01/02/2022 13:00")
+        update_habit_streak(self.db, "coding", 1, from_text("01/02/2022 13:00"))
         assert get_streak_count(self.db, "coding") == 1
 
+    def test_delete_category_removes_logs_and_stats(self):
+        update_log(self.db, "coding", True, 1, from_text("01/02/2022 13:00"))
+        update_log(self.db, "gaming", True, 1, from_text("01/02/2022 13:00"))
+        delete_category(self.db, "career")
+        assert self.db.execute("SELECT habit FROM habit_log").fetchall() == [("gaming",)]
+        assert self.db.execute("SELECT habit FROM habit_stats").fetchall() == [("gaming",)]
+
+    def test_transaction_commits_once(self):
+        statements = []
+        self.db.set_trace_callback(statements.append)
+        with transaction(self.db):
+            update_habit_streak(self.db, "coding", 1, from_text("01/02/2022 13:00"))
+            update_log(self.db, "coding", True, 1, from_text("01/02/2022 13:00"))
+            update_periodicity(self.db, "coding", "weekly")
+        self.db.set_trace_callback(None)
+        assert statements.count("COMMIT") == 1
+
+    def test_transaction_rolls_back(self):
+        with pytest.raises(RuntimeError):
+            with transaction(self.db):
+                remove_habit(self.db, "gaming")
+                raise RuntimeError("crash between statements")
+        assert habit_exists(self.db, "gaming")
+
+    def test_nested_transaction_rolls_back_to_savepoint(self):
+        with transaction(self.db):
+            remove_habit(self.db, "gaming")
+            with pytest.raises(RuntimeError):
+                with transaction(self.db):
+                    remove_habit(self.db, "study")
+                    raise RuntimeError("inner unit of work failed")
+        assert habit_exists(self.db, "gaming") is False
+        assert habit_exists(self.db, "study")
+
+    def test_get_connection_is_shared(self):
+        shared = get_connection("test_db.db")
+        assert get_connection("test_db.db") is shared
+        assert habit_exists(shared, "coding")
+        close_connection("test_db.db")
+        with pytest.raises(sqlite3.ProgrammingError):
+            shared.cursor()
+        assert get_connection("test_db.db") is not shared
+        close_connection("test_db.db")
+
+    def test_get_connection_is_thread_local(self):
+        handles = []
+        worker = threading.Thread(target=lambda: handles.append(get_connection("test_db.db")))
+        worker.start()
+        worker.join()
+        assert handles[0] is not get_connection("test_db.db")
+        close_connection("test_db.db")
+
+    def test_finished_threads_close_their_connections(self):
+        handles = []
+        registries = len(db._registries)
+        for _ in range(5):
+            worker = threading.Thread(target=lambda: handles.append(get_connection("test_db.db")))
+            worker.start()
+            worker.join()
+        assert len(db._registries) == registries
+        for handle in handles:
+            with pytest.raises(sqlite3.ProgrammingError):
+                handle.cursor()
+
+    def test_connection_context_manager(self):
+        with connection("test_db.db") as outer:
+            with connection("test_db.db") as inner:
+                assert inner is outer
+            assert habit_exists(outer, "study")
+        with pytest.raises(sqlite3.ProgrammingError):
+            outer.cursor()
+
     def teardown_method(self):
         self.db.close()
         import os
@@ -1,7 +1,9 @@
 import pytest
-from habit import Habit
+from habit import Habit, mark_completed_many, ALREADY_COMPLETED, CONTINUED, RESET, UNKNOWN_HABIT
+from timestamps import from_text
 from db import add_habit, connect_database, fetch_habits_as_choices, habit_exists, remove_habit, \
-    fetch_categories, update_periodicity, fetch_habit_periodicity, update_habit_streak, get_streak_count
+    fetch_categories, update_periodicity, fetch_habit_periodicity, update_habit_streak, get_streak_count, \
+    close_connection, habit_completed_in_period
 from freezegun import freeze_time
 
 
@@ -15,6 +17,7 @@ def db():
     print('******TEARDOWN******')
     print("\nClosing connection with test database...\n")
     db.close()
+    close_connection("test_habit.db")
     print("Connection successfully terminated!")
     import os
     os.remove("test_habit.db")
@@ -132,3 +135,59 @@ def test_mark_habit6_as_completed_month_later(db):
     habit6 = Habit("guitar", "monthly", "music", database="test_habit.db")
     habit6.mark_as_completed()
     assert get_streak_count(db, "guitar") == 2
+
+
+def test_mark_completed_many(open_database):
+    bulk_db = open_database("test_bulk.db")
+    add_habit(bulk_db, "reading", "daily", "knowledge", from_text("01/01/2022 08:00"), 0)
+    add_habit(bulk_db, "running", "weekly", "health", from_text("01/01/2022 08:00"), 0)
+    results = mark_completed_many(bulk_db, [
+        ("reading", from_text("01/02/2022 09:00")),
+        ("reading", from_text("01/01/2022 09:00")),
+        ("reading", from_text("01/02/2022 21:00")),
+        ("reading", from_text("01/05/2022 09:00")),
+        ("running", from_text("01/01/2022 09:00")),
+        ("swimming", from_text("01/01/2022 09:00")),
+    ])
+    assert results == [
+        ("reading", CONTINUED, 2),
+        ("reading", CONTINUED, 1),
+        ("reading", ALREADY_COMPLETED, 2),
+        ("reading", RESET, 1),
+        ("running", CONTINUED, 1),
+        ("swimming", UNKNOWN_HABIT, None),
+    ]
+    assert get_streak_count(bulk_db, "reading") == 1
+    assert get_streak_count(bulk_db, "running") == 1
+    assert bulk_db.execute("SELECT COUNT(*) FROM habit_log").fetchone()[0] == 4
+
+
+def test_mark_as_completed_reads_state_once(open_database):
+    setup_db = open_database("test_single_fetch.db")
+    add_habit(setup_db, "reading", "daily", "knowledge", from_text("01/01/2022 08:00"), 0)
+    path = setup_db.path
+    habit = Habit("reading", database=path)
+    statements = []
+    habit.db.set_trace_callback(statements.append)
+    habit.mark_as_completed()
+    habit.db.set_trace_callback(None)
+    close_connection(path)
+    verbs = [s.split()[0] for s in statements]
+    assert verbs.count("SELECT") == 1
+    assert verbs.count("UPDATE") == 1
+    assert statements.count("COMMIT") == 1
+
+
+@pytest.mark.parametrize("periodicity,first,second,outcome", [
+    ("monthly", "12/20/2021 09:00", "01/03/2022 09:00", CONTINUED),  # across the year boundary
+    ("monthly", "11/20/2021 09:00", "01/03/2022 09:00", RESET),
+    ("weekly", "01/09/2022 09:00", "01/10/2022 09:00", CONTINUED),  # Sunday, then the next Monday
+    ("weekly", "01/10/2022 09:00", "01/16/2022 21:00", ALREADY_COMPLETED),  # Monday and Sunday of one week
+    ("weekly", "01/09/2022 09:00", "01/17/2022 09:00", RESET),  # a whole calendar week skipped
+])
+def test_streaks_follow_calendar_periods(open_database, periodicity, first, second, outcome):
+    period_db = open_database("test_periods.db")
+    add_habit(period_db, "cleaning", periodicity, "household", from_text("01/01/2021 08:00"), 0)
+    mark_completed_many(period_db, [("cleaning", from_text(first))])
+    assert mark_completed_many(period_db, [("cleaning", from_text(second))])[0][1] == outcome
+    assert habit_completed_in_period(period_db, "cleaning", from_text(second))
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from db import connect_database, habit_exists
+from migrations import SCHEMA_VERSION, migrate, schema_version
+from timestamps import from_text
+
+
+def test_new_database_is_current(database_path):
+    db = connect_database(database_path)
+    assert schema_version(db) == SCHEMA_VERSION
+    db.close()
+
+
+def test_legacy_database_is_upgraded(database_path):
+    # A database created before migrations existed: tables present, user_version still 0
+    legacy = sqlite3.connect(database_path)
+    legacy.execute("CREATE TABLE habit_tracker (habit TEXT PRIMARY KEY, periodicity TEXT, category TEXT, "
+                   "creation_time TEXT, streak INT, completion_time TEXT)")
+    legacy.execute("CREATE TABLE habit_log (habit TEXT, completed BOOL, streak INT DEFAULT 0, completion_time TIME)")
+    legacy.execute("INSERT INTO habit_tracker VALUES ('coding', 'daily', 'career', '01/01/2022 13:00', 0, NULL)")
+    legacy.execute("INSERT INTO habit_log VALUES ('coding', 0, 0, '01/01/2022 13:00')")
+    legacy.commit()
+    legacy.close()
+
+    db = connect_database(database_path)
+    assert schema_version(db) == SCHEMA_VERSION
+    assert habit_exists(db, "coding")
+    assert db.execute("SELECT creation_time, completion_time FROM habit_tracker").fetchone() == \
+        (from_text("01/01/2022 13:00"), None)
+    assert db.execute("SELECT completion_time FROM habit_log").fetchone() == (from_text("01/01/2022 13:00"),)
+    db.close()
+
+
+def test_current_database_runs_no_ddl(database_path):
+    connect_database(database_path).close()
+    db = sqlite3.connect(database_path)
+    statements = []
+    db.set_trace_callback(statements.append)
+    migrate(db)
+    assert statements == ["PRAGMA user_version"]
+    db.close()
+
+
+def test_failed_migration_rolls_back(database_path, monkeypatch):
+    def broken(db):
+        db.execute("CREATE TABLE half_applied (x)")
+        raise RuntimeError("migration failed")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [broken])
+    monkeypatch.setattr(migrations, "SCHEMA_VERSION", SCHEMA_VERSION + 1)
+    db = sqlite3.connect(database_path)
+    with pytest.raises(RuntimeError):
+        migrate(db)
+    assert schema_version(db) == 0
+    assert db.execute("SELECT name FROM sqlite_master WHERE name = 'half_applied'").fetchone() is None
+    db.close()
+
+
+def test_rollups_are_filled_from_existing_log(database_path):
+    legacy = sqlite3.connect(database_path)
+    legacy.execute("CREATE TABLE habit_tracker (habit TEXT PRIMARY KEY, periodicity TEXT, category TEXT, "
+                   "creation_time TEXT, streak INT, completion_time TEXT)")
+    legacy.execute("CREATE TABLE habit_log (habit TEXT, completed BOOL, streak INT DEFAULT 0, completion_time TIME)")
+    legacy.execute("INSERT INTO habit_tracker VALUES ('coding', 'daily', 'career', '01/01/2022 13:00', 2, NULL)")
+    legacy.executemany("INSERT INTO habit_log VALUES ('coding', ?, ?, ?)",
+                       [(0, 0, "01/01/2022 13:00"), (1, 1, "01/01/2022 14:00"), (1, 2, "01/02/2022 14:00")])
+    legacy.commit()
+    legacy.close()
+
+    db = connect_database(database_path)
+    assert db.execute("SELECT bucket, SUM(completions) FROM habit_rollup GROUP BY bucket ORDER BY bucket").fetchall() \
+        == [("daily", 2), ("monthly", 2), ("weekly", 2)]
+    assert db.execute("SELECT COUNT(*), SUM(completions) FROM category_rollup WHERE bucket = 'daily'").fetchone() \
+        == (2, 2)
+    db.close()
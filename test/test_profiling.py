@@ -0,0 +1,56 @@
+import pytest
+
+import analytics
+import db
+import profiling
+from habit import Habit
+from timestamps import from_text
+
+
+@pytest.fixture
+def profiled(tmp_path):
+    profiling.reset()
+    profiling.enable()
+    yield str(tmp_path / "test_profiling.db")
+    profiling.disable()
+    profiling.reset()
+    db.close_all_connections()
+
+
+def test_statements_are_attributed_to_operations(profiled, capsys):
+    Habit("reading", "daily", "knowledge", database=profiled).add()
+    habit = Habit("reading", database=profiled)
+    habit.current_time = from_text("01/01/2022 12:00")
+    habit.mark_as_completed()
+    habit.mark_as_completed()
+    analytics.show_habit_streak_data(database=profiled)
+
+    report = profiling.report()
+    completed = report["Habit.mark_as_completed"]
+    assert completed["calls"] == 2
+    assert completed["statements"] == sum(query["count"] for query in completed["queries"])
+    state_query = next(query for query in completed["queries"] if query["sql"].startswith("SELECT periodicity"))
+    assert state_query["count"] == 2 and state_query["rows"] == 2
+    assert report["analytics.show_habit_streak_data"]["rows"] == 1
+    assert report["Habit.add"]["calls"] == 1
+    summary = profiling.format_report()
+    assert "Habit.mark_as_completed" in summary and "analytics.show_habit_streak_data" in summary
+
+
+def test_nested_operations_count_once(profiled):
+    conn = db.get_connection(profiled)
+    outer = profiling.operation("outer")(lambda: inner())
+    inner = profiling.operation("inner")(lambda: conn.execute("SELECT 1").fetchall())
+    outer()
+    report = profiling.report()
+    assert "inner" not in report
+    assert report["outer"]["statements"] == 1 and report["outer"]["rows"] == 1
+
+
+def test_disabled_profiling_records_nothing(tmp_path):
+    profiling.reset()
+    conn = db.connect_database(str(tmp_path / "test_plain.db"))
+    assert type(conn) is db.HabitConnection
+    profiling.operation("plain")(lambda: conn.execute("SELECT 1").fetchall())()
+    conn.close()
+    assert profiling.report() == {}
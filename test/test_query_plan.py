@@ -0,0 +1,119 @@
+"""
+Query plan regression tests: every SQL statement in db.py and analytics.py must use an index.
+
+Statements are collected from the module sources, so new queries are checked automatically.
+The statements that read a whole table by design are listed in FULL_SCANS, with the reason;
+scans of table-valued functions such as json_each() that expand a parameter and of VALUES rows
+are not table scans and are allowed everywhere. SQL templates filled with str.format() are
+checked with the defaults in TEMPLATE_FIELDS.
+"""
+
+import ast
+import os
+import re
+
+import pytest
+
+from db import connect_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["db.py", "analytics.py"]
+SQL = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b")
+
+# Placeholder of an SQL template -> value it is checked with (the function's default)
+TEMPLATE_FIELDS = {"{log}": "habit_log"}
+
+# Statements (whitespace collapsed) that scan a whole table on purpose -> reason
+FULL_SCANS = {
+    "SELECT DISTINCT category FROM habit_tracker":
+        "lists every category (answered from the category index)",
+    "SELECT habit FROM habit_tracker":
+        "lists every habit (answered from the primary key index)",
+    "SELECT * FROM habit_tracker":
+        "analytics listing of every habit",
+    "SELECT habit_tracker.habit, periodicity, completion_time, streak, COALESCE(longest_streak, 0) AS "
+    "longest_streak, COALESCE(completion_count, 0) AS completion_count, completed_period FROM habit_tracker "
+    "LEFT JOIN habit_stats ON habit_stats.habit = habit_tracker.habit":
+        "streak overview of every habit, joined through the habit_stats primary key",
+    "INSERT INTO habit_rollup WITH days AS MATERIALIZED ( SELECT habit, day_ordinal, week_ordinal, month_ordinal, "
+    "SUM(streak > 0) AS completions FROM habit_log GROUP BY habit, day_ordinal HAVING completions > 0) "
+    "SELECT habit, 'daily', day_ordinal, completions FROM days UNION ALL SELECT habit, 'weekly', week_ordinal, "
+    "SUM(completions) FROM days GROUP BY habit, week_ordinal UNION ALL SELECT habit, 'monthly', month_ordinal, "
+    "SUM(completions) FROM days GROUP BY habit, month_ordinal":
+        "fill_rollups() computes the habit rollups from the whole log",
+    "INSERT INTO category_rollup SELECT habit_tracker.category, habit_rollup.bucket, habit_rollup.period, "
+    "SUM(habit_rollup.completions) FROM habit_rollup JOIN habit_tracker ON habit_tracker.habit = habit_rollup.habit "
+    "AND habit_tracker.category IS NOT NULL GROUP BY habit_tracker.category, habit_rollup.bucket, habit_rollup.period":
+        "fill_rollups() computes the category rollups from every habit rollup",
+}
+
+# Plan steps that scan no table
+NON_TABLE_SCANS = ("VIRTUAL TABLE", "CONSTANT ROW")
+
+
+def collect_statements(module):
+    """
+    Returns (line number, SQL text) for every SQL string literal in the module, plus any
+    f-string that looks like SQL (those cannot be checked and are reported as failures).
+    """
+    with open(os.path.join(ROOT, module)) as source:
+        tree = ast.parse(source.read())
+    statements, dynamic = [], []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and SQL.match(node.value):
+            sql = node.value
+            for field, default in TEMPLATE_FIELDS.items():
+                sql = sql.replace(field, default)
+            statements.append((node.lineno, sql))
+        elif isinstance(node, ast.JoinedStr):
+            head = node.values[0] if node.values else None
+            if isinstance(head, ast.Constant) and SQL.match(str(head.value)):
+                dynamic.append(node.lineno)
+    return statements, dynamic
+
+
+STATEMENTS = [(module, line, sql) for module in MODULES for line, sql in collect_statements(module)[0]]
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    db = connect_database(str(tmp_path_factory.mktemp("plan") / "test_query_plan.db"))
+    yield db
+    db.close()
+
+
+def query_plan(db, sql):
+    parameters = (None,) * sql.count("?")
+    return [row[3] for row in db.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+
+
+def normalized(sql):
+    return " ".join(sql.split())
+
+
+def table_scans(db, sql):
+    return [step for step in query_plan(db, sql)
+            if step.startswith("SCAN ") and not any(kind in step for kind in NON_TABLE_SCANS)]
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_no_dynamic_sql(module):
+    assert collect_statements(module)[1] == [], "SQL built with f-strings cannot be plan-checked"
+
+
+def test_statements_were_collected():
+    assert len(STATEMENTS) > 10
+
+
+@pytest.mark.parametrize("sql", FULL_SCANS)
+def test_full_scans_are_still_needed(db, sql):
+    assert sql in {normalized(statement) for _, _, statement in STATEMENTS}, "no such statement anymore"
+    assert table_scans(db, sql) != [], "the statement uses an index now"
+
+
+@pytest.mark.parametrize("module,line,sql", STATEMENTS, ids=[f"{m}:{line}" for m, line, _ in STATEMENTS])
+def test_queries_use_an_index(db, module, line, sql):
+    if normalized(sql) in FULL_SCANS:
+        return
+    scans = table_scans(db, sql)
+    assert scans == [], f"{module}:{line} falls back to a full scan: {scans}"
@@ -0,0 +1,58 @@
+import tracemalloc
+
+import analytics
+from db import add_habit, add_habits_many, close_connection, fetch_habit
+from habit import Habit
+from records import HabitRecord, LogEntry, row_factory
+
+
+def populate(db):
+    add_habit(db, "coding", "daily", "career", 100, 3, 200)
+
+
+def test_records_read_columns_by_name(db):
+    cur = db.cursor()
+    cur.row_factory = row_factory(HabitRecord)
+    reordered = cur.execute("SELECT completion_time, streak, habit, 'extra' AS note, category FROM habit_tracker")
+    record = reordered.fetchone()
+    assert (record.habit, record.category, record.streak, record.completion_time) == ("coding", "career", 3, 200)
+    assert record.periodicity is None and record.creation_time is None
+    assert not hasattr(record, "__dict__")
+
+
+def test_records_still_behave_like_tuples():
+    entry = LogEntry("coding", 1, 2, 300)
+    assert entry == ("coding", 1, 2, 300) and entry[2] == 2 and entry[1:3] == (1, 2)
+    name, completed, streak, time = entry
+    assert len(entry) == 4 and streak == 2
+    assert entry.as_dict() == {"habit": "coding", "completed": True, "streak": 2, "completion_time": 300}
+    assert repr(entry) == "LogEntry(habit='coding', completed=1, streak=2, completion_time=300)"
+
+
+def test_analytics_return_records(db):
+    [habit] = analytics.data_of_all_habits(db)
+    assert isinstance(habit, HabitRecord) and habit.streak == 3
+    assert analytics.data_of_single_habit(db, "coding") == [habit]
+    assert analytics.habit_streak_overview(db)[0].longest_streak == 0
+    assert fetch_habit(db, "coding") == habit and fetch_habit(db, "gym") is None
+
+
+def test_habit_load(db):
+    habit = Habit.load("coding", database=db.path)
+    assert (habit.periodicity, habit.category, habit.streak) == ("daily", "career", 3)
+    assert Habit.load("gym", database=db.path) is None
+    close_connection(db.path)
+
+
+def test_lazy_listing_uses_less_memory(db):
+    add_habits_many(db, [(f"habit{number:06d}", "daily", "bulk", 100, 0, None) for number in range(20000)])
+    tracemalloc.start()
+    rows = db.execute("SELECT * FROM habit_tracker").fetchall()
+    materialized = tracemalloc.get_traced_memory()[1]
+    del rows
+    tracemalloc.reset_peak()
+    count = sum(1 for _ in analytics.iter_habits(db))
+    lazy = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert count == 20001
+    assert lazy * 10 < materialized
@@ -0,0 +1,107 @@
+import pytest
+
+import habit
+from db import delete_category, update_logs_many
+from reports import broken_streaks, category_streaks, completion_rates, completion_series, completions_per_periodicity
+from retention import rebuild_rollups
+from timestamps import from_text
+
+
+def populate(db):
+    start = from_text("01/01/2022 08:00")
+    habit.add_habit(db, "coding", "daily", "career", start)
+    habit.add_habit(db, "reading", "daily", "knowledge", start)
+    habit.add_habit(db, "hiking", "weekly", "fun", start)
+    # coding: days 1-3 and 6-7 (one broken streak); reading: days 1-2; hiking: weeks 1 and 3
+    for day in (1, 2, 3, 6, 7):
+        habit.complete_habit(db, "coding", from_text(f"01/{day:02}/2022 09:00"))
+    for day in (1, 2):
+        habit.complete_habit(db, "reading", from_text(f"01/{day:02}/2022 09:00"))
+    for day in (4, 18):
+        habit.complete_habit(db, "hiking", from_text(f"01/{day:02}/2022 09:00"))
+
+
+def test_completion_rates(db):
+    rows = {row["habit"]: row for row in completion_rates(db, from_text("01/01/2022 00:00"),
+                                                          from_text("01/11/2022 00:00"))}
+    assert (rows["coding"]["completed_periods"], rows["coding"]["expected_periods"]) == (5, 10)
+    assert rows["coding"]["completion_rate"] == 0.5
+    assert rows["reading"]["completion_rate"] == 0.2
+    # 2022-01-01 is a Saturday: the window covers parts of weeks 52, 1 and 2, hiking is done once
+    assert (rows["hiking"]["completed_periods"], rows["hiking"]["expected_periods"]) == (1, 3)
+
+
+def test_completion_rates_start_at_creation(db):
+    habit.add_habit(db, "gym", "daily", "health", from_text("01/09/2022 08:00"))
+    habit.complete_habit(db, "gym", from_text("01/10/2022 09:00"))
+    row = [row for row in completion_rates(db, end=from_text("01/11/2022 00:00")) if row["habit"] == "gym"][0]
+    assert (row["completed_periods"], row["expected_periods"], row["completion_rate"]) == (1, 2, 0.5)
+
+
+def test_broken_streaks(db):
+    rows = broken_streaks(db)
+    assert [(row["habit"], row["broken_streaks"], row["longest_gap"]) for row in rows] == \
+        [("coding", 1, 2), ("hiking", 1, 1), ("reading", 0, 0)]
+    rows = broken_streaks(db, end=from_text("01/05/2022 00:00"))
+    assert {row["habit"]: row["completed_periods"] for row in rows} == {"coding": 3, "hiking": 1, "reading": 2}
+
+
+def test_category_streaks(db):
+    habit.add_habit(db, "writing", "daily", "career", from_text("01/01/2022 08:00"))
+    habit.complete_habit(db, "writing", from_text("01/05/2022 09:00"))
+    rows = {row["category"]: row for row in category_streaks(db)}
+    # career: coding runs of 3 and 2, writing a run of 1
+    assert rows["career"] == {"category": "career", "habits": 2, "streaks": 3, "average_streak": 2.0,
+                              "longest_streak": 3}
+    assert (rows["knowledge"]["streaks"], rows["knowledge"]["longest_streak"]) == (1, 2)
+    assert (rows["fun"]["streaks"], rows["fun"]["longest_streak"]) == (2, 1)
+
+
+def test_completions_per_periodicity(db):
+    habit.add_habit(db, "painting", "monthly", "fun", from_text("01/01/2022 08:00"))
+    assert completions_per_periodicity(db) == [
+        {"periodicity": "daily", "habits": 2, "completions": 7, "completions_per_habit": 3.5},
+        {"periodicity": "monthly", "habits": 1, "completions": 0, "completions_per_habit": 0.0},
+        {"periodicity": "weekly", "habits": 1, "completions": 2, "completions_per_habit": 2.0},
+    ]
+    rows = completions_per_periodicity(db, start=from_text("01/03/2022 00:00"))
+    assert rows[0]["completions"] == 3
+
+
+def rollups(db):
+    return (db.execute("SELECT * FROM habit_rollup ORDER BY 1, 2, 3").fetchall(),
+            db.execute("SELECT * FROM category_rollup ORDER BY 1, 2, 3").fetchall())
+
+
+def test_completion_series(db):
+    assert completion_series(db, "daily", habit="coding") == [
+        {"period": f"2022-01-0{day}", "completions": 1} for day in (1, 2, 3, 6, 7)]
+    # 2022-01-01/02 fall in the week of 2021-12-27
+    assert completion_series(db, "weekly", category="career") == [
+        {"period": "2021-12-27", "completions": 2}, {"period": "2022-01-03", "completions": 3}]
+    assert completion_series(db, "monthly") == [{"period": "2022-01-01", "completions": 9}]
+    assert completion_series(db, "daily", from_text("01/02/2022 23:00"), from_text("01/04/2022 00:00")) == [
+        {"period": "2022-01-02", "completions": 2}, {"period": "2022-01-03", "completions": 1},
+        {"period": "2022-01-04", "completions": 1}]
+    with pytest.raises(ValueError):
+        completion_series(db, "hourly")
+
+
+def test_rollups_follow_the_log(db):
+    maintained = rollups(db)
+    rebuild_rollups(db)
+    assert rollups(db) == maintained
+
+    # A completion after a missed period restarts the streak and is logged as completed=0, streak=1
+    update_logs_many(db, [("reading", True, 3, from_text("01/03/2022 09:00")),
+                          ("reading", False, 1, from_text("01/05/2022 09:00"))])
+    assert completion_series(db, "monthly", category="knowledge") == [{"period": "2022-01-01", "completions": 4}]
+
+    habit.remove_habit(db, "coding")
+    assert completion_series(db, "daily", habit="coding") == []
+    assert completion_series(db, "monthly", category="career") == []
+    delete_category(db, "fun")
+    assert completion_series(db, "monthly") == [{"period": "2022-01-01", "completions": 4}]
+    maintained = rollups(db)
+    rebuild_rollups(db)
+    assert rollups(db) == maintained
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+import habit
+import reports
+import retention
+from analytics import habit_log, habit_streak_overview, longest_habit_streak
+from db import connect_database
+from reports import completion_series
+from timestamps import from_text
+
+NOW = from_text("01/01/2024 12:00")
+
+
+def populate(db):
+    habit.add_habit(db, "coding", "daily", "career", from_text("01/01/2022 08:00"))
+    # Two years of daily completions with one missed day, so the longest streak is in the old part
+    for day in range(730):
+        if day != 400:
+            habit.complete_habit(db, "coding", from_text("01/01/2022 09:00") + day * 86400)
+
+
+def snapshot(db):
+    return (longest_habit_streak(db, "coding"), habit_streak_overview(db),
+            completion_series(db, "monthly", habit="coding"), completion_series(db, "weekly", category="career"))
+
+
+def test_archive_preserves_statistics(db):
+    before, log = snapshot(db), habit_log(db, "coding")
+    result = retention.archive_logs(db, horizon_days=180, now=NOW, batch_size=100)
+    assert result["done"] and result["batches"] == 6 and result["freed_pages"] > 0
+
+    cutoff = from_text("07/05/2023 12:00")
+    assert all(entry.completion_time >= cutoff for entry in habit_log(db, "coding"))
+    assert result["archived"] + len(habit_log(db, "coding")) == len(log)
+    assert retention.archived_log(db, "coding") + habit_log(db, "coding") == log
+    assert snapshot(db) == before
+
+    retention.rebuild_rollups(db)
+    assert snapshot(db) == before
+    assert retention.archive_logs(db, horizon_days=180, now=NOW)["archived"] == 0
+
+
+def test_reports_and_streak_check_are_unchanged(db):
+    pytest.importorskip("numpy")
+    from streaks import check_stored_streaks, compute_streaks
+
+    habit.add_habit(db, "hiking", "weekly", "fun", from_text("01/01/2022 08:00"))
+    for week in (0, 1, 3, 90, 91):
+        habit.complete_habit(db, "hiking", from_text("01/03/2022 09:00") + week * 7 * 86400)
+
+    def figures():
+        return ([function(db) for function in reports.REPORTS.values()],
+                reports.completion_rates(db, from_text("01/01/2022 00:00"), NOW),
+                compute_streaks(db, now=NOW), check_stored_streaks(db))
+
+    before = figures()
+    assert before[-1] == []
+    retention.archive_logs(db, horizon_days=180, now=NOW)
+    assert figures() == before
+
+
+def test_rebuild_skips_archived_entries_of_an_old_log(db):
+    retention.archive_logs(db, horizon_days=180, now=NOW)
+    habit.change_periodicity(db, "coding", "weekly", NOW)
+    habit.complete_habit(db, "coding", NOW + 86400)
+    maintained = completion_series(db, "daily", habit="coding"), completion_series(db, "monthly")
+    assert retention.archived_log(db, "coding") == []
+
+    retention.rebuild_rollups(db)
+    assert (completion_series(db, "daily", habit="coding"), completion_series(db, "monthly")) == maintained
+
+
+def test_interrupted_batch_is_counted_once(db):
+    retention.archive_logs(db, horizon_days=180, now=NOW)
+    archived = retention.archived_log(db, "coding")
+    before = snapshot(db)
+    # A crash after the archive committed but before the main database did leaves a batch in both
+    db.executemany("INSERT INTO habit_log (habit, completed, streak, completion_time, day_ordinal, week_ordinal, "
+                   "month_ordinal) SELECT ?, ?, ?, ?, period_ordinal('daily', ?), period_ordinal('weekly', ?), "
+                   "period_ordinal('monthly', ?)",
+                   [(entry.habit, entry.completed, entry.streak, *[entry.completion_time] * 4)
+                    for entry in archived[:150]])
+    db.commit()
+    assert retention.archived_log(db, "coding") == archived[150:]
+    retention.rebuild_rollups(db)
+    assert snapshot(db) == before
+
+    assert retention.archive_logs(db, horizon_days=180, now=NOW)["archived"] == 150
+    assert retention.archived_log(db, "coding") == archived
+    retention.rebuild_rollups(db)
+    assert snapshot(db) == before
+
+
+def test_archive_runs_in_bounded_batches(db):
+    old = sum(entry.completion_time < from_text("07/05/2023 12:00") for entry in habit_log(db, "coding"))
+    result = retention.archive_logs(db, horizon_days=180, now=NOW, batch_size=100, max_batches=2)
+    assert (result["archived"], result["batches"], result["done"]) == (200, 2, False)
+    assert retention.archive_logs(db, horizon_days=180, now=NOW, batch_size=100)["archived"] == old - 200
+    assert os.path.exists(retention.archive_path(db.path))
+
+
+def test_horizon_has_a_minimum(db):
+    with pytest.raises(ValueError):
+        retention.archive_logs(db, horizon_days=retention.MIN_HORIZON_DAYS - 1)
+
+
+def test_compact_converts_older_databases(tmp_path):
+    path = str(tmp_path / "test_compact.db")
+    db = connect_database(path)
+    db.execute("PRAGMA auto_vacuum = NONE")
+    db.execute("VACUUM")
+    assert db.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    retention.compact(db)
+    assert db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    db.close()
+
+
+def test_archive_path():
+    assert retention.archive_path(os.path.join("data", "main.db")) == os.path.join("data", "archive", "main.db")
+    assert retention.archive_path("habits.db") == os.path.join("archive", "habits.db")
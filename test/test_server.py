@@ -0,0 +1,132 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+import loadgen
+from server import CompletionBatcher, HabitServer
+from db import add_habit, connect_database
+from timestamps import from_text
+
+
+@pytest.fixture
+def service(tmp_path):
+    server = HabitServer(("127.0.0.1", 0), str(tmp_path / "test_server.db"), pool_size=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def request(server, method, path, body=None):
+    conn = http.client.HTTPConnection(*server.server_address[:2])
+    conn.request(method, path, body=None if body is None else json.dumps(body))
+    response = conn.getresponse()
+    result = response.status, json.loads(response.read())
+    conn.close()
+    return result
+
+
+def test_endpoints(service):
+    day = from_text("01/01/2022 12:00")
+    assert request(service, "POST", "/habits", {"habit": "reading", "periodicity": "daily",
+                                                "category": "knowledge", "time": day})[0] == 201
+    assert request(service, "POST", "/habits", {"habit": "reading", "periodicity": "daily",
+                                                "category": "knowledge"})[0] == 409
+    assert request(service, "POST", "/habits", {"habit": "reading", "periodicity": "hourly",
+                                                "category": "knowledge"})[0] == 400
+    status, body = request(service, "GET", "/habits?periodicity=daily")
+    assert status == 200 and [row["habit"] for row in body] == ["reading"]
+
+    status, body = request(service, "POST", "/habits/reading/completions", {"time": day + 3600})
+    assert body == {"habit": "reading", "outcome": "continued", "streak": 1}
+    status, body = request(service, "POST", "/completions", [{"habit": "reading", "time": day + 86400},
+                                                             {"habit": "gym", "time": day}])
+    assert [result["streak"] for result in body] == [2, None]
+    assert request(service, "POST", "/habits/gym/completions", {})[0] == 404
+
+    status, body = request(service, "GET", "/streaks?habit=reading")
+    assert body[0]["streak"] == body[0]["longest_streak"] == 2
+    status, body = request(service, "GET", f"/habits/reading/log?start={day + 1}")
+    assert [entry["streak"] for entry in body] == [1, 2]
+
+    assert request(service, "PATCH", "/habits/reading", {"periodicity": "weekly"})[0] == 200
+    assert request(service, "DELETE", "/habits/reading")[0] == 200
+    assert request(service, "DELETE", "/habits/reading")[0] == 404
+    assert request(service, "GET", "/nothing")[0] == 404
+
+
+def test_connections_persist(service):
+    conn = http.client.HTTPConnection(*service.server_address[:2])
+    for _ in range(3):
+        conn.request("GET", "/habits")
+        response = conn.getresponse()
+        assert response.status == 200 and json.loads(response.read()) == []
+    conn.close()
+
+
+def test_concurrent_completions_share_commits(tmp_path):
+    path = str(tmp_path / "test_batch.db")
+    setup_db = connect_database(path)
+    names = [f"habit{number}" for number in range(20)]
+    for name in names:
+        add_habit(setup_db, name, "daily", "test", 0, 0)
+    setup_db.close()
+
+    batcher = CompletionBatcher(path, max_delay=0.05)
+    results = {}
+    threads = [threading.Thread(target=lambda name=name: results.update(
+        {name: batcher.submit([(name, from_text("01/01/2022 12:00"))])})) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+    assert all(results[name] == [(name, "continued", 1)] for name in names)
+    assert batcher.commits < len(names)
+
+
+def test_failing_completion_only_fails_its_request(tmp_path):
+    path = str(tmp_path / "test_batch.db")
+    setup_db = connect_database(path)
+    add_habit(setup_db, "reading", "daily", "knowledge", 0, 0)
+    setup_db.close()
+
+    batcher = CompletionBatcher(path, max_delay=0.2)
+    outcomes = {}
+
+    def submit(key, time):
+        try:
+            outcomes[key] = batcher.submit([("reading", time)])
+        except Exception as error:
+            outcomes[key] = error
+
+    threads = [threading.Thread(target=submit, args=("good", from_text("01/01/2022 12:00"))),
+               threading.Thread(target=submit, args=("bad", "tomorrow"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+    assert outcomes["good"] == [("reading", "continued", 1)]
+    assert isinstance(outcomes["bad"], Exception)
+
+
+def test_loadgen_reports_latency(service):
+    report = loadgen.run_load(service.url, clients=3, requests=20)
+    assert report["requests"] == 60 and report["errors"] == 0
+    assert 0 < report["p50_ms"] <= report["p99_ms"]
+    assert report["rps"] > 0
+    assert request(service, "GET", "/habits") == (200, [])
+
+    report = loadgen.run_load(service.url, clients=2, requests=20, keep=True)
+    status, body = request(service, "GET", f"/streaks?habit={report['habits'][0]}")
+    assert body[0]["streak"] == 10
+
+
+def test_percentile():
+    assert loadgen.percentile([5, 1, 3, 2, 4], 0.5) == 3
+    assert loadgen.percentile(list(range(1, 101)), 0.99) == 99
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import analytics
+import retention
+import shards
+from db import close_all_connections, fetch_habits_as_choices, get_connection
+from habit import Habit
+from timestamps import from_text
+
+
+@pytest.fixture
+def shard_dir(tmp_path):
+    directory = str(tmp_path / "shards")
+    previous = shards.SHARD_DIRECTORY
+    shards.set_shard_directory(directory)
+    yield directory
+    close_all_connections()
+    shards.set_shard_directory(previous)
+
+
+def test_every_user_gets_a_database_file(shard_dir):
+    Habit("reading", "daily", "knowledge", user="alice").add()
+    Habit("running", "weekly", "health", user="bob").add()
+    assert shards.users() == ["alice", "bob"]
+    assert os.path.isfile(os.path.join(shard_dir, "alice.db"))
+    assert fetch_habits_as_choices(shards.connection("alice")) == ["Reading"]
+    assert fetch_habits_as_choices(shards.connection("bob")) == ["Running"]
+
+
+def test_users_may_share_habit_names(shard_dir):
+    Habit("reading", "daily", "knowledge", user="alice").add()
+    Habit("reading", "monthly", "hobby", user="bob").add()
+    Habit("reading", user="alice").mark_as_completed()
+    alice, bob = shards.connection("alice"), shards.connection("bob")
+    assert alice.execute("SELECT periodicity, streak FROM habit_tracker").fetchall() == [("daily", 1)]
+    assert bob.execute("SELECT periodicity, streak FROM habit_tracker").fetchall() == [("monthly", 0)]
+
+
+def test_analytics_only_show_the_users_habits(shard_dir, capsys):
+    Habit("reading", "daily", "knowledge", user="alice").add()
+    Habit("running", "weekly", "health", user="bob").add()
+    capsys.readouterr()
+    analytics.show_habits_data(user="alice")
+    output = capsys.readouterr().out
+    assert "Reading" in output and "Running" not in output
+    analytics.show_habit_streak_data(user="bob")
+    output = capsys.readouterr().out
+    assert "Running" in output and "Reading" not in output
+
+
+def test_archives_are_not_users(shard_dir):
+    Habit("reading", "daily", "knowledge", user="alice").add()
+    Habit("reading", user="alice").mark_as_completed()
+    result = retention.archive_logs(shards.connection("alice"), now=from_text("01/01/2100 00:00"))
+    assert result["archived"] == 2
+    assert os.path.isfile(retention.archive_path(shards.shard_path("alice")))
+    assert shards.users() == ["alice"]
+
+
+def test_no_user_keeps_the_given_database(shard_dir):
+    assert shards.database_for(None, "other.db") == "other.db"
+    assert shards.database_for("carol") == os.path.join(shard_dir, "carol.db")
+    assert get_connection(shards.database_for("carol")) is shards.connection("carol")
+
+
+@pytest.mark.parametrize("user", ["", "../alice", "a/b", ".hidden", "x" * 65, None])
+def test_unsafe_user_names_are_rejected(shard_dir, user):
+    with pytest.raises(ValueError):
+        shards.shard_path(user)
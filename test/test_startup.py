@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budgets in microseconds (measured baseline: main ~4 ms, cli ~30 ms)
+IMPORT_BUDGETS = {"main": 50_000, "cli": 100_000}
+
+# Modules that only the interactive menu or optional features may pull in
+HEAVY_MODULES = ("questionary", "prompt_toolkit", "numpy", "asyncio", "http.server")
+
+
+def import_times(tmp_path, *args):
+    """
+    Runs python -X importtime in an empty directory and returns (stdout, {module: cumulative us}).
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=tmp_path, capture_output=True,
+                            text=True, env=dict(os.environ, PYTHONPATH=ROOT), check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line.split("|")
+            times[name.strip()] = int(cumulative)
+    return result.stdout, times
+
+
+@pytest.mark.parametrize("module", sorted(IMPORT_BUDGETS))
+def test_import_is_cheap_and_side_effect_free(tmp_path, module):
+    # The best of three runs, so a busy machine does not fail the test
+    runs = [import_times(tmp_path, "-c", f"import {module}") for _ in range(3)]
+    assert all(stdout == "" for stdout, _ in runs)
+    assert os.listdir(tmp_path) == []  # no database was created
+    times = runs[0][1]
+    assert not [name for name in times if name.split(".")[0] in HEAVY_MODULES or name in HEAVY_MODULES]
+    assert min(times[module] for _, times in runs) < IMPORT_BUDGETS[module]
+
+
+def test_commands_skip_the_menu_dependencies(tmp_path):
+    stdout, times = import_times(tmp_path, os.path.join(ROOT, "main.py"), "--help")
+    assert "usage: main.py" in stdout
+    assert "questionary" not in times and "get" not in times
+    assert os.listdir(tmp_path) == []
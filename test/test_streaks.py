@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from db import add_habit, update_log  # noqa: E402
+from streaks import check_stored_streaks, compute_streaks, period_numbers, streak_runs  # noqa: E402
+from timestamps import from_text, period_ordinals  # noqa: E402
+
+
+def populate(db):
+    add_habit(db, "reading", "daily", "knowledge", from_text("01/01/2022 08:00"), 1, from_text("01/09/2022 08:00"))
+    add_habit(db, "cleaning", "weekly", "household", from_text("01/01/2022 08:00"), 3, from_text("01/17/2022 08:00"))
+    add_habit(db, "hiking", "monthly", "fun", from_text("01/01/2022 08:00"), 2, from_text("01/05/2022 08:00"))
+    for day, streak in ((1, 1), (2, 2), (3, 3), (5, 1), (6, 2), (9, 1)):
+        update_log(db, "reading", True, streak, from_text(f"01/{day:02}/2022 08:00"))
+    # Monday 3rd, Sunday 9th (same ISO week), Monday 10th and Monday 17th
+    for day, streak in ((3, 1), (9, 1), (10, 2), (17, 3)):
+        update_log(db, "cleaning", True, streak, from_text(f"01/{day:02}/2022 08:00"))
+    # December 2021 and January 2022 are consecutive months across the year boundary
+    update_log(db, "hiking", True, 1, from_text("12/31/2021 08:00"))
+    update_log(db, "hiking", True, 2, from_text("01/05/2022 08:00"))
+    update_log(db, "hiking", False, 0, from_text("01/06/2022 08:00"))
+
+
+def test_streak_runs():
+    habits = np.array([0, 0, 0, 0, 1, 1])
+    periods = np.array([1, 2, 2, 4, 7, 8])
+    run_habits, firsts, lasts, lengths = streak_runs(habits, periods)
+    assert run_habits.tolist() == [0, 0, 1]
+    assert firsts.tolist() == [1, 4, 7]
+    assert lasts.tolist() == [2, 4, 8]
+    assert lengths.tolist() == [2, 1, 2]
+
+
+def test_period_numbers():
+    days = np.array([0, 4, 5, 32])  # Thursday 1970-01-01, Monday 5th, Tuesday 6th, Monday February 2nd
+    daily = period_numbers(days, np.zeros(4, dtype=int))
+    assert (daily - daily[0]).tolist() == [0, 4, 5, 32]
+    weekly = period_numbers(days, np.ones(4, dtype=int))
+    assert (weekly - weekly[0]).tolist() == [0, 1, 1, 5]
+    monthly = period_numbers(days, np.full(4, 2))
+    assert (monthly - monthly[0]).tolist() == [0, 0, 0, 1]
+
+
+@pytest.mark.parametrize("first", [date(1969, 12, 20), date(2020, 12, 20), date(2021, 12, 20), date(2024, 2, 20)])
+def test_period_numbers_match_the_stored_ordinals(first):
+    # Three weeks around a year (or leap day) boundary, covering the week and month changes
+    dates = [first + timedelta(days=offset) for offset in range(21)]
+    days = np.array([(day - date(1970, 1, 1)).days for day in dates])
+    times = [from_text(day.strftime("%m/%d/%Y 12:00")) for day in dates]
+    for code in range(3):
+        assert period_numbers(days, np.full(len(days), code)).tolist() == \
+            [period_ordinals(time)[code] for time in times]
+
+
+def test_compute_streaks(db):
+    result = compute_streaks(db, now=from_text("01/10/2022 12:00"))
+    assert result["reading"]["longest"] == 3
+    assert result["reading"]["last_run"] == 1
+    assert result["reading"]["current"] == 1
+    assert [length for _, length in result["reading"]["runs"]] == [3, 2, 1]
+    assert result["cleaning"]["last_run"] == 3
+    assert result["hiking"]["longest"] == 2
+
+
+def test_current_streak_lapses(db):
+    assert compute_streaks(db, now=from_text("01/12/2022 12:00"))["reading"]["current"] == 0
+
+
+def test_check_stored_streaks(db):
+    assert check_stored_streaks(db) == []
+    db.execute("UPDATE habit_tracker SET streak = 5 WHERE habit = 'reading'")
+    assert check_stored_streaks(db) == [("reading", 5, 1)]
+
+
+def test_unknown_periodicities_are_reported(db):
+    db.execute("UPDATE habit_tracker SET periodicity = 'yearly' WHERE habit = 'hiking'")
+    assert "hiking" not in compute_streaks(db)
+    assert check_stored_streaks(db) == [("hiking", 2, None)]
@@ -0,0 +1,65 @@
+import io
+
+import pytest
+
+from db import add_habit, update_log
+from timestamps import from_text
+from transfer import chunked, export_table, import_table
+
+
+def populate(db):
+    add_habit(db, "coding", "daily", "career", from_text("01/01/2022 13:00"), 2, from_text("01/02/2022 13:00"))
+    add_habit(db, "hiking", "monthly", "fun", from_text("01/01/2022 13:00"), 0)
+    update_log(db, "coding", False, 0, from_text("01/01/2022 13:00"))
+    update_log(db, "coding", True, 1, from_text("01/01/2022 14:00"))
+    update_log(db, "coding", True, 2, from_text("01/02/2022 13:00"))
+
+
+@pytest.fixture
+def target(open_database):
+    return open_database("test_target.db")
+
+
+def test_chunked():
+    assert list(chunked(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+@pytest.mark.parametrize("file_format", ["csv", "jsonl"])
+def test_round_trip(db, target, file_format):
+    for table in ("habits", "logs"):
+        file = io.StringIO()
+        assert export_table(db, table, file, file_format, chunk_size=2) == (2 if table == "habits" else 3)
+        file.seek(0)
+        import_table(target, table, file, file_format, chunk_size=2)
+    # log_generation is a random number given to every new habit (see migrations._add_log_generations)
+    for query in ("SELECT habit, periodicity, category, creation_time, streak, completion_time, day_ordinal, "
+                  "week_ordinal, month_ordinal FROM habit_tracker ORDER BY habit",
+                  "SELECT * FROM habit_log ORDER BY rowid"):
+        assert target.execute(query).fetchall() == db.execute(query).fetchall()
+
+
+def test_logs_need_their_habits(db, target):
+    file = io.StringIO()
+    export_table(db, "logs", file, "jsonl")
+    file.seek(0)
+    with pytest.raises(ValueError, match="import the habits first"):
+        import_table(target, "logs", file, "jsonl")
+    assert target.execute("SELECT COUNT(*) FROM habit_log").fetchone()[0] == 0
+    assert target.execute("SELECT COUNT(*) FROM habit_rollup").fetchone()[0] == 0
+
+
+def test_invalid_import_is_rolled_back(target):
+    file = io.StringIO('{"habit": "coding", "periodicity": "daily", "category": "career", '
+                       '"creation_time": 1, "streak": 0, "completion_time": null}\n'
+                       '{"habit": "study"}\n')
+    with pytest.raises(ValueError):
+        import_table(target, "habits", file, "jsonl", chunk_size=1)
+    assert target.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("row", ["foo,yearly,x,1,0,", "foo,daily,x,,0,"])
+def test_habits_need_a_periodicity_and_creation_time(target, row):
+    file = io.StringIO("habit,periodicity,category,creation_time,streak,completion_time\n" + row + "\n")
+    with pytest.raises(ValueError, match="Invalid habits record 1"):
+        import_table(target, "habits", file, "csv")
+    assert target.execute("SELECT COUNT(*) FROM habit_tracker").fetchone()[0] == 0
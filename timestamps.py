@@ -0,0 +1,152 @@
+"""
+The timestamps module: Converts between stored timestamps and the times shown to the user.
+
+Times are stored as integer seconds since the epoch, which sort chronologically and can be
+compared inside SQL. They are only formatted as text (e.g., 01/31/2022 13:00) for display.
+"""
+
+from datetime import date, datetime, timedelta
+
+# Periodicities in the order of the numbers returned by period_ordinals()
+PERIODICITIES = ("daily", "weekly", "monthly")
+
+# Format used for displaying times, and the format times were stored in before migration 3
+DISPLAY_FORMAT = "%m/%d/%Y %H:%M"
+
+
+def now() -> int:
+    """
+    Returns the current local time as a timestamp.
+
+    :return: Seconds since the epoch, int
+    """
+    return int(datetime.now().timestamp())
+
+
+def from_text(text, time_format=DISPLAY_FORMAT) -> int:
+    """
+    Converts a formatted local time to a timestamp.
+
+    :param text: Time as text, e.g., 01/31/2022 13:00
+    :param time_format: Format of the text (default is DISPLAY_FORMAT)
+    :return: Seconds since the epoch, int
+    """
+    return int(datetime.strptime(text, time_format).timestamp())
+
+
+def parse(text) -> int:
+    """
+    Reads a time given on the command line: seconds since the epoch, DISPLAY_FORMAT or ISO 8601.
+
+    :param text: Time as text, e.g., 1643630400, 01/31/2022 13:00 or 2022-01-31T13:00
+    :return: Seconds since the epoch, int
+    :raises ValueError: If the text is in none of these formats
+    """
+    text = text.strip()
+    if text.lstrip("-").isdigit():
+        return int(text)
+    try:
+        return from_text(text)
+    except ValueError:
+        return int(datetime.fromisoformat(text).timestamp())
+
+
+def to_text(timestamp) -> str:
+    """
+    Formats a timestamp as local time for display.
+
+    :param timestamp: Seconds since the epoch
+    :return: Time formatted with DISPLAY_FORMAT
+    """
+    return datetime.fromtimestamp(timestamp).strftime(DISPLAY_FORMAT)
+
+
+def to_date(timestamp):
+    """
+    Returns the local calendar date of a timestamp.
+
+    :param timestamp: Seconds since the epoch
+    :return: The date of the timestamp
+    """
+    return datetime.fromtimestamp(timestamp).date()
+
+
+def days_ago(days, timestamp=None) -> int:
+    """
+    Returns the timestamp a number of days before another timestamp.
+
+    :param days: Number of days to go back
+    :param timestamp: Timestamp to count back from (default is now)
+    :return: Seconds since the epoch, int
+    """
+    start = datetime.fromtimestamp(now() if timestamp is None else timestamp)
+    return int((start - timedelta(days=days)).timestamp())
+
+
+# Day number (see period_ordinal) of 1970-01-01, for day counts since the epoch
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def week_ordinal(day_ordinal):
+    """
+    Numbers the week of a day number (see period_ordinal); also works element-wise on NumPy arrays.
+
+    :param day_ordinal: Day number, counted from 0001-01-01 (a Monday)
+    :return: The week number
+    """
+    return (day_ordinal - 1) // 7
+
+
+def month_ordinal(year, month):
+    """
+    Numbers a month (see period_ordinal); also works element-wise on NumPy arrays.
+
+    :param year: Year
+    :param month: Month of the year, 1 to 12
+    :return: The month number
+    """
+    return year * 12 + month - 1
+
+
+def period_ordinals(timestamp):
+    """
+    Returns the day, week and month numbers of a timestamp (see period_ordinal).
+
+    :param timestamp: Seconds since the epoch, or None
+    :return: Tuple of (day, week, month) numbers, or (None, None, None) if no timestamp is given
+    """
+    if timestamp is None:
+        return None, None, None
+    date = to_date(timestamp)
+    return date.toordinal(), week_ordinal(date.toordinal()), month_ordinal(date.year, date.month)
+
+
+def period_ordinal(periodicity, timestamp):
+    """
+    Numbers the day, week or month a timestamp falls in, so consecutive periods differ by 1.
+
+    Days are counted from 0001-01-01, weeks start on Monday as in ISO 8601, and months are
+    counted from January of year 0, so the numbers stay consecutive across year boundaries.
+
+    :param periodicity: Periodicity of the habit (e.g., daily, weekly, or monthly)
+    :param timestamp: Seconds since the epoch, or None
+    :return: The period number, int, or None if no timestamp or an unknown periodicity is given
+    """
+    if periodicity not in PERIODICITIES:
+        return None
+    return period_ordinals(timestamp)[PERIODICITIES.index(periodicity)]
+
+
+def period_start(periodicity, ordinal):
+    """
+    Returns the first day of a period numbered by period_ordinal().
+
+    :param periodicity: Periodicity the period was numbered for (e.g., daily, weekly, or monthly)
+    :param ordinal: The period number, int
+    :return: The first day of the period, datetime.date
+    """
+    if periodicity == "daily":
+        return date.fromordinal(ordinal)
+    if periodicity == "weekly":
+        return date.fromordinal(ordinal * 7 + 1)
+    return date(ordinal // 12, ordinal % 12 + 1, 1)
@@ -0,0 +1,176 @@
+"""
+The transfer module: Streams habits and logs in and out of the database as CSV or JSONL.
+
+Both directions work in fixed-size chunks: exports page through a cursor with fetchmany(),
+imports read the file lazily and write every chunk with a single executemany. Memory use
+therefore depends on the chunk size, not on the size of the file or table.
+"""
+
+import csv
+import json
+from itertools import islice
+
+import db
+import timestamps
+
+CHUNK_SIZE = 1000
+FORMATS = ("csv", "jsonl")
+
+
+def _int_or_none(value):
+    return None if value in ("", None) else int(value)
+
+
+def _to_bool(value):
+    return value.lower() in ("1", "true") if isinstance(value, str) else bool(value)
+
+
+def _periodicity(value):
+    if value not in timestamps.PERIODICITIES:
+        raise ValueError(f"unknown periodicity {value!r}")
+    return value
+
+
+# Columns and column converters of each table that can be transferred
+COLUMNS = {
+    "habits": (("habit", str), ("periodicity", _periodicity), ("category", str),
+               ("creation_time", int), ("streak", int), ("completion_time", _int_or_none)),
+    "logs": (("habit", str), ("completed", _to_bool), ("streak", int), ("completion_time", _int_or_none)),
+}
+TABLES = tuple(COLUMNS)
+
+EXPORT_QUERIES = {
+    "habits": "SELECT habit, periodicity, category, creation_time, streak, completion_time "
+              "FROM habit_tracker ORDER BY habit",
+    "logs": "SELECT habit, completed, streak, completion_time FROM habit_log ORDER BY rowid",
+}
+
+
+def chunked(rows, size=CHUNK_SIZE):
+    """
+    Groups an iterable into lists of at most size items, reading it lazily.
+
+    :param rows: Any iterable
+    :param size: Maximum number of items per chunk
+    :return: Yields lists of items
+    """
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def format_of(path, default="csv"):
+    """
+    Guesses the transfer format from a file name.
+
+    :param path: Name of the file
+    :param default: Format to use when the extension is not recognised (default csv)
+    :return: "csv" or "jsonl"
+    """
+    extension = path.rsplit(".", 1)[-1].lower()
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    return "csv" if extension == "csv" else default
+
+
+def iter_rows(conn, table, chunk_size=CHUNK_SIZE):
+    """
+    Yields every row of a table, fetching chunk_size rows from the cursor at a time.
+
+    :param conn: To maintain connection with the database
+    :param table: "habits" or "logs"
+    :param chunk_size: Number of rows fetched per round trip
+    :return: Yields row tuples
+    """
+    cur = conn.cursor()
+    cur.execute(EXPORT_QUERIES[table])
+    while rows := cur.fetchmany(chunk_size):
+        yield from rows
+
+
+def export_table(conn, table, file, file_format="csv", chunk_size=CHUNK_SIZE) -> int:
+    """
+    Writes a table to an open text file as CSV (with a header row) or JSONL.
+
+    :param conn: To maintain connection with the database
+    :param table: "habits" or "logs"
+    :param file: Text file opened for writing
+    :param file_format: "csv" or "jsonl" (default csv)
+    :param chunk_size: Number of rows fetched and written at a time
+    :return: Number of rows exported
+    """
+    names = [name for name, _ in COLUMNS[table]]
+    count = 0
+    if file_format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(names)
+        for chunk in chunked(iter_rows(conn, table, chunk_size), chunk_size):
+            writer.writerows(chunk)
+            count += len(chunk)
+    else:
+        converters = [convert for _, convert in COLUMNS[table]]
+        for chunk in chunked(iter_rows(conn, table, chunk_size), chunk_size):
+            file.writelines(json.dumps({name: None if value is None else convert(value)
+                                        for name, convert, value in zip(names, converters, row)}) + "\n"
+                            for row in chunk)
+            count += len(chunk)
+    return count
+
+
+def read_rows(table, file, file_format="csv"):
+    """
+    Lazily parses CSV or JSONL records from an open text file into row tuples.
+
+    :param table: "habits" or "logs"
+    :param file: Text file opened for reading
+    :param file_format: "csv" or "jsonl" (default csv)
+    :return: Yields row tuples in table column order
+    :raises ValueError: If a record is missing a column or has an invalid value, e.g. a habit
+        without creation_time or with a periodicity other than daily, weekly or monthly
+    """
+    if file_format == "csv":
+        records = csv.DictReader(file)
+    else:
+        records = (json.loads(line) for line in file if line.strip())
+    for number, record in enumerate(records, start=1):
+        try:
+            yield tuple(convert(record[name]) for name, convert in COLUMNS[table])
+        except (KeyError, TypeError, ValueError) as error:
+            raise ValueError(f"Invalid {table} record {number}: {error!r}") from error
+
+
+def import_table(conn, table, file, file_format="csv", chunk_size=CHUNK_SIZE) -> int:
+    """
+    Reads a CSV or JSONL file into a table, writing chunk_size rows per executemany.
+
+    The whole import is one transaction, so a failing record leaves the database unchanged.
+    Log entries are only accepted for habits that exist, since their statistics and rollups are
+    kept per habit: import the habits first.
+
+    :param conn: To maintain connection with the database
+    :param table: "habits" or "logs"
+    :param file: Text file opened for reading
+    :param file_format: "csv" or "jsonl" (default csv)
+    :param chunk_size: Number of rows written at a time
+    :return: Number of rows imported
+    :raises ValueError: If a record is invalid or a log entry belongs to an unknown habit
+    """
+    write = db.add_habits_many if table == "habits" else db.update_logs_many
+    count = 0
+    with db.transaction(conn):
+        for chunk in chunked(read_rows(table, file, file_format), chunk_size):
+            if table == "logs":
+                _check_habits_exist(conn, chunk)
+            write(conn, chunk)
+            count += len(chunk)
+    return count
+
+
+def _check_habits_exist(conn, rows):
+    """
+    Raises ValueError if log rows belong to habits that are not in the database.
+    """
+    names = {row[0] for row in rows}
+    missing = names - db.fetch_habit_states(conn, names).keys()
+    if missing:
+        raise ValueError(f"Log entries of unknown habits {sorted(missing)}: import the habits first")